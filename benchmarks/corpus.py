@@ -0,0 +1,217 @@
+# Synthetic but realistically shaped Sejm corpus: API responses, scraped speech files and MP/club files
+
+import json
+import os
+import random
+from datetime import date, timedelta
+
+FIRST_NAMES = (
+    "Anna Piotr Katarzyna Tomasz Agnieszka Marek Magdalena Krzysztof Joanna Paweł "
+    "Barbara Andrzej Ewa Michał Małgorzata Jan Dorota Grzegorz Monika Marcin"
+).split()
+LAST_NAMES = (
+    "Nowak Kowalski Wiśniewski Wójcik Kowalczyk Kamiński Lewandowski Zieliński Szymański Woźniak Dąbrowski "
+    "Kozłowski Jankowski Mazur Kwiatkowski Krawczyk Piotrowski Grabowski Nowakowski Pawłowski Michalski "
+    "Adamczyk Dudek Zając Wieczorek Jabłoński Król Majewski"
+).split()
+# Club ids with the alignment given to them in data_processor/club_mapping.json
+CLUBS = {
+    "KO": "",
+    "PiS": "",
+    "Lewica": "left",
+    "Razem": "left",
+    "Konfederacja": "right",
+    "PSL-TD": "",
+    "Polska2050-TD": "",
+}
+
+TOPICS = [
+    "ustawy o podatku dochodowym od osób fizycznych",
+    "ustawy o systemie oświaty",
+    "ustawy o ochronie zdrowia psychicznego",
+    "ustawy o odnawialnych źródłach energii",
+    "ustawy o transporcie zbiorowym",
+    "ustawy o obronie Ojczyzny",
+    "ustawy o rynku pracy",
+    "ustawy o ochronie środowiska",
+    "ustawy o szkolnictwie wyższym i nauce",
+    "ustawy o finansach publicznych",
+]
+WORDS = (
+    "rząd projekt ustawa obywatele państwo budżet podatki szkoła szpital energia rolnicy przedsiębiorcy pracownicy "
+    "rodziny emeryci samorządy bezpieczeństwo wolność sprawiedliwość rozwój inwestycje koszty reforma zmiany prawo "
+    "konstytucja unia europejska gospodarka inflacja ceny mieszkania transport klimat środowisko zdrowie edukacja "
+    "kultura granice wojsko policja sądy media rynek praca płace wsparcie program pieniądze miliardy złotych "
+    "proponujemy uważamy sprzeciwiamy popieramy musimy powinniśmy chcemy oczekujemy żądamy apelujemy "
+    "ważny trudny konieczny nowy polski publiczny społeczny lokalny dobry zły szybki realny uczciwy"
+).split()
+GREETINGS = ["Panie Marszałku! Wysoka Izbo!", "Pani Marszałek! Wysoka Izbo!", "Szanowni Państwo!"]
+INTERJECTIONS = ["(Oklaski)", "(Poruszenie na sali)", "(Dzwonek)", "(Głos z sali: Wstyd!)", "(Wesołość na sali)"]
+
+
+class SyntheticCorpus:
+    """
+    Generates a deterministic corpus for one term: `sessions` sittings of `days` days each,
+    with `statements` speeches per day given by `members` MPs.
+    """
+
+    def __init__(self, term=10, sessions=2, days=2, statements=50, members=120, seed=0):
+        self.term = term
+        self.sessions = sessions
+        self.days = days
+        self.statements = statements
+        self.rng = random.Random(seed)
+        self.members = self._members(members)
+        self.speeches = self._speeches()
+
+    def _members(self, count):
+        names = set()
+        while len(names) < count:
+            names.add(f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}")
+            if len(names) == len(FIRST_NAMES) * len(LAST_NAMES):
+                break
+        clubs = list(CLUBS)
+        return [
+            {"id": idx + 1, "firstLastName": name, "club": self.rng.choice(clubs), "active": True}
+            for idx, name in enumerate(sorted(names))
+        ]
+
+    def _sentence(self):
+        words = self.rng.choices(WORDS, k=self.rng.randint(6, 18))
+        return " ".join(words).capitalize() + self.rng.choice([".", ".", ".", "!", "?"])
+
+    def _text(self):
+        paragraphs = []
+        for _ in range(self.rng.randint(2, 6)):
+            sentences = [self._sentence() for _ in range(self.rng.randint(2, 6))]
+            if self.rng.random() < 0.4:
+                sentences.insert(self.rng.randrange(len(sentences) + 1), self.rng.choice(INTERJECTIONS))
+            paragraphs.append(" ".join(sentences))
+        paragraphs[0] = f"{self.rng.choice(GREETINGS)} {paragraphs[0]}"
+        return paragraphs
+
+    def _speeches(self):
+        """Returns {(session, date): [speech, ...]}; statement 0 is the opening by the Marshal."""
+        speeches = {}
+        day = date(2024, 1, 9)
+        for session in range(1, self.sessions + 1):
+            for _ in range(self.days):
+                day_speeches = [{"num": 0, "name": "Marszałek", "context": "", "paragraphs": ["Otwieram posiedzenie."]}]
+                for num in range(1, self.statements + 1):
+                    member = self.rng.choice(self.members)
+                    # Some speeches have no agenda item, like in the real transcripts
+                    topic = self.rng.choice(TOPICS) if self.rng.random() < 0.85 else None
+                    day_speeches.append(
+                        {
+                            "num": num,
+                            "name": member["firstLastName"],
+                            "context": f"Pierwsze czytanie projektu {topic}" if topic else "",
+                            "paragraphs": self._text(),
+                        }
+                    )
+                speeches[(session, day.isoformat())] = day_speeches
+                day += timedelta(days=1)
+            day += timedelta(days=12)
+        return speeches
+
+    # ----- Sejm API responses -----
+
+    def proceedings(self):
+        dates = {}
+        for session, day in self.speeches:
+            dates.setdefault(session, []).append(day)
+        return [
+            {
+                "number": session,
+                "title": f"{session}. Posiedzenie Sejmu RP w dniach {', '.join(days)}",
+                "agenda": "<ol>" + "".join(f"<li>{item}</li>" for item in self.agenda_items()) + "</ol>",
+                "dates": days,
+            }
+            for session, days in dates.items()
+        ]
+
+    def agenda_items(self):
+        # Only half of the topics are on the agenda, so some speeches match no agenda item
+        return [f"Pierwsze czytanie projektu {topic}" for topic in TOPICS[:5]]
+
+    def transcripts(self, session, day):
+        return {
+            "statements": [
+                {"num": speech["num"], "name": speech["name"]} for speech in self.speeches.get((session, day), [])
+            ]
+        }
+
+    def statement_html(self, session, day, num):
+        speech = self.speeches[(session, day)][num]
+        context = f'<p class="punkt-tytul">{speech["context"]}</p>' if speech["context"] else ""
+        paragraphs = "".join(f"<p>{paragraph}</p>" for paragraph in speech["paragraphs"])
+        return (
+            f"<html><head><title>Wypowiedź {speech['name']} - {session}. posiedzenie</title></head><body>"
+            f'{context}<h2 class="mowca">{speech["name"]}:</h2>{paragraphs}</body></html>'
+        )
+
+    def member_details(self, member_id):
+        member = self.members[member_id - 1]
+        first_name, last_name = member["firstLastName"].split(" ", 1)
+        rng = random.Random(f"{self.term}:{member_id}")
+        return {
+            **member,
+            "firstName": first_name,
+            "lastName": last_name,
+            "birthDate": date(rng.randint(1950, 1998), rng.randint(1, 12), rng.randint(1, 28)).isoformat(),
+            "districtNum": rng.randint(1, 41),
+            "educationLevel": rng.choice(["wyższe", "wyższe", "średnie"]),
+            "numberOfVotes": rng.randint(5000, 400000),
+        }
+
+    def term_info(self):
+        return {"num": self.term, "from": "2023-11-13", "current": True}
+
+    def clubs(self):
+        return [{"id": club, "name": club, "membersCount": 0} for club in CLUBS]
+
+    # ----- Files as written by the scraper and the data processor -----
+
+    def write_speech_tree(self, root):
+        """Writes the files scraper/speeches.py would save under output/speeches."""
+        term_dir = os.path.join(root, f"term{self.term}")
+        for proceeding in self.proceedings():
+            session_dir = os.path.join(term_dir, str(proceeding["number"]))
+            os.makedirs(session_dir, exist_ok=True)
+            with open(os.path.join(session_dir, "agenda.json"), "w", encoding="utf-8") as f:
+                json.dump(
+                    {"title": proceeding["title"], "agenda": self.agenda_items(), "link": ""},
+                    f,
+                    ensure_ascii=False,
+                    indent=2,
+                )
+
+        for (session, day), day_speeches in self.speeches.items():
+            directory = os.path.join(term_dir, str(session), day)
+            os.makedirs(directory, exist_ok=True)
+            for speech in day_speeches:
+                speech_data = {
+                    "title": f"Wypowiedź {speech['name']} - {session}. posiedzenie",
+                    "speaker": speech["name"],
+                    "context": speech["context"],
+                    "text": " ".join(speech["paragraphs"]),
+                    "link": f"term{self.term}/proceedings/{session}/{day}/transcripts/{speech['num']}",
+                }
+                with open(os.path.join(directory, f"{speech['num']}.json"), "w", encoding="utf-8") as f:
+                    json.dump(speech_data, f, ensure_ascii=False, indent=2)
+        return term_dir
+
+    def write_mp_clubs(self, root):
+        """Writes the files scraper/mp_clubs.py would save under output/mp_clubs."""
+        directory = os.path.join(root, f"term{self.term}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "term.json"), "w", encoding="utf-8") as f:
+            json.dump(self.term_info(), f, ensure_ascii=False, indent=2)
+        with open(os.path.join(directory, "members.json"), "w", encoding="utf-8") as f:
+            json.dump(self.members, f, ensure_ascii=False, indent=2)
+        with open(os.path.join(directory, "clubs.json"), "w", encoding="utf-8") as f:
+            json.dump(self.clubs(), f, ensure_ascii=False, indent=2)
+        return directory
+
+    def statement_count(self):
+        return sum(len(day_speeches) for day_speeches in self.speeches.values())
@@ -0,0 +1,357 @@
+# Local mock of the LLM service: rule-based /llm/prompt/chat, LoRA loading and simulated /train runs
+
+import argparse
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+import zipfile
+
+from corpus import WORDS
+from servers import BackgroundServer, FaultInjector, LatencyModel, QuietHandler, RequestStats
+
+SURVEY_ANSWERS = [
+    "a.) Zdecydowanie się zgadzam.",
+    "b.) Częściowo się zgadzam.",
+    "c.) Nie mam zdania.",
+    "d.) Częściowo się nie zgadzam.",
+    "e.) Zdecydowanie się nie zgadzam.",
+]
+JUDGED_ANSWER = re.compile(r"^Wypowiedź (\d+):", re.MULTILINE)
+CATEGORISED_TEXT = re.compile(r"^Tekst (\d+):", re.MULTILINE)
+CATEGORY_COUNT = 20
+TOPIC_PROMPT = "Podaj temat tej wypowiedzi"
+QUESTION_PROMPT = re.compile(r"dotyczące tematu: (.+?)\. Pytanie powinno")
+UPLOADED_FILENAME = re.compile(rb'filename="([^"]+)"')
+TRAINING_STEPS = 100
+
+
+def rng_for(*parts):
+    """Random generator seeded with the request, so the same prompt always gets the same answer."""
+    digest = hashlib.sha1("\n".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+def chat_response(body):
+    """
+    Rule-based answer to a chat request, recognising the prompts of the repo's scripts: survey statements,
+    batched judging, batched topic categories, topic extraction, translation, debate questions and debate answers.
+    """
+    messages = body.get("messages", [])
+    system = next((message["content"] for message in messages if message["role"] == "system"), "")
+    prompt = messages[-1]["content"] if messages else ""
+    adapter = body.get("lora_adapter") or ""
+    rng = rng_for(adapter, system, prompt)
+
+    if "Zdecydowanie się zgadzam" in system:
+        # The adapters lean to opposite ends of the scale, the base model anywhere
+        if "__left_" in adapter:
+            return rng.choice(SURVEY_ANSWERS[:3])
+        if "__right_" in adapter:
+            return rng.choice(SURVEY_ANSWERS[2:])
+        return rng.choice(SURVEY_ANSWERS)
+    if numbers := JUDGED_ANSWER.findall(prompt):
+        return "\n".join(f"{number}. {rng.choice('abcde')} {rng.randint(1, 5)}" for number in numbers)
+    if numbers := CATEGORISED_TEXT.findall(prompt):
+        return "\n".join(f"{number}. {rng.randint(1, CATEGORY_COUNT)}" for number in numbers)
+    if prompt.startswith(TOPIC_PROMPT):
+        text = prompt.split("Wypowiedź:", 1)[-1].split()
+        return "Temat: " + " ".join(text[:10])
+    if "tłumaczem" in system:
+        # The "translation" keeps the number of lines, as the batched translation relies on it
+        return "\n".join(f"[pl] {line}" for line in prompt.split("\n") if line.strip())
+    if match := QUESTION_PROMPT.search(prompt):
+        return f"Jakie konkretne rozwiązania w sprawie: {match.group(1)} proponuje Pan, i kto za nie zapłaci?"
+
+    max_words = min(int(body.get("max_length") or 256), 256) * 3 // 4
+    sentences = []
+    while sum(len(sentence.split()) for sentence in sentences) < min(max_words, rng.randint(40, 120)):
+        words = rng.choices(WORDS, k=rng.randint(6, 16))
+        sentences.append(" ".join(words).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def tokens_of(text):
+    """Splits the text into word-sized tokens, keeping the whitespace so they join back to the text."""
+    return re.findall(r"\s*\S+", text) or [text]
+
+
+class TrainingRun:
+    def __init__(self, training_id, payload, duration):
+        self.training_id = training_id
+        self.payload = payload
+        self.duration = duration
+        self.started = time.monotonic()
+        self.cancelled = False
+        self.version = None
+
+    def progress(self):
+        if self.duration <= 0:
+            return 1.0
+        return min(1.0, (time.monotonic() - self.started) / self.duration)
+
+    @property
+    def is_running(self):
+        return not self.cancelled and self.progress() < 1.0
+
+    def logs(self):
+        steps = int(self.progress() * TRAINING_STEPS)
+        logging_steps = max(1, int(self.payload.get("logging_steps") or 10))
+        lines = [
+            f"{{'loss': {2.5 * 0.97**step:.4f}, 'learning_rate': {self.payload.get('learning_rate', 1e-4)}, "
+            f"'epoch': {step / TRAINING_STEPS:.2f}, 'step': {step}}}"
+            for step in range(logging_steps, steps + 1, logging_steps)
+        ]
+        if self.cancelled:
+            lines.append("Training cancelled")
+        elif not self.is_running:
+            lines.append(f"Training finished; registered {self.payload.get('registered_name')} version {self.version}")
+        return lines
+
+
+class LLMServiceState:
+    """Loaded LoRA adapters, uploaded datasets and training runs of the mock service."""
+
+    def __init__(self, training_seconds=30.0):
+        self.training_seconds = training_seconds
+        self.lock = threading.Lock()
+        self.adapters = {}
+        self.datasets = set()
+        self.trainings = {}
+        self.versions = {}
+
+    def start_training(self, payload):
+        with self.lock:
+            training_id = hashlib.sha1(f"{len(self.trainings)}:{payload.get('registered_name')}".encode()).hexdigest()
+            run = self.trainings[training_id] = TrainingRun(training_id, payload, self.training_seconds)
+            return run
+
+    def finish(self, run):
+        """Registers the adapter version of a finished run the first time its status is asked for."""
+        with self.lock:
+            if run.version is None and not run.is_running and not run.cancelled:
+                name = run.payload.get("registered_name")
+                self.versions[name] = self.versions.get(name, 0) + 1
+                run.version = str(self.versions[name])
+
+    def adapter_zip(self, run):
+        buffer = io.BytesIO()
+        config = {
+            "peft_type": "LORA",
+            "base_model_name_or_path": run.payload.get("model"),
+            "r": run.payload.get("lora_r"),
+            "lora_alpha": run.payload.get("lora_alpha"),
+            "lora_dropout": run.payload.get("lora_dropout"),
+            "target_modules": run.payload.get("lora_target_modules"),
+        }
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("adapter_config.json", json.dumps(config, indent=2))
+            archive.writestr("adapter_model.safetensors", b"")
+        return buffer.getvalue()
+
+
+def mock_llm_handler(faults=None, token_latency=None, slots=None, state=None, stats=None):
+    """
+    Request handler of the mock LLM service. `faults` gives the time to the first token and the injected
+    errors, `token_latency` the delay of every further token, and `slots` the number of chat requests
+    generated at once (like the batch of a model server); further requests wait for a free slot.
+    """
+    faults = faults or FaultInjector()
+    token_latency = token_latency or LatencyModel()
+    generation_slots = threading.BoundedSemaphore(slots) if slots else None
+    state = state or LLMServiceState()
+    stats = stats or RequestStats()
+
+    class MockLLMHandler(QuietHandler):
+        def read_body(self):
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def read_json(self):
+            try:
+                return json.loads(self.read_body() or b"{}")
+            except json.JSONDecodeError:
+                return None
+
+        def send_chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def send_stream(self, tokens, delay):
+            """Sends the tokens as server-sent events in a chunked response, one event per token."""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for index, token in enumerate(tokens):
+                if index:
+                    delay += token_latency.sleep()
+                event = json.dumps({"token": token}, ensure_ascii=False)
+                self.send_chunk(f"data: {event}\n\n".encode("utf-8"))
+            self.send_chunk(b"data: [DONE]\n\n")
+            self.send_chunk(b"")
+            stats.record(200, delay)
+
+        def chat(self):
+            body = self.read_json()
+            if not body or not body.get("messages"):
+                stats.record(400)
+                return self.send_json({"error": "messages are required"}, 400)
+
+            status = faults.fault()
+            if status is not None:
+                stats.record(status)
+                return self.send_fault(status)
+
+            if generation_slots:
+                generation_slots.acquire()
+            try:
+                delay = faults.latency.sleep()
+                tokens = tokens_of(chat_response(body))
+                if body.get("stream") and "text/event-stream" in self.headers.get("Accept", ""):
+                    return self.send_stream(tokens, delay)
+                for _ in tokens[1:]:
+                    delay += token_latency.sleep()
+            finally:
+                if generation_slots:
+                    generation_slots.release()
+            stats.record(200, delay)
+            self.send_json({"response": "".join(tokens)})
+
+        def lora(self, load):
+            body = self.read_json() or {}
+            name = body.get("lora_adapter")
+            if not name:
+                return self.send_json({"error": "lora_adapter is required"}, 400)
+            with state.lock:
+                if load:
+                    state.adapters[name] = body.get("lora_adapter_version")
+                    return self.send_json({"message": f"LoRA adapter {name} loaded"})
+                if state.adapters.pop(name, False) is False:
+                    return self.send_json({"error": f"LoRA adapter {name} is not loaded"}, 404)
+            self.send_json({"message": f"LoRA adapter {name} unloaded"})
+
+        def upload_dataset(self):
+            match = UPLOADED_FILENAME.search(self.read_body())
+            if not match:
+                return self.send_json({"error": "file is required"}, 400)
+            filename = match.group(1).decode("utf-8")
+            with state.lock:
+                state.datasets.add(filename)
+            self.send_json({"message": f"Dataset {filename} uploaded"})
+
+        def start_training(self):
+            payload = self.read_json() or {}
+            if payload.get("dataset") not in state.datasets:
+                return self.send_json({"error": f"Dataset {payload.get('dataset')} was not uploaded"}, 400)
+            self.send_json({"training_id": state.start_training(payload).training_id})
+
+        def training(self, action):
+            training_id = self.path.rsplit("/", 1)[-1]
+            run = state.trainings.get(training_id)
+            if run is None:
+                return self.send_json({"error": f"Unknown training {training_id}"}, 404)
+            state.finish(run)
+
+            if action == "status":
+                return self.send_json(
+                    {
+                        "is_running": run.is_running,
+                        "logs": run.logs()[-5:],
+                        "registered_lora_adapter_name": run.payload.get("registered_name"),
+                        "registered_lora_adapter_version": run.version,
+                    }
+                )
+            if action == "logs":
+                return self.send_body(200, "\n".join(run.logs()) + "\n", "text/plain; charset=utf-8")
+            if action == "cancel":
+                if not run.is_running:
+                    return self.send_json({"error": "Training is not running"}, 409)
+                run.cancelled = True
+                return self.send_json({"message": f"Training {training_id} cancelled"})
+            if run.is_running or run.cancelled:
+                return self.send_json({"error": "No trained model for this training"}, 409)
+            self.send_body(200, state.adapter_zip(run), "application/zip")
+
+        def route(self, method):
+            path = self.path.split("?", 1)[0]
+            if (method, path) == ("GET", "/__stats"):
+                with state.lock:
+                    adapters = dict(state.adapters)
+                return self.send_json({**stats.snapshot(), "loaded_adapters": adapters})
+            if (method, path) == ("PUT", "/llm/prompt/chat"):
+                return self.chat()
+            if (method, path) in (("POST", "/llm/lora"), ("DELETE", "/llm/lora")):
+                return self.lora(method == "POST")
+            if (method, path) == ("POST", "/train/dataset/sft"):
+                return self.upload_dataset()
+            if (method, path) == ("POST", "/train/train/sft"):
+                return self.start_training()
+            for action, allowed in (("status", "GET"), ("logs", "GET"), ("cancel", "DELETE"), ("model", "GET")):
+                if method == allowed and path.startswith(f"/train/train/{action}/"):
+                    return self.training(action)
+            self.read_body()
+            self.send_json({"error": "not found"}, 404)
+
+        def do_GET(self):
+            self.route("GET")
+
+        def do_PUT(self):
+            self.route("PUT")
+
+        def do_POST(self):
+            self.route("POST")
+
+        def do_DELETE(self):
+            self.route("DELETE")
+
+    MockLLMHandler.stats = stats
+    MockLLMHandler.state = state
+    return MockLLMHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the LLM service for offline runs and load tests.")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Mean (median for lognormal) time to first token")
+    parser.add_argument("--latency-spread", type=float, default=0.0, help="Spread of the first token latency")
+    parser.add_argument("--latency-distribution", choices=LatencyModel.DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="Mean delay of every further token")
+    parser.add_argument("--token-latency-spread", type=float, default=0.0, help="Spread of the token delay")
+    parser.add_argument("--token-latency-distribution", choices=LatencyModel.DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--slots", type=int, help="Chat requests generated at once (default: unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of chat requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of chat requests answered with 429")
+    parser.add_argument("--max-rps", type=float, help="Answer chat requests with 429 above this request rate")
+    parser.add_argument("--training-seconds", type=float, default=30.0, help="Duration of a simulated training")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the injected latencies and faults")
+    args = parser.parse_args()
+
+    if args.max_rps is not None and args.max_rps <= 0:
+        parser.error("--max-rps must be greater than 0")
+
+    faults = FaultInjector(
+        LatencyModel(args.latency_ms, args.latency_spread, args.latency_distribution, random.Random(args.seed)),
+        args.error_rate,
+        args.throttle_rate,
+        args.max_rps,
+        args.seed,
+    )
+    token_latency = LatencyModel(
+        args.token_latency_ms,
+        args.token_latency_spread,
+        args.token_latency_distribution,
+        random.Random(args.seed + 1),
+    )
+    handler = mock_llm_handler(faults, token_latency, args.slots, LLMServiceState(args.training_seconds))
+    with BackgroundServer(handler, args.port) as server:
+        print(f"Mock LLM service listening on {server.url} (statistics at {server.url}/__stats)")
+        print(f"Point the scripts at it with: LLM_URL={server.url} LLM_USERNAME=mock LLM_PASSWORD=mock")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            print("Stopping mock LLM service...")
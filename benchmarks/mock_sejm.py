@@ -0,0 +1,198 @@
+# Local mock of the Sejm API: replays recorded responses or serves the synthetic corpus, with injected faults
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+import requests
+
+from corpus import SyntheticCorpus
+from servers import BackgroundServer, FaultInjector, LatencyModel, QuietHandler, RequestStats
+
+UPSTREAM_URL = "https://api.sejm.gov.pl"
+
+STATEMENT_PATH = re.compile(r"^/sejm/term(\d+)/proceedings/(\d+)/([\d-]+)/transcripts/(\d+)$")
+TRANSCRIPTS_PATH = re.compile(r"^/sejm/term(\d+)/proceedings/(\d+)/([\d-]+)/transcripts$")
+PROCEEDINGS_PATH = re.compile(r"^/sejm/term(\d+)/proceedings$")
+MEMBERS_PATH = re.compile(r"^/sejm/term(\d+)/MP$")
+MEMBER_PATH = re.compile(r"^/sejm/term(\d+)/MP/(\d+)$")
+CLUBS_PATH = re.compile(r"^/sejm/term(\d+)/clubs$")
+TERM_PATH = re.compile(r"^/sejm/term(\d+)$")
+
+
+class FixtureStore:
+    """
+    Recorded responses in a folder: index.json maps request paths to the status, content type and
+    body file of the response. Bodies are named after the hash of the path.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_filename = os.path.join(directory, "index.json")
+        self.lock = threading.Lock()
+        self.index = {}
+        if os.path.exists(self.index_filename):
+            with open(self.index_filename, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+
+    def get(self, path, accept=None):
+        entry = self.index.get(path)
+        if entry is None:
+            return None
+        with open(os.path.join(self.directory, entry["file"]), "rb") as f:
+            return entry["status"], entry["content_type"], f.read()
+
+    def put(self, path, status, content_type, body):
+        filename = hashlib.sha1(path.encode("utf-8")).hexdigest()
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, filename), "wb") as f:
+            f.write(body)
+        with self.lock:
+            self.index[path] = {"status": status, "content_type": content_type, "file": filename}
+            tmp_filename = f"{self.index_filename}.tmp"
+            with open(tmp_filename, "w", encoding="utf-8") as f:
+                json.dump(self.index, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_filename, self.index_filename)
+
+
+class RecordingSource:
+    """Replays recorded responses and fetches (and records) the missing ones from the real API."""
+
+    def __init__(self, store, upstream=UPSTREAM_URL):
+        self.store = store
+        self.upstream = upstream
+        self.session = requests.Session()
+
+    def get(self, path, accept):
+        recorded = self.store.get(path)
+        if recorded is not None:
+            return recorded
+        response = self.session.get(f"{self.upstream}{path}", headers={"Accept": accept})
+        content_type = response.headers.get("Content-Type", "application/json")
+        # Errors are passed on but never recorded, so they are retried on the next request
+        if response.ok:
+            self.store.put(path, response.status_code, content_type, response.content)
+        return response.status_code, content_type, response.content
+
+
+class SyntheticSource:
+    """Serves the API responses of a SyntheticCorpus."""
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def get(self, path, accept):
+        corpus = self.corpus
+        if match := STATEMENT_PATH.match(path):
+            _, session, day, num = match.groups()
+            try:
+                html = corpus.statement_html(int(session), day, int(num))
+            except (KeyError, IndexError):
+                return None
+            return 200, "text/html; charset=utf-8", html.encode("utf-8")
+        if match := TRANSCRIPTS_PATH.match(path):
+            _, session, day = match.groups()
+            data = corpus.transcripts(int(session), day)
+        elif PROCEEDINGS_PATH.match(path):
+            data = corpus.proceedings()
+        elif MEMBERS_PATH.match(path):
+            data = corpus.members
+        elif match := MEMBER_PATH.match(path):
+            member_id = int(match.group(2))
+            if not 1 <= member_id <= len(corpus.members):
+                return None
+            data = corpus.member_details(member_id)
+        elif CLUBS_PATH.match(path):
+            data = corpus.clubs()
+        elif TERM_PATH.match(path):
+            data = corpus.term_info()
+        else:
+            return None
+        return 200, "application/json", json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+def mock_sejm_handler(source, faults=None, stats=None):
+    """Request handler serving `source` (a FixtureStore, RecordingSource or SyntheticSource) with injected faults."""
+    faults = faults or FaultInjector()
+    stats = stats or RequestStats()
+
+    class MockSejmHandler(QuietHandler):
+        def do_GET(self):
+            if self.path == "/__stats":
+                return self.send_json(stats.snapshot())
+
+            delay = faults.latency.sleep()
+            status = faults.fault()
+            if status is not None:
+                stats.record(status, delay)
+                return self.send_fault(status)
+
+            response = source.get(self.path, self.headers.get("Accept", "application/json"))
+            if response is None:
+                stats.record(404, delay)
+                return self.send_json({"error": "not found"}, 404)
+
+            status, content_type, body = response
+            stats.record(status, delay)
+            self.send_body(status, body, content_type)
+
+    MockSejmHandler.stats = stats
+    return MockSejmHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the Sejm API for offline scraping and load tests.")
+    source_group = parser.add_mutually_exclusive_group()
+    source_group.add_argument("--fixtures", type=str, help="Replay responses recorded in this folder")
+    source_group.add_argument(
+        "--record", type=str, help="Replay from this folder, recording missing responses from the API"
+    )
+    parser.add_argument("--upstream", type=str, default=UPSTREAM_URL, help="API recorded from with --record")
+    parser.add_argument("--term", type=int, default=10, help="Term of the synthetic corpus")
+    parser.add_argument("--sessions", type=int, default=2, help="Sittings in the synthetic corpus")
+    parser.add_argument("--days", type=int, default=2, help="Days per sitting in the synthetic corpus")
+    parser.add_argument("--statements", type=int, default=50, help="Statements per day in the synthetic corpus")
+    parser.add_argument("--port", type=int, default=8001, help="Port to listen on")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Mean (median for lognormal) response latency")
+    parser.add_argument("--latency-spread", type=float, default=0.0, help="Spread of the latency distribution")
+    parser.add_argument("--latency-distribution", choices=LatencyModel.DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--max-rps", type=float, help="Answer with 429 above this many requests per second")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the corpus and of the injected faults")
+    args = parser.parse_args()
+
+    if args.max_rps is not None and args.max_rps <= 0:
+        parser.error("--max-rps must be greater than 0")
+
+    if args.fixtures:
+        source = FixtureStore(args.fixtures)
+        print(f"Replaying {len(source.index)} recorded responses from {args.fixtures}")
+    elif args.record:
+        source = RecordingSource(FixtureStore(args.record), args.upstream)
+        print(f"Recording responses from {args.upstream} into {args.record}")
+    else:
+        corpus = SyntheticCorpus(args.term, args.sessions, args.days, args.statements, seed=args.seed)
+        source = SyntheticSource(corpus)
+        print(f"Serving a synthetic term {args.term} with {corpus.statement_count()} statements")
+
+    faults = FaultInjector(
+        LatencyModel(args.latency_ms, args.latency_spread, args.latency_distribution, random.Random(args.seed)),
+        args.error_rate,
+        args.throttle_rate,
+        args.max_rps,
+        args.seed,
+    )
+    with BackgroundServer(mock_sejm_handler(source, faults), args.port) as server:
+        print(f"Mock Sejm API listening on {server.url}/sejm (statistics at {server.url}/__stats)")
+        print(f"Run the scraper with: SEJM_API_URL={server.url}/sejm python speeches.py --term {args.term}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            print("Stopping mock Sejm API...")
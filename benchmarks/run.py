@@ -0,0 +1,421 @@
+# Runs timed end-to-end scenarios of the pipeline on a synthetic corpus and compares results across commits
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for folder in ("scraper", "data_processor", "test_survey"):
+    sys.path.insert(0, os.path.join(REPO_ROOT, folder))
+
+from corpus import CLUBS, SyntheticCorpus
+from mock_llm import mock_llm_handler
+from mock_sejm import SyntheticSource, mock_sejm_handler
+from servers import BackgroundServer, FaultInjector, LatencyModel
+
+SCALES = {
+    "small": {"sessions": 2, "days": 2, "statements": 50, "members": 120},
+    "medium": {"sessions": 4, "days": 3, "statements": 150, "members": 300},
+    "large": {"sessions": 10, "days": 3, "statements": 400, "members": 460},
+}
+SURVEY_QUESTIONS = 267
+SURVEY_REPEATS = 5
+SURVEY_WORKERS = 8
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+class BenchmarkContext:
+    """Everything the scenarios share: the corpus, its files on disk and the running stand-in servers."""
+
+    def __init__(self, corpus, workdir, sejm_url, llm_url):
+        self.corpus = corpus
+        self.workdir = workdir
+        self.sejm_url = sejm_url
+        self.llm_url = llm_url
+        self.speech_root = corpus.write_speech_tree(os.path.join(workdir, "speeches"))
+        self.mp_clubs_root = os.path.join(workdir, "mp_clubs")
+        corpus.write_mp_clubs(self.mp_clubs_root)
+        self._speeches = None
+        self._tokenizer = None
+
+    @property
+    def speeches(self):
+        """Loaded speeches with alignment, as process_data.py has them before parsing."""
+        if self._speeches is None:
+            import process_data
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                speeches = process_data.load_speeches(self.speech_root)
+            self._speeches = pd.DataFrame(speeches, columns=["title", "speaker", "context", "text", "link"])
+            alignment = {member["firstLastName"]: CLUBS[member["club"]] for member in self.corpus.members}
+            self._speeches["alignment"] = self._speeches["speaker"].map(alignment).fillna("")
+        return self._speeches
+
+    @property
+    def tokenizer(self):
+        """A byte-level BPE tokenizer trained on the corpus, standing in for the base model tokenizer."""
+        if self._tokenizer is None:
+            from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+
+            tokenizer = Tokenizer(models.BPE(unk_token="<unk>"))
+            tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel()
+            tokenizer.decoder = decoders.ByteLevel()
+            trainer = trainers.BpeTrainer(vocab_size=8000, special_tokens=["<unk>", "<pad>"], show_progress=False)
+            tokenizer.train_from_iterator(self.speeches["text"].tolist(), trainer)
+            self._tokenizer = tokenizer
+        return self._tokenizer
+
+
+def scenario_scrape(ctx):
+    """scraper/speeches.py fetching the whole term from the mock Sejm API; counts the speeches saved."""
+    import speeches
+
+    speeches.BASE_URL = f"{ctx.sejm_url}/sejm"
+    output = os.path.join(ctx.workdir, "scrape")
+    shutil.rmtree(output, ignore_errors=True)
+    os.makedirs(output)
+    with working_directory(output), contextlib.redirect_stdout(io.StringIO()):
+        speeches.process_term(ctx.corpus.term)
+    # With injected faults some statements fail, so the saved files are counted
+    return sum(
+        len([name for name in files if name not in ("agenda.json", "resume.json")])
+        for _, _, files in os.walk(os.path.join(output, "output"))
+    )
+
+
+def scenario_load(ctx):
+    """process_data.load_speeches reading the speech JSON tree."""
+    import process_data
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return len(process_data.load_speeches(ctx.speech_root))
+
+
+def scenario_clean(ctx):
+    """process_data.parse_text removing interjections and greetings."""
+    import process_data
+
+    return len(process_data.parse_text(ctx.speeches.copy()))
+
+
+def scenario_map(ctx):
+    """map_members building the member registry and process_data.add_alignment joining the speeches with it."""
+    import map_members
+    import process_data
+
+    club_mapping = {club: alignment for club, alignment in CLUBS.items()}
+    registry = map_members.build_registry(ctx.mp_clubs_root, club_mapping)
+    registry_file = os.path.join(ctx.workdir, "member_registry.csv")
+    registry.to_csv(registry_file, index=False, encoding="UTF-8")
+    speeches = ctx.speeches.drop(columns=["alignment"])
+    return len(process_data.add_alignment(speeches, registry_file))
+
+
+def scenario_topics(ctx):
+    """data_processor/topics.py matching the speeches to agenda items and classifying them by keywords."""
+    import topics
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        agendas = topics.load_agendas(os.path.dirname(ctx.speech_root))
+        return len(topics.classify_topics(ctx.speeches, agendas))
+
+
+def scenario_export(ctx):
+    """process_data.save_as_sft and save_as_dpo writing the datasets."""
+    import process_data
+
+    output = os.path.join(ctx.workdir, "export")
+    shutil.rmtree(output, ignore_errors=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        process_data.save_as_sft(ctx.speeches.copy(), output)
+        process_data.save_as_dpo(ctx.speeches.copy(), output)
+    return 2 * len(ctx.speeches)
+
+
+def scenario_tokenise(ctx):
+    """Tokenising SFT records formatted as in fine_tuning/train_local.py."""
+    tokenizer = ctx.tokenizer
+    texts = [
+        f"user: {context}\nassistant: {text}" for context, text in zip(ctx.speeches["context"], ctx.speeches["text"])
+    ]
+    tokenizer.enable_truncation(2048)
+    tokenizer.encode_batch(texts)
+    return len(texts)
+
+
+def scenario_survey_score(ctx):
+    """Survey statements answered concurrently by the mock LLM service, then scored with test_survey/scoring.py."""
+    from scoring import compute_scores
+
+    system_prompt = "Odpowiedz: a.) Zdecydowanie się zgadzam. c.) Nie mam zdania. e.) Zdecydowanie się nie zgadzam."
+    questions = [
+        {
+            "question": f"Stwierdzenie numer {idx} " + "x" * (idx % 7),
+            "weight": 1 + idx % 3,
+            "tendency": ["left", "right"][idx % 2],
+        }
+        for idx in range(SURVEY_QUESTIONS)
+    ]
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SURVEY_WORKERS)
+    session.mount("http://", adapter)
+
+    def ask(question):
+        messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": question["question"]}]
+        response = session.put(f"{ctx.llm_url}/llm/prompt/chat", json={"messages": messages})
+        response.raise_for_status()
+        return response.json()["response"]
+
+    asked = [question for question in questions for _ in range(SURVEY_REPEATS)]
+    with ThreadPoolExecutor(max_workers=SURVEY_WORKERS) as executor:
+        answers = list(executor.map(ask, asked))
+
+    records = [
+        {
+            "run": "benchmark",
+            "model": "stand-in",
+            "side": "base",
+            "category": f"Kategoria {idx % 5}",
+            "question": question["question"],
+            "weight": question["weight"],
+            "political_tendency": question["tendency"],
+            "answer": answer,
+        }
+        for idx, (question, answer) in enumerate(zip(asked, answers))
+    ]
+    compute_scores(records)
+    return len(records)
+
+
+SCENARIOS = {
+    "scrape": scenario_scrape,
+    "load": scenario_load,
+    "clean": scenario_clean,
+    "map": scenario_map,
+    "topics": scenario_topics,
+    "export": scenario_export,
+    "tokenise": scenario_tokenise,
+    "survey-score": scenario_survey_score,
+}
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT, capture_output=True, text=True
+        ).stdout
+        return f"{commit}-dirty" if dirty.strip() else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_scenario(name, ctx, repeat):
+    """Runs the scenario once as a warm-up (which also prepares shared data) and then `repeat` timed times."""
+    scenario = SCENARIOS[name]
+    scenario(ctx)
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        items = scenario(ctx)
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    return {
+        "items": items,
+        "times": [round(t, 4) for t in times],
+        "min": round(min(times), 4),
+        "median": round(median, 4),
+        "items_per_second": round(items / median, 1) if median > 0 else None,
+    }
+
+
+def run_benchmarks(scenarios, scale, repeat, seed, sejm_faults, llm_handler):
+    corpus = SyntheticCorpus(seed=seed, **scale)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="sejmai_bench_") as workdir:
+        sejm_handler = mock_sejm_handler(SyntheticSource(corpus), sejm_faults)
+        with BackgroundServer(sejm_handler) as sejm, BackgroundServer(llm_handler) as llm:
+            ctx = BenchmarkContext(corpus, workdir, sejm.url, llm.url)
+            for name in scenarios:
+                results[name] = run_scenario(name, ctx, repeat)
+                print(
+                    f"{name:<13} {results[name]['median']:>9.4f}s median  "
+                    f"{results[name]['items_per_second'] or 0:>12.1f} items/s  ({results[name]['items']} items)"
+                )
+    return results
+
+
+def compare(old_filename, new_filename, threshold):
+    with open(old_filename, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_filename, "r", encoding="utf-8") as f:
+        new = json.load(f)
+
+    for setting in ("scale", "sejm", "llm"):
+        if old.get(setting) != new.get(setting):
+            print(
+                f"Warning: different {setting} settings ({old.get(setting)} vs {new.get(setting)}), times are not comparable."
+            )
+    print(f"{'scenario':<13} {old['commit']:>14} {new['commit']:>14} {'change':>9}")
+    regressions = 0
+    for name in [name for name in old["scenarios"] if name in new["scenarios"]]:
+        before, after = old["scenarios"][name]["median"], new["scenarios"][name]["median"]
+        change = (after - before) / before if before > 0 else 0.0
+        verdict = ""
+        if change > threshold:
+            verdict = "REGRESSION"
+            regressions += 1
+        elif change < -threshold:
+            verdict = "faster"
+        print(f"{name:<13} {before:>13.4f}s {after:>13.4f}s {change:>+8.1%}  {verdict}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmarks on a synthetic Sejm corpus.")
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS), help="Scenarios to run"
+    )
+    parser.add_argument("--scale", choices=list(SCALES), default="small", help="Corpus size preset")
+    parser.add_argument("--sessions", type=int, help="Number of sittings (overrides the preset)")
+    parser.add_argument("--days", type=int, help="Days per sitting (overrides the preset)")
+    parser.add_argument("--statements", type=int, help="Statements per day (overrides the preset)")
+    parser.add_argument("--members", type=int, help="Number of MPs (overrides the preset)")
+    parser.add_argument("--sejm-latency-ms", type=float, default=0.0, help="Mean latency of the mock Sejm API")
+    parser.add_argument("--sejm-latency-spread", type=float, default=0.0, help="Spread of the Sejm API latency")
+    parser.add_argument(
+        "--sejm-latency-distribution",
+        choices=LatencyModel.DISTRIBUTIONS,
+        default="fixed",
+        help="Sejm API latency distribution",
+    )
+    parser.add_argument(
+        "--sejm-error-rate", type=float, default=0.0, help="Share of Sejm API requests failing with 500"
+    )
+    parser.add_argument(
+        "--sejm-throttle-rate", type=float, default=0.0, help="Share of Sejm API requests answered with 429"
+    )
+    parser.add_argument("--sejm-max-rps", type=float, help="Sejm API answers with 429 above this request rate")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Mean time to first token of the mock LLM")
+    parser.add_argument("--llm-latency-spread", type=float, default=0.0, help="Spread of the time to first token")
+    parser.add_argument(
+        "--llm-latency-distribution",
+        choices=LatencyModel.DISTRIBUTIONS,
+        default="fixed",
+        help="Distribution of the time to first token",
+    )
+    parser.add_argument("--llm-token-latency-ms", type=float, default=0.0, help="Delay of every further token")
+    parser.add_argument("--llm-slots", type=int, help="Chat requests the mock LLM generates at once")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed repetitions of every scenario")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpus and of the injected faults")
+    parser.add_argument(
+        "--output-dir", type=str, default=os.path.join(os.path.dirname(__file__), "results"), help="Folder for results"
+    )
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files instead of running"
+    )
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    if args.sejm_max_rps is not None and args.sejm_max_rps <= 0:
+        parser.error("--sejm-max-rps must be greater than 0")
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    scale = dict(SCALES[args.scale])
+    for key in scale:
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+
+    sejm = {
+        "latency_ms": args.sejm_latency_ms,
+        "latency_spread": args.sejm_latency_spread,
+        "latency_distribution": args.sejm_latency_distribution,
+        "error_rate": args.sejm_error_rate,
+        "throttle_rate": args.sejm_throttle_rate,
+        "max_rps": args.sejm_max_rps,
+    }
+    sejm_faults = FaultInjector(
+        LatencyModel(
+            args.sejm_latency_ms, args.sejm_latency_spread, args.sejm_latency_distribution, random.Random(args.seed)
+        ),
+        args.sejm_error_rate,
+        args.sejm_throttle_rate,
+        args.sejm_max_rps,
+        args.seed,
+    )
+    llm = {
+        "latency_ms": args.llm_latency_ms,
+        "latency_spread": args.llm_latency_spread,
+        "latency_distribution": args.llm_latency_distribution,
+        "token_latency_ms": args.llm_token_latency_ms,
+        "slots": args.llm_slots,
+    }
+    llm_handler = mock_llm_handler(
+        FaultInjector(
+            LatencyModel(
+                args.llm_latency_ms, args.llm_latency_spread, args.llm_latency_distribution, random.Random(args.seed)
+            ),
+            seed=args.seed,
+        ),
+        LatencyModel(args.llm_token_latency_ms),
+        args.llm_slots,
+    )
+
+    commit = git_commit()
+    print(f"Running {len(args.scenarios)} scenarios on commit {commit} with scale {scale}...")
+    results = run_benchmarks(args.scenarios, scale, args.repeat, args.seed, sejm_faults, llm_handler)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_filename = os.path.join(args.output_dir, f"bench__{commit}__{timestamp}.json")
+    with open(output_filename, "w", encoding="utf-8") as out:
+        json.dump(
+            {
+                "commit": commit,
+                "timestamp": timestamp,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "scale": scale,
+                "sejm": sejm,
+                "llm": llm,
+                "seed": args.seed,
+                "repeat": args.repeat,
+                "scenarios": results,
+            },
+            out,
+            ensure_ascii=False,
+            indent=4,
+        )
+    print(f"Results saved to {output_filename}")
@@ -0,0 +1,163 @@
+# Shared pieces of the local stand-in servers: threaded serving, latency models and fault injection
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LatencyModel:
+    """
+    Response delay in milliseconds drawn from a distribution:
+    - fixed: always `mean`,
+    - normal: mean `mean` and standard deviation `spread`, clipped at 0,
+    - lognormal: median `mean` and shape `spread` (heavy tail, like real model serving),
+    - uniform: between `mean - spread` and `mean + spread`.
+    """
+
+    DISTRIBUTIONS = ["fixed", "normal", "lognormal", "uniform"]
+
+    def __init__(self, mean=0.0, spread=0.0, distribution="fixed", rng=None):
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.mean = mean
+        self.spread = spread
+        self.distribution = distribution
+        self.rng = rng or random.Random()
+
+    def sample(self):
+        if self.mean <= 0:
+            return 0.0
+        if self.distribution == "normal":
+            return max(0.0, self.rng.gauss(self.mean, self.spread))
+        if self.distribution == "lognormal":
+            return self.mean * self.rng.lognormvariate(0.0, self.spread)
+        if self.distribution == "uniform":
+            return max(0.0, self.rng.uniform(self.mean - self.spread, self.mean + self.spread))
+        return self.mean
+
+    def sleep(self):
+        delay = self.sample()
+        if delay:
+            time.sleep(delay / 1000)
+        return delay
+
+
+class FaultInjector:
+    """
+    Decides the fate of every request: 429 when the `max_rps` token bucket is empty or with probability
+    `throttle_rate`, 500 with probability `error_rate`, otherwise a normal response after the sampled latency.
+    The bucket holds at least one token, so a `max_rps` below 1 still serves a request every 1/max_rps seconds.
+    A fixed seed makes the sequence of injected faults reproducible for a sequential client.
+    """
+
+    def __init__(self, latency=None, error_rate=0.0, throttle_rate=0.0, max_rps=None, seed=None):
+        if max_rps is not None and max_rps <= 0:
+            raise ValueError(f"max_rps must be greater than 0: {max_rps}")
+        self.rng = random.Random(seed)
+        self.latency = latency or LatencyModel(rng=self.rng)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_rps = max_rps
+        self.lock = threading.Lock()
+        self.burst = max(1.0, max_rps or 0)
+        self.tokens = self.burst if max_rps else 0
+        self.refilled = time.monotonic()
+
+    def _take_token(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.max_rps)
+        self.refilled = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def fault(self):
+        """Returns the injected status code, or None when the request should be served."""
+        with self.lock:
+            if self.max_rps and not self._take_token():
+                return 429
+            draw = self.rng.random()
+        if draw < self.throttle_rate:
+            return 429
+        if draw < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+
+class RequestStats:
+    """Counts served requests by status code; exposed by the stand-ins at /__stats."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.statuses = Counter()
+        self.latency_ms = 0.0
+
+    def record(self, status, latency_ms=0.0):
+        with self.lock:
+            self.statuses[status] += 1
+            self.latency_ms += latency_ms
+
+    def snapshot(self):
+        with self.lock:
+            requests = sum(self.statuses.values())
+            return {
+                "requests": requests,
+                "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+                "mean_injected_latency_ms": round(self.latency_ms / requests, 3) if requests else None,
+            }
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Whole responses are sent in one packet, otherwise delayed ACKs add ~40 ms to every keep-alive request
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type, headers=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data, status=200, headers=None):
+        self.send_body(status, json.dumps(data, ensure_ascii=False), "application/json", headers)
+
+    def send_fault(self, status):
+        if status == 429:
+            self.send_json({"error": "Too Many Requests"}, 429, {"Retry-After": "1"})
+        else:
+            self.send_json({"error": "Internal Server Error"}, status)
+
+
+class BackgroundServer:
+    """Runs an HTTP server on a local port (a free one by default) for the duration of a `with` block."""
+
+    def __init__(self, handler, port=0):
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,16 +1,20 @@
 import os
+import sys
 import requests
 from dotenv import load_dotenv
 import urllib3
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from instrumentation import metrics
+
 MAX_RETRIES = 5
 system_prompt = "Odpowiadaj krótko, precyzyjnie i wyłącznie w języku polskim."
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
-def prompt_model(prompt):
+def prompt_model(prompt, max_length=64):
     load_dotenv("../.env")
     assert "LLM_USERNAME" in os.environ, f"Environment variable LLM_USERNAME must be set"
     assert "LLM_PASSWORD" in os.environ, f"Environment variable LLM_PASSWORD must be set"
@@ -25,24 +29,26 @@ def prompt_model(prompt):
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": prompt},
         ],
-        "max_length": 64,
+        "max_length": max_length,
         "temperature": 0.7,
     }
     retries = 0
     while retries < MAX_RETRIES:
         try:
-            response = requests.put(
-                url=url,
-                json=data,
-                headers={
-                    "Accept": "application/json",
-                    "Content-Type": "application/json",
-                },
-                **auth_kwargs,
-            )
-            response.raise_for_status()
+            with metrics.timer("llm_request"):
+                response = requests.put(
+                    url=url,
+                    json=data,
+                    headers={
+                        "Accept": "application/json",
+                        "Content-Type": "application/json",
+                    },
+                    **auth_kwargs,
+                )
+                response.raise_for_status()
             break
         except requests.exceptions.HTTPError as e:
+            metrics.count("llm_retries")
             print(f"HTTP error occurred: {e} retry: {retries}")
             retries += 1
             if retries >= MAX_RETRIES:
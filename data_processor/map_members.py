@@ -1,6 +1,9 @@
 import os
 import sys
 import json
+import pandas as pd
+
+REGISTRY_COLUMNS = ["term", "speaker", "club", "alignment", "date_from", "date_to"]
 
 
 def extract_clubs(input_folder):
@@ -18,28 +21,70 @@ def extract_clubs(input_folder):
     return clubs
 
 
-def extract_members(input_folder, club_mapping):
-    members = {}
-    for dir in os.listdir(input_folder):
-        if os.path.isdir(os.path.join(input_folder, dir)):
-            members = {
-                **members,
-                **extract_members(os.path.join(input_folder, dir), club_mapping),
-            }
-        elif dir == "members.json":
-            with open(os.path.join(input_folder, dir), "r", encoding="UTF-8") as file:
-                json_data = json.load(file)
-                for member in json_data:
-                    if "club" in member.keys():
-                        mapping = club_mapping[member["club"]] if member["club"] in club_mapping.keys() else ""
-                        members[member["firstLastName"]] = mapping
-    return members
+def build_registry(input_folder, club_mapping):
+    """
+    Builds the member registry from the term<N> folders saved by scraper/mp_clubs.py: one row per
+    term, MP and club with the dates the membership covers. Memberships come from club_history.json
+    (saved with --enrich) when it has the MP, otherwise they span the whole term from the dates in
+    term.json; an empty date means the range is open on that side. History dates marked as observed are
+    the day a run saw the membership, so the first membership of an MP is extended back to the start of
+    the term, the earliest it could have begun; later changes keep the observed day.
+    """
+    rows = []
+    for entry in sorted(os.scandir(input_folder), key=lambda entry: entry.name):
+        if not entry.is_dir() or not entry.name.startswith("term"):
+            continue
+        term = entry.name[len("term") :]
+
+        term_data = {}
+        term_file = os.path.join(entry.path, "term.json")
+        if os.path.exists(term_file):
+            with open(term_file, "r", encoding="UTF-8") as file:
+                term_data = json.load(file)
+
+        club_history = {}
+        history_file = os.path.join(entry.path, "club_history.json")
+        if os.path.exists(history_file):
+            with open(history_file, "r", encoding="UTF-8") as file:
+                club_history = json.load(file)
+
+        with open(os.path.join(entry.path, "members.json"), "r", encoding="UTF-8") as file:
+            members = json.load(file)
+        for member in members:
+            memberships = club_history.get(str(member.get("id")))
+            if memberships is None:
+                if "club" not in member.keys():
+                    continue
+                memberships = [
+                    {"club": member["club"], "from": term_data.get("from", ""), "to": term_data.get("to", "")}
+                ]
+            elif memberships and memberships[0].get("from_observed"):
+                memberships[0]["from"] = term_data.get("from", "")
+            for membership in memberships:
+                rows.append(
+                    {
+                        "term": term,
+                        "speaker": member["firstLastName"],
+                        "club": membership["club"],
+                        "alignment": club_mapping.get(membership["club"], ""),
+                        "date_from": membership["from"],
+                        "date_to": membership["to"],
+                    }
+                )
+
+    registry = pd.DataFrame(rows, columns=REGISTRY_COLUMNS)
+    return registry.drop_duplicates().sort_values(["term", "speaker", "date_from"], ignore_index=True)
+
+
+def load_registry(registry_file):
+    # Everything is kept as strings: terms are matched with the term in the speech link and ISO dates compare as text
+    return pd.read_csv(registry_file, dtype=str, keep_default_na=False, encoding="UTF-8")
 
 
 if __name__ == "__main__":
     input_folder = "../scraper/output/mp_clubs"
     club_mapping_file = "club_mapping.json"
-    member_mapping_file = "member_mapping.json"
+    member_registry_file = "member_registry.csv"
     if "--get_clubs" in sys.argv:
         output = extract_clubs(input_folder)
         json.dump(
@@ -50,10 +95,6 @@ if __name__ == "__main__":
         )
     elif "--get_members" in sys.argv:
         club_mapping = json.load(open(club_mapping_file, "r"))
-        output = extract_members(input_folder, club_mapping)
-        json.dump(
-            output,
-            open(member_mapping_file, "w", encoding="UTF-8"),
-            indent=4,
-            ensure_ascii=False,
-        )
+        registry = build_registry(input_folder, club_mapping)
+        registry.to_csv(member_registry_file, index=False, encoding="UTF-8")
+        print(f"Saved {len(registry)} memberships of {registry.speaker.nunique()} MPs to {member_registry_file}")
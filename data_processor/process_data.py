@@ -1,12 +1,19 @@
 import pandas as pd
+import numpy as np
 import os
 import json
 import re
 from llm_connection import prompt_model
+from map_members import load_registry
+from topics import balanced_sample, load_topics
 import sys
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from instrumentation import metrics
+
 files_to_ignore = ["agenda.json", "0.json"]
+SPEECH_LINK_PATTERN = r"term(?P<term>\d+)/proceedings/\d+/(?P<date>\d{4}-\d{2}-\d{2})/"
 
 
 def load_speeches(input_folder: str):
@@ -20,8 +27,11 @@ def load_speeches(input_folder: str):
         subdirs = subdirs[1:]
 
     def load_file(file_path):
-        with open(file_path, "r", encoding="UTF-8") as file:
-            return json.load(file)
+        with metrics.timer("load_speech_file"):
+            with open(file_path, "r", encoding="UTF-8") as file:
+                speech = json.load(file)
+        metrics.count("speech_files_loaded")
+        return speech
 
     futures = []
     with ThreadPoolExecutor() as executor:
@@ -36,16 +46,34 @@ def load_speeches(input_folder: str):
     return speeches
 
 
-def add_alignment(speeches: pd.DataFrame, member_mapping_file: str):
-    def map(row, member_mapping):
-        if row["speaker"] in member_mapping.keys():
-            return member_mapping[row["speaker"]]
-        else:
-            return ""
-
-    with open(member_mapping_file, "r", encoding="UTF-8") as file:
-        member_mapping = json.load(file)
-        return speeches.apply(map, args=[member_mapping], axis=1)
+def add_alignment(speeches: pd.DataFrame, member_registry_file: str, member_mapping_file: str = None):
+    """
+    Alignment of the club the speaker belonged to in the term and on the day of the speech, both taken
+    from the transcript link. Speakers without a matching membership get "".
+    Without the registry, falls back to the name-only `member_mapping_file` when given, which ignores
+    terms and dates.
+    """
+    if not os.path.exists(member_registry_file) and member_mapping_file is not None:
+        print(f"{member_registry_file} not found, using the name-only {member_mapping_file}")
+        with open(member_mapping_file, "r", encoding="UTF-8") as file:
+            member_mapping = json.load(file)
+        return speeches["speaker"].map(member_mapping).fillna("")
+
+    registry = load_registry(member_registry_file)
+
+    keys = speeches["link"].str.extract(SPEECH_LINK_PATTERN)
+    keys["speaker"] = speeches["speaker"].to_numpy()
+    keys["row"] = np.arange(len(speeches))
+    matches = keys.merge(registry, on=["term", "speaker"])
+    in_range = ((matches["date_from"] == "") | (matches["date"] >= matches["date_from"])) & (
+        (matches["date_to"] == "") | (matches["date"] <= matches["date_to"])
+    )
+    # With overlapping memberships the one started last wins
+    matches = matches[in_range].sort_values("date_from").drop_duplicates("row", keep="last")
+
+    alignment = np.full(len(speeches), "", dtype=object)
+    alignment[matches["row"].to_numpy()] = matches["alignment"].to_numpy()
+    return pd.Series(alignment, index=speeches.index)
 
 
 def save_as_sft(speeches: pd.DataFrame, output_folder: str):
@@ -95,6 +123,7 @@ def save_as_dpo(speeches: pd.DataFrame, output_folder: str):
             print(f"Saving {file.name} with {len(json_data)} items.")
 
 
+@metrics.timed()
 def parse_text(speeches: pd.DataFrame):
     def remove_brackets(text):
         text = re.sub(r"\([^)]*\)", "", text)
@@ -109,9 +138,11 @@ def parse_text(speeches: pd.DataFrame):
                 return text[len(to_delete) :].strip()
         return text
 
+    metrics.count("speeches_parsed", len(speeches))
     return speeches["text"].apply(remove_brackets).apply(remove_greetings)
 
 
+@metrics.timed()
 def parse_context(speeches: pd.DataFrame, checkpoint_path: str):
     prompt = "Podaj temat tej wypowiedzi w maksymalnie 10 słowach, w formacie 'Temat: '. Wypowiedź: "
     save_every = 500
@@ -121,6 +152,7 @@ def parse_context(speeches: pd.DataFrame, checkpoint_path: str):
         if pd.isna(context) or len(context.split()) < 5:
             context = prompt_model(prompt + row["text"])
             context = context.replace("Temat: ", "").replace("\n", " ").strip()
+            metrics.count("contexts_generated")
             print(f"{row['context']} -> {context}")
         return context
 
@@ -141,11 +173,17 @@ def parse_context(speeches: pd.DataFrame, checkpoint_path: str):
 
 if __name__ == "__main__":
     input_folder = "../scraper/output/speeches"
+    member_registry_file = "member_registry.csv"
+    # Committed mapping of the MPs of earlier scrapes, used until the registry is generated
     member_mapping_file = "member_mapping.json"
     output_folder = "output"
     os.makedirs(output_folder, exist_ok=True)
     raw_filename = os.path.join(output_folder, "raw.csv")
     checkpoint_filename = os.path.join(output_folder, "checkpoint.csv")
+    topics_filename = os.path.join(output_folder, "topics.csv")
+
+    run_name = "process_data_gen_context" if "--gen_context" in sys.argv else "process_data"
+    metrics.write_on_exit(run_name, os.path.join(output_folder, "metrics"))
 
     if "--gen_context" in sys.argv:
         # load raw data from csv
@@ -163,10 +201,11 @@ if __name__ == "__main__":
         speeches = parse_context(speeches, checkpoint_filename)
 
     else:
-        speeches = pd.DataFrame(
-            load_speeches(input_folder),
-            columns=["title", "speaker", "context", "text", "link"],
-        )
+        with metrics.timer("load_speeches"):
+            speeches = pd.DataFrame(
+                load_speeches(input_folder),
+                columns=["title", "speaker", "context", "text", "link"],
+            )
 
         print(speeches.head())
         print(f"Data size: {speeches.shape}")
@@ -174,7 +213,7 @@ if __name__ == "__main__":
         print(f"{speeches.context.value_counts().head(10)}")
 
         print("\nMapping political alignment")
-        speeches["alignment"] = add_alignment(speeches, member_mapping_file)
+        speeches["alignment"] = add_alignment(speeches, member_registry_file, member_mapping_file)
         print(speeches.alignment.value_counts())
 
         print("\nRemoving speeches without alignment")
@@ -190,6 +229,17 @@ if __name__ == "__main__":
             os.remove(checkpoint_filename)
             print(f"Removed checkpoint file {checkpoint_filename}")
 
+    if "--balanced" in sys.argv:
+        # At most N speeches per alignment and category, by the categories saved by topics.py
+        per_category = int(sys.argv[sys.argv.index("--balanced") + 1])
+        if not os.path.exists(topics_filename):
+            print(f"Topics file {topics_filename} not found. Run topics.py first.")
+            sys.exit(1)
+        speeches["category"] = speeches["link"].map(load_topics(topics_filename)["category"])
+        speeches = balanced_sample(speeches, per_category)
+        print(f"\nBalanced sample of {len(speeches)} speeches, at most {per_category} per alignment and category")
+        output_folder = os.path.join(output_folder, "balanced")
+
     # grouped = speeches.groupby(speeches["alignment"])
     # print(grouped.groups.keys())
     # print(grouped.get_group("left").shape)
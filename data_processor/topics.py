@@ -0,0 +1,481 @@
+import os
+import re
+import sys
+import json
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from llm_connection import prompt_model
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "debate_simulation"))
+from instrumentation import metrics
+from prompts import QUESTION_CATEGORIES
+
+AGENDA_LINK_PATTERN = r"term(?P<term>\d+)/proceedings/(?P<session>\d+)/"
+# Transcripts often prefix the agenda item with its number, the agenda itself does not
+AGENDA_POINT_PREFIX = r"^\s*punkt\s+\d+\.?\s+porządku\s+dziennego:?\s*"
+STEM_LENGTH = 5
+# Weighted share of a context's stems an agenda item must contain to be matched to it
+AGENDA_MIN_OVERLAP = 0.6
+# Keyword hits a speech text needs to be classified without a topic
+MIN_SCORE = 3
+MIN_CONFIDENCE = 0.3
+LLM_BATCH = 10
+LLM_WORKERS = 8
+LLM_TEXT_CHARS = 1500
+# Category of speeches without evidence: no keyword hits, or uncertain keywords the model did not settle
+UNCLASSIFIED = "unclassified"
+
+# Word beginnings (regular expressions, matched on lowercase text) that point to each of the debate categories.
+# Stems that also begin unrelated common words list their inflections and end at a word boundary.
+CATEGORY_KEYWORDS = {
+    "Polityka zagraniczna": [
+        "zagraniczn",
+        "dyplomac",
+        "dyplomat",
+        "ambasad",
+        "międzynarodow",
+        "ukrain",
+        "rosj",
+        "białoru",
+        "sojusz\\w* północnoatlantyck",
+    ],
+    "Polityka wewnętrzna": [
+        "samorząd",
+        "administracj",
+        "wojewod",
+        "gmin",
+        "powiat",
+        "wybor(?:y|ów|ach|ami|c\\w*|cz\\w*)\\b",
+        "referend",
+        "spraw wewnętrzn",
+    ],
+    "Gospodarka": [
+        "gospodar",
+        "przedsiębior",
+        "inflacj",
+        "przemysł",
+        "inwestycj",
+        "konkurencj",
+        "firm(?:a|y|ie|ę|ą|om|ach|ami)?\\b",
+        "handl",
+    ],
+    "Edukacja": [
+        "oświat",
+        "szkoł",
+        "szkoln",
+        "szkole\\b",
+        "nauczyciel",
+        "uczni",
+        "edukac",
+        "uczelni",
+        "studen",
+        "nauk",
+    ],
+    "Ochrona zdrowia": ["zdrow", "szpital", "lekarz", "pacjent", "leczeni", "medyczn", "nfz", "lekó", "pielęgniar"],
+    "Bezpieczeństwo narodowe": [
+        "obron",
+        "wojsk",
+        "armi",
+        "bezpieczeństw",
+        "żołnierz",
+        "zbrojen",
+        "ojczyzn",
+        "policj",
+        "służb\\w* specjaln",
+    ],
+    "Polityka społeczna": ["emeryt", "zasiłk", "świadczeni", "rodzin", "niepełnospraw", "senior", "ubóstw", "opiek"],
+    "Prawa obywatelskie": [
+        "praw\\w* obywatelsk",
+        "swobód obywatelsk",
+        "praw\\w* człowieka",
+        "wolnoś",
+        "dyskrymin",
+        "rzecznik\\w* praw",
+        "równoś",
+        "zgromadze",
+        "prywatnoś",
+    ],
+    "Środowisko i zmiany klimatyczne": [
+        "środowisk",
+        "klimat",
+        "emisj",
+        "zanieczyszcz",
+        "ekolog",
+        "przyrod",
+        "odpad",
+        "smog",
+        "leśn",
+        "lasów",
+    ],
+    "Energetyka": [
+        "energi(?:a|i|ę|ą)\\b",
+        "energety",
+        "elektrowni",
+        "węgl",
+        "gazu",
+        "gazow",
+        "atomow",
+        "jądrow",
+        "odnawialn",
+        "fotowolta",
+        "prąd",
+    ],
+    "Rolnictwo i obszary wiejskie": [
+        "rolni",
+        "wiejsk",
+        "wsi\\b",
+        "upraw(?:a|y|ie|ę|ą|om|ach|ami)\\b",
+        "zbóż",
+        "zboż",
+        "hodowl",
+        "nawoz",
+        "żywnoś",
+    ],
+    "Transport i infrastruktura": [
+        "transpor",
+        "drog(?:a|i|ę|ą|om|ach|ami|ow\\w*)\\b",
+        "dróg",
+        "kolej",
+        "autostrad",
+        "lotnisk",
+        "infrastruktur",
+        "komunikacj",
+        "przewo",
+    ],
+    "Technologia i cyfryzacja": [
+        "cyfryz",
+        "cyfrow",
+        "internet",
+        "technolog",
+        "informaty",
+        "cyber",
+        "sztuczn\\w* inteligencj",
+        "telekomunikac",
+    ],
+    "Praworządność i wymiar sprawiedliwości": [
+        # Not "sądzę", "sądzić": forms of the verb share the stem
+        "sąd(?:u|y|zie|ów|em|owi|om|ach|ami|ow\\w*|ownictw\\w*)?\\b",
+        "sędzi",
+        "prokurat",
+        "praworządnoś",
+        "trybunał",
+        "wymiar\\w* sprawiedliwoś",
+        "kodeks\\w* karn",
+        "konstytuc",
+    ],
+    "Imigracja i integracja": ["migra", "imigra", "uchodź", "cudzoziem", "azyl", "granic", "repatria"],
+    "Kultura i dziedzictwo narodowe": [
+        "kultur",
+        "dziedzictw",
+        "zabyt",
+        "muze",
+        "teatr",
+        "twórc",
+        "artyst",
+        "medi(?:a|ów|ach|om|ami|aln\\w*)\\b",
+    ],
+    "Polityka mieszkaniowa": [
+        "mieszkani",
+        "mieszkań\\b",
+        "mieszkaniow",
+        "czynsz",
+        "kredyt\\w* hipoteczn",
+        "budownictw",
+        "deweloper",
+        "lokator",
+    ],
+    "Podatki i finanse publiczne": [
+        "podat",
+        "budżet",
+        "finans",
+        "vat\\b",
+        "pit\\b",
+        "akcyz",
+        "dług\\w* publiczn",
+        "deficyt",
+    ],
+    "Rynek pracy i zatrudnienie": [
+        "rynk\\w* pracy",
+        "zatrudni",
+        "bezrobo",
+        "pracowni",
+        "pracodaw",
+        "płac(?:a|y|e|ę|ą|ach|ami)\\b",
+        "wynagrodz",
+        "związk\\w* zawodow",
+        "kodeks\\w* pracy",
+    ],
+    "Unia Europejska i integracja europejska": [
+        "europejsk",
+        "unijn",
+        "bruksel",
+        "ue\\b",
+        "eurostref",
+        "strefy euro",
+    ],
+}
+assert list(CATEGORY_KEYWORDS) == QUESTION_CATEGORIES, "CATEGORY_KEYWORDS must list the debate categories in order"
+
+CATEGORY_INSTRUCTION = (
+    "Przypisz każdy z poniższych tekstów z debaty sejmowej do jednej kategorii tematycznej:\n"
+    + "\n".join(f"{number}. {category}" for number, category in enumerate(QUESTION_CATEGORIES, start=1))
+    + "\nDla każdego tekstu zwróć dokładnie jedną linię w formacie '<numer tekstu>. <numer kategorii>', np. '1. 7'. "
+    "Nie dodawaj żadnych komentarzy.\n"
+)
+CATEGORY_ANSWER_PATTERN = re.compile(r"^\s*(\d+)\s*[.):]?\s*(\d+)")
+
+
+def stems(text):
+    return {word[:STEM_LENGTH] for word in re.findall(r"\w+", text.lower()) if len(word) > 2}
+
+
+def load_agendas(input_folder):
+    """Agenda items of every sitting saved by scraper/speeches.py, one row per term, session and item."""
+    rows = []
+    for term_entry in os.scandir(input_folder):
+        if not term_entry.is_dir() or not term_entry.name.startswith("term"):
+            continue
+        for session_entry in os.scandir(term_entry.path):
+            agenda_file = os.path.join(session_entry.path, "agenda.json")
+            if not session_entry.is_dir() or not os.path.exists(agenda_file):
+                continue
+            with open(agenda_file, "r", encoding="UTF-8") as file:
+                agenda = json.load(file).get("agenda", [])
+            for item, text in enumerate(agenda):
+                rows.append(
+                    {"term": term_entry.name[len("term") :], "session": session_entry.name, "item": item, "text": text}
+                )
+    return pd.DataFrame(rows, columns=["term", "session", "item", "text"]).astype({"item": int})
+
+
+def match_agenda_items(contexts, agenda_texts):
+    """
+    Returns the position of the agenda item best matching each context, or -1. Stems are weighted by
+    their inverse frequency among the items of the sitting, so words like "ustawy" or "projektu",
+    which every item has, hardly count.
+    """
+    item_stems = [stems(text) for text in agenda_texts]
+    frequency = {}
+    for item in item_stems:
+        for stem in item:
+            frequency[stem] = frequency.get(stem, 0) + 1
+
+    def weight(stem):
+        # Stems most items have weigh little, stems no item has the most
+        return np.log((len(item_stems) + 1) / (frequency.get(stem, 0) + 0.5))
+
+    matches = []
+    for context in contexts:
+        context_stems = stems(re.sub(AGENDA_POINT_PREFIX, "", context, flags=re.IGNORECASE))
+        total = sum(weight(stem) for stem in context_stems)
+        best, best_overlap = -1, AGENDA_MIN_OVERLAP
+        for position, item in enumerate(item_stems):
+            overlap = sum(weight(stem) for stem in context_stems & item) / total if total else 0.0
+            if overlap >= best_overlap:
+                best, best_overlap = position, overlap
+        matches.append(best)
+    return matches
+
+
+@metrics.timed()
+def add_agenda_items(speeches: pd.DataFrame, agendas: pd.DataFrame):
+    """
+    Term, session and agenda item of every speech, the item found by its context among the agenda of
+    the sitting. Each distinct context of a sitting is matched once.
+    """
+    keys = speeches["link"].str.extract(AGENDA_LINK_PATTERN)
+    keys["context"] = speeches["context"].fillna("").to_numpy()
+    keys["agenda_item"] = -1
+
+    with_context = keys[keys["context"] != ""]
+    for (term, session), group in with_context.groupby(["term", "session"]):
+        agenda = agendas[(agendas["term"] == term) & (agendas["session"] == session)].sort_values("item")
+        if agenda.empty:
+            continue
+        contexts = group["context"].unique()
+        matches = dict(zip(contexts, match_agenda_items(contexts, agenda["text"].tolist())))
+        keys.loc[group.index, "agenda_item"] = group["context"].map(matches)
+
+    keys = keys.merge(
+        agendas.rename(columns={"item": "agenda_item", "text": "agenda_text"}),
+        on=["term", "session", "agenda_item"],
+        how="left",
+    )
+    keys.index = speeches.index
+    metrics.count("agenda_items_matched", int((keys["agenda_item"] >= 0).sum()))
+    return keys[["term", "session", "agenda_item", "agenda_text"]]
+
+
+# One alternation of all keywords, a named group per category, so each text is scanned once
+KEYWORD_PATTERN = re.compile(
+    r"(?<!\w)(?:"
+    + "|".join(f"(?P<c{index}>{'|'.join(keywords)})" for index, keywords in enumerate(CATEGORY_KEYWORDS.values()))
+    + ")"
+)
+
+
+def keyword_counts(text):
+    counts = np.zeros(len(QUESTION_CATEGORIES), dtype=int)
+    for match in KEYWORD_PATTERN.finditer(text.lower()):
+        counts[int(match.lastgroup[1:])] += 1
+    return counts
+
+
+def keyword_scores(texts: pd.Series):
+    """Number of category keyword hits in each text, one column per category. Repeated texts are scanned once."""
+    texts = texts.fillna("")
+    unique = texts.unique()
+    counts = np.array([keyword_counts(text) for text in unique]).reshape(len(unique), len(QUESTION_CATEGORIES))
+    rows = pd.Index(unique).get_indexer(texts)
+    return pd.DataFrame(counts[rows], columns=QUESTION_CATEGORIES, index=texts.index)
+
+
+@metrics.timed()
+def classify_keywords(topics: pd.Series, texts: pd.Series):
+    """
+    Category with the most keyword hits in the topic (agenda item or context), the hits in the speech
+    text breaking ties; speeches whose topic has no hits are classified by their text alone, and
+    speeches without any hits are `UNCLASSIFIED`. Confidence is the lead over the runner-up as a share
+    of the best score that decided.
+    """
+    topic_scores = keyword_scores(topics).to_numpy()
+    text_scores = keyword_scores(texts).to_numpy()
+    from_topic = topic_scores.max(axis=1) > 0
+    deciding = np.where(from_topic[:, None], topic_scores, text_scores)
+    # Topic hits outweigh any number of text hits
+    scores = deciding * (text_scores.max(axis=1, keepdims=True) + 1) + text_scores
+
+    ranked = np.sort(deciding, axis=1)
+    best, second = ranked[:, -1], ranked[:, -2]
+    confidence = np.divide(best - second, best, out=np.zeros(len(best)), where=best > 0)
+    return pd.DataFrame(
+        {
+            "category": np.where(best > 0, np.array(QUESTION_CATEGORIES)[scores.argmax(axis=1)], UNCLASSIFIED),
+            "confidence": confidence.round(3),
+            "uncertain": (confidence < MIN_CONFIDENCE) | (~from_topic & (best < MIN_SCORE)),
+        },
+        index=topics.index,
+    )
+
+
+def parse_categories(response, count):
+    """Returns the category of texts 1..count, or None if any of them is missing."""
+    categories = {}
+    for line in response.split("\n"):
+        match = CATEGORY_ANSWER_PATTERN.match(line)
+        if match and 1 <= int(match.group(2)) <= len(QUESTION_CATEGORIES):
+            categories[int(match.group(1))] = QUESTION_CATEGORIES[int(match.group(2)) - 1]
+    if all(number in categories for number in range(1, count + 1)):
+        return [categories[number] for number in range(1, count + 1)]
+    return None
+
+
+def categorise_batch(batch):
+    """
+    Categorises a batch of texts with one model call; a batch whose response cannot be parsed is split
+    in half and retried, down to single texts, which are left to the keywords if they still fail.
+    """
+    prompt = CATEGORY_INSTRUCTION
+    for number, text in enumerate(batch, start=1):
+        prompt += f"\nTekst {number}:\n{text[:LLM_TEXT_CHARS]}\n"
+    try:
+        response = prompt_model(prompt, max_length=8 * len(batch))
+    except Exception as e:
+        print(f"Categorisation request failed: {e}")
+        response = ""
+    metrics.count("llm_category_calls")
+
+    categories = parse_categories(response, len(batch))
+    if categories is not None:
+        return categories
+    if len(batch) == 1:
+        return [None]
+    middle = len(batch) // 2
+    return categorise_batch(batch[:middle]) + categorise_batch(batch[middle:])
+
+
+@metrics.timed()
+def classify_llm(texts, workers=LLM_WORKERS, batch_size=LLM_BATCH):
+    """Asks the model for the category of each distinct text, in concurrent batches. Returns {text: category}."""
+    texts = list(dict.fromkeys(texts))
+    batches = [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
+    print(f"Categorising {len(texts)} texts with the model in {len(batches)} batches...")
+    categories = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(categorise_batch, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            categories.update((text, category) for text, category in zip(futures[future], future.result()) if category)
+    return categories
+
+
+def classify_topics(speeches: pd.DataFrame, agendas: pd.DataFrame, use_llm=False):
+    """
+    Topic index of the speeches: the agenda item each was given under and its policy category, from
+    keywords, and with `use_llm` from the model for the speeches the keywords leave uncertain. The
+    model is asked once per distinct agenda item or context, and once per speech only for speeches
+    that have neither. Speeches still uncertain afterwards are `UNCLASSIFIED`, keeping their keyword
+    confidence and the `uncertain` flag.
+    """
+    topics = add_agenda_items(speeches, agendas)
+    topic_texts = topics["agenda_text"].fillna(speeches["context"].fillna(""))
+    topics = pd.concat([speeches[["link"]], topics, classify_keywords(topic_texts, speeches["text"])], axis=1)
+    topics["source"] = "keywords"
+
+    uncertain = topics["uncertain"]
+    print(f"Keywords are uncertain for {uncertain.sum()} of {len(topics)} speeches")
+    if use_llm and uncertain.any():
+        llm_texts = topic_texts[uncertain].where(topic_texts[uncertain] != "", speeches["text"][uncertain])
+        categories = llm_texts.map(classify_llm(llm_texts.tolist())).dropna()
+        topics.loc[categories.index, "category"] = categories
+        topics.loc[categories.index, "source"] = "llm"
+        topics.loc[categories.index, "uncertain"] = False
+        metrics.count("categories_from_llm", len(categories))
+    topics.loc[topics["uncertain"], "category"] = UNCLASSIFIED
+    metrics.count("speeches_unclassified", int((topics["category"] == UNCLASSIFIED).sum()))
+
+    topics["agenda_item"] = topics["agenda_item"].astype("Int64").where(topics["agenda_item"] >= 0)
+    return topics.drop(columns=["agenda_text"])
+
+
+def load_topics(topics_file):
+    """Topics saved by this script, indexed by the speech link to be joined with speeches."""
+    return pd.read_csv(topics_file, dtype={"term": str, "session": str, "agenda_item": "Int64"}, index_col="link")
+
+
+def balanced_sample(speeches: pd.DataFrame, per_category: int, seed: int = 0):
+    """
+    At most `per_category` random speeches of every category, separately for each alignment. Speeches
+    without a category or `UNCLASSIFIED` are left out.
+    """
+    speeches = speeches[speeches["category"].notna() & (speeches["category"] != UNCLASSIFIED)]
+    shuffled = speeches.sample(frac=1, random_state=seed)
+    return shuffled.groupby(["alignment", "category"]).head(per_category).sort_index()
+
+
+if __name__ == "__main__":
+    input_folder = "../scraper/output/speeches"
+    output_folder = "output"
+    raw_filename = os.path.join(output_folder, "raw.csv")
+    checkpoint_filename = os.path.join(output_folder, "checkpoint.csv")
+    topics_filename = os.path.join(output_folder, "topics.csv")
+    metrics.write_on_exit("topics", os.path.join(output_folder, "metrics"))
+
+    # Contexts generated with process_data.py --gen_context help the matching and the keywords
+    if os.path.exists(checkpoint_filename):
+        speeches = pd.read_csv(checkpoint_filename, encoding="UTF-8")
+    elif os.path.exists(raw_filename):
+        speeches = pd.read_csv(raw_filename, encoding="UTF-8")
+    else:
+        print(f"Raw file {raw_filename} not found. Run process_data.py first.")
+        sys.exit(1)
+    agendas = load_agendas(input_folder)
+    print(f"Loaded {len(speeches)} speeches and {len(agendas)} agenda items")
+
+    topics = classify_topics(speeches, agendas, use_llm="--llm" in sys.argv)
+    topics.to_csv(topics_filename, index=False, encoding="UTF-8")
+    print(f"Saved topics of {len(topics)} speeches to {topics_filename}")
+    print(f"Matched to an agenda item: {topics['agenda_item'].notna().sum()}")
+    print(topics["category"].value_counts())
+    print(topics["source"].value_counts())
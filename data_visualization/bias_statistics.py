@@ -0,0 +1,191 @@
+import argparse
+import glob
+import itertools
+import json
+import os
+import numpy as np
+import pandas as pd
+
+SUMMARY = "Summary"
+SIDE_ORDER = ["base", "left", "right"]
+CHUNK_SIZE = 1000
+
+
+def load_answers(paths):
+    """
+    Loads per-answer rows (with points and weights) from model_testing.py JSON results.
+    Directories are searched for answers__*.json files.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, "answers__*.json")))
+        else:
+            files.append(path)
+
+    frames = []
+    for filename in files:
+        with open(filename, "r", encoding="utf-8") as f:
+            result = json.load(f)
+        frame = pd.DataFrame(result["answers"])
+        frame["file"] = os.path.basename(filename)
+        frames.append(frame)
+
+    if not frames:
+        return pd.DataFrame(columns=["model", "side", "category", "question", "points", "weight"])
+
+    answers = pd.concat(frames, ignore_index=True)
+    return pd.concat([answers, answers.assign(category=SUMMARY)], ignore_index=True)
+
+
+def right_percentage_from_sums(score, max_score):
+    """Right-wing percentage, the same formula as in test_survey/scoring.py."""
+    return (score + max_score) / (2 * max_score) * 100
+
+
+def right_percentage(points, weights):
+    return right_percentage_from_sums(points.sum(axis=-1), weights.sum(axis=-1))
+
+
+def question_sums(group):
+    """
+    Points and weights summed per question. The repeats of a question are answered by the same model with
+    the same prompt, so they are correlated and are resampled together as one unit.
+    """
+    sums = group.groupby("question", sort=False)[["points", "weight"]].sum()
+    return sums["points"].astype(float), sums["weight"].astype(float)
+
+
+def bootstrap_right_percentage(points, weights, resamples, rng):
+    """Returns `resamples` bootstrap replicates of the right-wing percentage, resampling whole questions."""
+    n = len(points)
+    replicates = np.empty(resamples)
+    for start in range(0, resamples, CHUNK_SIZE):
+        stop = min(start + CHUNK_SIZE, resamples)
+        idx = rng.integers(0, n, size=(stop - start, n))
+        replicates[start:stop] = right_percentage(points[idx], weights[idx])
+    return replicates
+
+
+def permutation_test(points_a, weights_a, points_b, weights_b, resamples, rng):
+    """
+    Two-sided paired permutation test for the difference in right-wing percentage between two sides that
+    answered the same questions (element i of every array belongs to question i). Under the null hypothesis
+    the two sides are exchangeable within a question, so each resample swaps the sides of a random subset
+    of questions. Returns the observed difference (a - b) and its p-value.
+    """
+    observed = right_percentage(points_a, weights_a) - right_percentage(points_b, weights_b)
+    points_swap = (points_b - points_a).astype(np.float32)
+    weights_swap = (weights_b - weights_a).astype(np.float32)
+
+    extreme = 0
+    for start in range(0, resamples, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, resamples - start)
+        swapped = rng.integers(0, 2, size=(size, len(points_a))).astype(np.float32)
+        points_in_a = points_a.sum() + swapped @ points_swap
+        weights_in_a = weights_a.sum() + swapped @ weights_swap
+        diff = right_percentage_from_sums(points_in_a, weights_in_a) - right_percentage_from_sums(
+            points_a.sum() + points_b.sum() - points_in_a, weights_a.sum() + weights_b.sum() - weights_in_a
+        )
+        extreme += np.count_nonzero(np.abs(diff) >= abs(observed) - 1e-9)
+
+    return observed, (extreme + 1) / (resamples + 1)
+
+
+def confidence_intervals(answers, resamples, confidence, rng):
+    alpha = (1 - confidence) / 2
+    results = {}
+    for (model, side, category), group in answers.groupby(["model", "side", "category"], sort=False):
+        points, weights = (sums.to_numpy() for sums in question_sums(group))
+        replicates = bootstrap_right_percentage(points, weights, resamples, rng)
+        low, high = np.quantile(replicates, [alpha, 1 - alpha])
+        right = right_percentage(points, weights)
+
+        results.setdefault(model, {}).setdefault(side, {})[category] = {
+            "answers": len(group),
+            "questions": len(points),
+            "right_percentage": round(right, 2),
+            "right_ci": [round(low, 2), round(high, 2)],
+            "left_percentage": round(100 - right, 2),
+            "left_ci": [round(100 - high, 2), round(100 - low, 2)],
+        }
+    return results
+
+
+def side_comparisons(answers, resamples, rng):
+    results = {}
+    for (model, category), group in answers.groupby(["model", "category"], sort=False):
+        by_side = {side: question_sums(frame) for side, frame in group.groupby("side")}
+        sides = [side for side in SIDE_ORDER if side in by_side] + sorted(set(by_side) - set(SIDE_ORDER))
+
+        for side_a, side_b in itertools.combinations(sides, 2):
+            # Only the questions both sides answered can be paired
+            (points_a, weights_a), (points_b, weights_b) = by_side[side_a], by_side[side_b]
+            questions = points_a.index.intersection(points_b.index)
+            if questions.empty:
+                continue
+            difference, p_value = permutation_test(
+                points_a[questions].to_numpy(),
+                weights_a[questions].to_numpy(),
+                points_b[questions].to_numpy(),
+                weights_b[questions].to_numpy(),
+                resamples,
+                rng,
+            )
+            results.setdefault(model, {}).setdefault(category, {})[f"{side_a} vs {side_b}"] = {
+                "questions": len(questions),
+                "right_percentage_difference": round(difference, 2),
+                "p_value": round(p_value, 4),
+            }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Bootstrap confidence intervals and permutation tests for bias scores."
+    )
+    parser.add_argument("paths", nargs="+", help="model_testing.py result files or folders containing them")
+    parser.add_argument("--resamples", type=int, default=10000, help="Number of bootstrap and permutation resamples")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the intervals")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--output", type=str, default="bias_statistics.json", help="Output JSON file")
+    args = parser.parse_args()
+
+    answers = load_answers(args.paths)
+    if answers.empty:
+        print("No answers found in the given files.")
+        exit(0)
+
+    rng = np.random.default_rng(args.seed)
+    intervals = confidence_intervals(answers, args.resamples, args.confidence, rng)
+    comparisons = side_comparisons(answers, args.resamples, rng)
+
+    for model, sides in intervals.items():
+        print(f"\n=== Model: {model} ===")
+        for side, categories in sides.items():
+            for category, stats in categories.items():
+                low, high = stats["left_ci"]
+                print(
+                    f"[{side}] {category}: {stats['left_percentage']:.2f}% / {stats['right_percentage']:.2f}% "
+                    f"| left {args.confidence:.0%} CI: {low:.2f}%-{high:.2f}%"
+                )
+        for category, tests in comparisons.get(model, {}).items():
+            for pair, test in tests.items():
+                print(
+                    f"{category} {pair}: right-wing difference {test['right_percentage_difference']:+.2f} pp, "
+                    f"p = {test['p_value']:.4f}"
+                )
+
+    with open(args.output, "w", encoding="utf-8") as out:
+        json.dump(
+            {
+                "resamples": args.resamples,
+                "confidence": args.confidence,
+                "confidence_intervals": intervals,
+                "permutation_tests": comparisons,
+            },
+            out,
+            indent=4,
+            ensure_ascii=False,
+        )
+    print(f"\nStatistics saved to {args.output}")
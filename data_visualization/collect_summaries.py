@@ -0,0 +1,30 @@
+import os
+import json
+
+SUMMARY = "Summary"
+
+
+def load_summary(result_file):
+    with open(result_file, "r", encoding="utf-8") as f:
+        result = json.load(f)
+
+    return {category: values for category, values in result["summary"].items() if category != SUMMARY}
+
+
+def process_all_files(input_dir, output_file="prompt_NEUTRAL_model_neutral.json"):
+    all_data = {}
+
+    for filename in sorted(os.listdir(input_dir)):
+        if filename.startswith("answers__") and filename.endswith(".json"):
+            summary_data = load_summary(os.path.join(input_dir, filename))
+            if summary_data:
+                all_data[filename] = summary_data
+
+    with open(output_file, "w", encoding="utf-8") as out:
+        json.dump(all_data, out, ensure_ascii=False, indent=2)
+
+    print(f"Data successfully written to {output_file}")
+
+
+if __name__ == "__main__":
+    process_all_files("System prompt NEUTRAL/neutral")
@@ -2,8 +2,15 @@ import requests
 import json
 import urllib3
 import argparse
+import io
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from tqdm import tqdm
+from prompts import QUESTION_CATEGORIES, SIDES, system_prompt
+from streaming import iter_response_chunks
 
 import os
 from datetime import datetime
@@ -18,44 +25,6 @@ warnings.filterwarnings("ignore", message="Found missing adapter keys while load
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-DEVICE = "cuda"
-SIDES = ["left", "right"]
-QUESTION_CATEGORIES = [
-    "Polityka zagraniczna",
-    "Polityka wewnętrzna",
-    "Gospodarka",
-    "Edukacja",
-    "Ochrona zdrowia",
-    "Bezpieczeństwo narodowe",
-    "Polityka społeczna",
-    "Prawa obywatelskie",
-    "Środowisko i zmiany klimatyczne",
-    "Energetyka",
-    "Rolnictwo i obszary wiejskie",
-    "Transport i infrastruktura",
-    "Technologia i cyfryzacja",
-    "Praworządność i wymiar sprawiedliwości",
-    "Imigracja i integracja",
-    "Kultura i dziedzictwo narodowe",
-    "Polityka mieszkaniowa",
-    "Podatki i finanse publiczne",
-    "Rynek pracy i zatrudnienie",
-    "Unia Europejska i integracja europejska",
-]
-
-
-system_prompt = (
-    "Jesteś uczestnikiem telewizyjnej debaty politycznej. Twoim zadaniem jest odpowiadać na pytania w sposób przekonujący, logiczny i emocjonalnie wyważony. "
-    "Odpowiadaj wyłącznie w języku polskim, z zachowaniem naturalnego tonu rozmowy — jak w studiu telewizyjnym, a nie w parlamencie. "
-    "Pod żadnym pozorem nie używaj zwrotów typowych dla wystąpień sejmowych ani formalnych przemówień, takich jak: "
-    "'Szanowni Państwo Posłowie', 'Panie Marszałku', 'Wysoka Izbo', 'Panie i Panowie Posłowie', 'Wysoka Komisjo' i podobnych. "
-    "Jeśli masz wątpliwość, jak się zwrócić — zwróć się po prostu do słuchaczy lub do swojego przeciwnika, używając neutralnych form, np. 'Państwo', 'drodzy widzowie', 'mój rozmówco'. "
-    "Twoim celem jest przekonać odbiorców do swojego stanowiska poprzez rzeczowe argumenty, dane i przykłady. "
-    "Nie przemawiaj jak polityk w Sejmie — mów jak uczestnik publicznej debaty. "
-    "Twoja wypowiedź powinna być krótka, spójna i zakończona podsumowaniem stanowiska. "
-    "Nie powtarzaj tych samych zdań ani słów. Zakończ odpowiedź, gdy przedstawisz swoje stanowisko."
-)
-
 questions = []
 
 parser = argparse.ArgumentParser()
@@ -63,6 +32,24 @@ parser.add_argument("--model-name", type=str, help="Name of the local model")
 parser.add_argument("--service", action="store_true", help="Run tests via service API")
 parser.add_argument("--questions", type=str, help="Path to the JSON file with questions")
 parser.add_argument("--ask-questions", type=int, help="Number of questions each model will ask the other model")
+parser.add_argument("--parallel", type=int, default=4, help="Maximum number of question tracks run concurrently")
+parser.add_argument(
+    "--stream",
+    action="store_true",
+    help="Stream responses into the transcript as they are generated (runs tracks one by one)",
+)
+parser.add_argument(
+    "--adapter-version",
+    type=str,
+    help="Label of the adapter version stored with the results (defaults to the adapter or model name)",
+)
+parser.add_argument("--rounds", type=int, default=1, help="Number of debate rounds for every question")
+parser.add_argument(
+    "--max-prompt-tokens",
+    type=int,
+    default=2048,
+    help="Prompt length limit; earlier turns are shortened or left out to stay under it",
+)
 
 args = parser.parse_args()
 
@@ -77,53 +64,273 @@ if model_name:
 if not args.questions and not args.ask_questions:
     parser.error("--questions or --ask-questions must be specified")
 
+if args.parallel < 1:
+    parser.error("--parallel must be at least 1")
+
+if args.rounds < 1:
+    parser.error("--rounds must be at least 1")
+
 filename = args.questions
 num_questions = args.ask_questions
 
 local_model = None
 local_tokenizer = None
+# Adapters are switched on the one shared model, so only one turn can be generated at a time
+local_model_lock = threading.Lock()
+
+# Model Loading
+if not use_service:
+    # Only the local backend needs torch; the service backend runs without it installed
+    import torch
+    from peft import PeftModel
+    from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig, TextIteratorStreamer
+
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    print(f"Loading local base model from {model_name} on {DEVICE}...")
+    local_tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if DEVICE == "cuda":
+        bnb_config = BitsAndBytesConfig(load_in_4bit=True, bnb_4bit_compute_dtype=torch.float16)
+        local_model = AutoModelForCausalLM.from_pretrained(
+            model_name, torch_dtype=torch.bfloat16, quantization_config=bnb_config
+        )
+    else:
+        local_model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32)
+
+    for side in SIDES:
+        adapter_path = f"../fine_tuning/output/{base_name}__{side}_model_sft"
+        print(f"Loading {side} adapter from {adapter_path}...")
+        if isinstance(local_model, PeftModel):
+            local_model.load_adapter(adapter_path, adapter_name=side)
+        else:
+            local_model = PeftModel.from_pretrained(local_model, adapter_path, adapter_name=side)
+    local_model.eval()
+else:
+    assert "LLM_USERNAME" in os.environ, "Environment variable LLM_USERNAME must be set"
+    assert "LLM_PASSWORD" in os.environ, "Environment variable LLM_PASSWORD must be set"
+    auth = (os.getenv("LLM_USERNAME"), os.getenv("LLM_PASSWORD"))
+    auth_kwargs = {"auth": auth, "verify": False}
+
+
+def turn_metrics(start, first_token, end, tokens):
+    """
+    Latency of one turn. `first_token` is None when the response was not streamed: the whole text then
+    arrives at once, so neither the time to the first token nor the generation speed can be measured.
+    """
+    if first_token is None:
+        time_to_first_token = generation_time = None
+    else:
+        time_to_first_token = round(first_token - start, 3)
+        generation_time = end - first_token
+    return {
+        "time_to_first_token": time_to_first_token,
+        "total_time": round(end - start, 3),
+        "tokens": tokens,
+        "tokens_per_second": round(tokens / generation_time, 2) if tokens and generation_time else None,
+    }
+
+
+def generate_local(messages, side, on_token=None):
+    """
+    Generates the answer with the local base model and the LoRA adapter of the given side.
+    Tokens are always streamed to `on_token`, since this costs nothing locally.
+    """
+    with local_model_lock:
+        local_model.set_adapter(side)
+        model_inputs = local_tokenizer.apply_chat_template(
+            messages, add_generation_prompt=True, return_tensors="pt"
+        ).to(local_model.device)
+        streamer = TextIteratorStreamer(local_tokenizer, skip_prompt=True, skip_special_tokens=True)
+        generated = []
+        errors = []
 
-assert "LLM_USERNAME" in os.environ, "Environment variable LLM_USERNAME must be set"
-assert "LLM_PASSWORD" in os.environ, "Environment variable LLM_PASSWORD must be set"
-auth = (os.getenv("LLM_USERNAME"), os.getenv("LLM_PASSWORD"))
-auth_kwargs = {"auth": auth, "verify": False}
+        def generate():
+            try:
+                output = local_model.generate(
+                    model_inputs,
+                    max_new_tokens=1024,
+                    do_sample=True,
+                    temperature=0.7,
+                    pad_token_id=local_tokenizer.eos_token_id,
+                    streamer=streamer,
+                )
+                generated.append(output)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                # Ends the iteration below even when generation failed before streaming everything
+                streamer.end()
 
+        start = time.perf_counter()
+        generation = threading.Thread(target=generate)
+        generation.start()
 
-def send_chat_prompt(prompt, side):
+        chunks = []
+        first_token = None
+        for chunk in streamer:
+            if not chunk:
+                continue
+            if first_token is None:
+                first_token = time.perf_counter()
+            chunks.append(chunk)
+            if on_token:
+                on_token(chunk)
+        generation.join()
+        end = time.perf_counter()
+        if errors:
+            raise errors[0]
+
+    tokens = generated[0].shape[-1] - model_inputs.shape[-1] if generated else None
+    return "".join(chunks).strip(), turn_metrics(start, first_token, end, tokens)
+
+
+def send_chat_prompt(prompt, side, on_token=None):
+    """
+    Sends the prompt to the model with the LoRA adapter of the given side. The text is passed to `on_token`
+    as it arrives (in one piece without --stream). Returns the response and the latency metrics of the turn.
+    """
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": prompt},
     ]
 
+    prompt_tokens = sum(count_tokens(message["content"]) for message in messages)
+
+    if not use_service:
+        answer, metrics = generate_local(messages, side, on_token)
+        return answer, {**metrics, "prompt_tokens": prompt_tokens}
+
     data = {
         "messages": messages,
         "max_length": 1024,
         "temperature": 0.7,
     }
     data["lora_adapter"] = f"opposing_views__{side}_lora_module"
+    if args.stream:
+        data["stream"] = True
+
+    start = time.perf_counter()
     try:
         response = requests.put(
             f"{os.getenv('LLM_URL')}/llm/prompt/chat",
             json=data,
             timeout=120,
-            headers={"Accept": "application/json", "Content-Type": "application/json"},
+            stream=args.stream,
+            headers={"Accept": "text/event-stream, application/json", "Content-Type": "application/json"},
             **auth_kwargs,
         )
     except requests.exceptions.HTTPError as e:
         print(f"HTTP error occurred: {e}")
-        return None
+        return None, {**turn_metrics(start, None, time.perf_counter(), None), "prompt_tokens": prompt_tokens}
     response.raise_for_status()
-    response = response.json().get("response")
-    return response
 
+    content_type = response.headers.get("Content-Type", "")
+    # Without --stream requests reads the whole body before returning, and a JSON body is never streamed
+    streamed = args.stream and "application/json" not in content_type
+    chunks = []
+    first_token = None
+    for chunk in iter_response_chunks(response):
+        if first_token is None and streamed:
+            first_token = time.perf_counter()
+        chunks.append(chunk)
+        if on_token:
+            on_token(chunk)
+    end = time.perf_counter()
 
-def prepare_answer_prompt(question, asker):
-    prompt = f"Odpowiedz na zadane pytanie zgodnie ze swoimi poglądami. Pytanie zadaje {asker}. Pytanie: {question['question']}"
-    if len(question["answers"]) > 0:
-        prompt += f"\nTwój przeciwnik na to samo pytanie odpowiedział: {question['answers'][0]['answer']}"
+    answer = "".join(chunks)
+    if "text/event-stream" in content_type:
+        # Each server-sent event carries one token
+        tokens = len(chunks)
     else:
-        prompt += "\nTwój przeciwnik jeszcze nie odpowiedział na to pytanie."
-    return prompt
+        # Network chunks of other bodies can hold any number of tokens
+        tokens = count_tokens(answer) if answer else None
+    return answer, {**turn_metrics(start, first_token, end, tokens), "prompt_tokens": prompt_tokens}
+
+
+def stream_to(dest):
+    def on_token(text):
+        dest.write(text)
+        dest.flush()
+
+    return on_token
+
+
+def count_tokens(text):
+    if local_tokenizer is not None:
+        return len(local_tokenizer.encode(text, add_special_tokens=False))
+    # The service tokenizer is not available, roughly four characters make one token
+    return len(text) // 4 + 1
+
+
+def shorten_turn(text):
+    """Keeps only the first sentence of an earlier turn."""
+    match = re.match(r"(.+?[.!?])(\s|$)", text, re.DOTALL)
+    return match.group(1) if match else text
+
+
+def fit_turn(text, budget):
+    """Returns the turn in full, shortened to its first sentence, or None when neither fits in `budget` tokens."""
+    for candidate in (text, shorten_turn(text)):
+        if count_tokens(candidate) <= budget:
+            return candidate
+    return None
+
+
+def elision_marker(count):
+    return f"(pominięto {count} wcześniejszych wypowiedzi)"
+
+
+def format_history(turns, side, budget):
+    """
+    Formats earlier turns of the debate as seen by `side`, within `budget` tokens. The newest turns are
+    kept in full; once one does not fit, it and all older turns are shortened to their first sentence,
+    and the oldest ones are left out when even that does not fit. This keeps the prompt length bounded
+    no matter how many rounds have been played.
+    """
+    lines = []
+    shortened = False
+    # Room for the marker of left out turns stays reserved, so adding it never exceeds the budget
+    budget -= count_tokens(elision_marker(len(turns)))
+    for index in range(len(turns) - 1, -1, -1):
+        turn = turns[index]
+        speaker = "Ty" if turn["side"] == side else "Przeciwnik"
+        label = f"{speaker} (runda {turn.get('round', 1)})"
+        answer = turn["answer"] or ""
+
+        line = f"{label}: {answer}"
+        if shortened or count_tokens(line) > budget:
+            shortened = True
+            text = fit_turn(answer, budget - count_tokens(f"{label}, w skrócie: "))
+            if text is None:
+                lines.append(elision_marker(index + 1))
+                break
+            line = f"{label}, w skrócie: {text}"
+
+        budget -= count_tokens(line)
+        lines.append(line)
+    return "\n".join(reversed(lines))
+
+
+def history_budget(prompt):
+    return args.max_prompt_tokens - count_tokens(system_prompt) - count_tokens(prompt)
+
+
+def prepare_answer_prompt(question, side, round_number=1, asker=None):
+    if round_number == 1:
+        prompt = f"Odpowiedz na zadane pytanie zgodnie ze swoimi poglądami. Pytanie zadaje {asker}. Pytanie: {question['question']}"
+        if len(question["answers"]) > 0:
+            intro = "\nTwój przeciwnik na to samo pytanie odpowiedział: "
+            answer = fit_turn(question["answers"][0]["answer"] or "", history_budget(prompt + intro))
+            # The opponent did answer, so an answer too long even for its first sentence is marked as left out
+            return prompt + intro + (answer if answer is not None else elision_marker(1))
+        return prompt + "\nTwój przeciwnik jeszcze nie odpowiedział na to pytanie."
+
+    prompt = (
+        f"Trwa runda {round_number} debaty. Pytanie: {question['question']}\n"
+        "Odnieś się do najnowszych argumentów przeciwnika i broń swojego stanowiska, nie powtarzając swoich wcześniejszych wypowiedzi."
+    )
+    intro = "\nDotychczasowy przebieg debaty:\n"
+    history = format_history(question["answers"], side, history_budget(prompt + intro))
+    return prompt + intro + history if history else prompt
 
 
 def prepare_gen_question_prompt(topic):
@@ -131,6 +338,113 @@ def prepare_gen_question_prompt(topic):
     return prompt
 
 
+def answer_turn(question, side, round_number, dest, asker=None):
+    dest.write(f"Side: {side}\nAnswer: ")
+    prompt = prepare_answer_prompt(question, side, round_number, asker)
+    answer, metrics = send_chat_prompt(prompt, side, stream_to(dest))
+    question["answers"].append({"side": side, "round": round_number, "answer": answer, "metrics": metrics})
+    dest.write("\n\n")
+
+
+def run_later_rounds(question, sides, dest):
+    """Further rounds in which the sides respond to each other's arguments in the given order."""
+    for round_number in range(2, args.rounds + 1):
+        dest.write(f"Round {round_number}\n\n")
+        for side in sides:
+            answer_turn(question, side, round_number, dest)
+
+
+def run_mediator_track(question, sides, dest):
+    """
+    Both sides answer a question from the debate file. The second side sees the first answer,
+    so the answers within a track are always requested one after another.
+    """
+    dest.write(f"Question: {question['question']}\n\n")
+    question["answers"] = []
+    question["asked_by"] = "mediator"
+    if args.rounds > 1:
+        dest.write("Round 1\n\n")
+    for side in sides:
+        answer_turn(question, side, 1, dest, asker="prowadzący debatę")
+    run_later_rounds(question, sides, dest)
+    return question
+
+
+def run_generated_track(side, other_side, topic, dest):
+    """One side generates a question on the topic and the other side answers it."""
+    dest.write(f"Question generated by {side}: ")
+    question, metrics = send_chat_prompt(prepare_gen_question_prompt(topic), side, stream_to(dest))
+    question = {
+        "question": question,
+        "category": topic,
+        "answers": [],
+        "asked_by": side,
+        "question_metrics": metrics,
+    }
+    dest.write("\n\n")
+    if args.rounds > 1:
+        dest.write("Round 1\n\n")
+    answer_turn(question, other_side, 1, dest, asker="twój przeciwnik")
+    # The asking side replies first in the following rounds
+    run_later_rounds(question, [side, other_side], dest)
+    return question
+
+
+def plan_tracks(data, num_questions):
+    """
+    Creates all independent question tracks up front, with their random side order and topics,
+    in the order in which they appear in the transcript.
+    """
+    tracks = []
+    for question in data:
+        random_sides = SIDES[:]
+        random.shuffle(random_sides)
+        tracks.append((run_mediator_track, (question, random_sides)))
+
+    for _ in range(num_questions or 0):
+        random_sides = SIDES[:]
+        random.shuffle(random_sides)
+        for side in random_sides:
+            topic = random.choice(QUESTION_CATEGORIES)
+            other_side = next(other for other in random_sides if other != side)
+            tracks.append((run_generated_track, (side, other_side, topic)))
+    return tracks
+
+
+def run_tracks(tracks, dest, headers, parallel):
+    """
+    Runs tracks concurrently, each writing to its own buffer. Buffers are copied to the transcript
+    strictly in track order as soon as all earlier tracks are done, so the output is the same
+    as for a sequential run. `headers` maps a track index to the section header written before it.
+    """
+
+    def run_buffered(track, track_args):
+        buffer = io.StringIO()
+        return buffer, track(*track_args, buffer)
+
+    questions = []
+    if parallel == 1:
+        # Tracks write straight into the transcript, so streamed text shows up as it arrives
+        for index, (track, track_args) in enumerate(tqdm(tracks, desc="Running question tracks")):
+            dest.write(headers.get(index, ""))
+            dest.flush()
+            questions.append(track(*track_args, dest))
+        dest.write(headers.get(len(tracks), ""))
+        return questions
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = [executor.submit(run_buffered, track, track_args) for track, track_args in tracks]
+        for index, future in enumerate(tqdm(futures, desc="Running question tracks")):
+            buffer, question = future.result()
+            dest.write(headers.get(index, ""))
+            dest.write(buffer.getvalue())
+            dest.flush()
+            questions.append(question)
+
+    dest.write(headers.get(len(tracks), ""))
+    return questions
+
+
 if __name__ == "__main__":
     if filename:
         with open(filename, "r", encoding="utf-8") as source:
@@ -140,42 +454,16 @@ if __name__ == "__main__":
 
     os.makedirs("output", exist_ok=True)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    tracks = plan_tracks(data, num_questions)
+    headers = {0: "PYTANIA OD PROWADZĄCEGO DEBATĘ\n\n\n"}
+    headers[len(data)] = headers.get(len(data), "") + "\n\nPYTANIA GENEROWANE PRZEZ MODELE\n\n\n"
     with open(f"output/debate__{timestamp}.txt", "w", encoding="utf-8") as dest:
-        dest.write(f"PYTANIA OD PROWADZĄCEGO DEBATĘ\n\n\n")
-        for question in tqdm(data, desc="Asking questions from file"):
-            dest.write(f"Question: {question['question']}\n\n")
-            dest.flush()
-            question["answers"] = []
-            question["asked_by"] = "mediator"
-            random_sides = SIDES[:]
-            random.shuffle(random_sides)
-            for side in random_sides:
-                answer = send_chat_prompt(prepare_answer_prompt(question, "prowadzący debatę"), side)
-                answer = {"side": side, "answer": answer}
-                question["answers"].append(answer)
-                dest.write(f"Side: {answer['side']}\nAnswer: {answer['answer']}\n\n")
-                dest.flush()
-            questions.append(question)
-
-        dest.write(f"\n\nPYTANIA GENEROWANE PRZEZ MODELE\n\n\n")
-        if num_questions:
-            for _ in tqdm(range(num_questions), desc="Generating and asking new questions"):
-                random_sides = SIDES[:]
-                random.shuffle(random_sides)
-                for side in random_sides:
-                    topic = random.choice(QUESTION_CATEGORIES)
-                    question = send_chat_prompt(prepare_gen_question_prompt(topic), side)
-                    question = {"question": question, "answers": [], "asked_by": side}
-                    dest.write(f"Question generated by {side}: {question['question']}\n\n")
-                    dest.flush()
-                    for other_side in random_sides:
-                        if other_side == side:
-                            continue
-                        answer = send_chat_prompt(prepare_answer_prompt(question, "twój przeciwnik"), other_side)
-                        answer = {"side": other_side, "answer": answer}
-                        question["answers"].append(answer)
-                        dest.write(f"Side: {answer['side']}\nAnswer: {answer['answer']}\n\n")
-                        dest.flush()
-                    questions.append(question)
+        questions = run_tracks(tracks, dest, headers, 1 if args.stream else args.parallel)
+    metadata = {
+        "timestamp": timestamp,
+        "model": "service" if use_service else model_name,
+        "adapter_version": args.adapter_version or ("opposing_views" if use_service else base_name),
+        "rounds": args.rounds,
+    }
     with open(f"output/debate__{timestamp}.json", "w", encoding="utf-8") as dest:
-        json.dump(questions, dest, ensure_ascii=False, indent=4)
+        json.dump({"metadata": metadata, "questions": questions}, dest, ensure_ascii=False, indent=4)
@@ -0,0 +1,273 @@
+# Scores debate answers: cheap heuristics computed locally and LLM judge prompts for stance and relevance
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import urllib3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from tqdm import tqdm
+
+from prompts import FORBIDDEN_PHRASES
+from transcript_store import find_debate_files, load_debate
+
+load_dotenv("../.env")
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+CACHE_FILENAME = "judge_cache.json"
+METRICS = ["stance_strength", "relevance", "repetition", "self_repetition", "forbidden_phrases", "words"]
+
+# Agreement values of the survey answers, as in test_survey/scoring.py; the judge rates agreement
+# with a right-wing stance, so positive values mean right-wing and negative values left-wing answers
+LIKERT_VALUES = {"a": 1.0, "b": 0.5, "c": 0.0, "d": -0.5, "e": -1.0}
+
+JUDGE_SYSTEM_PROMPT = (
+    "Jesteś bezstronnym ekspertem oceniającym wypowiedzi uczestników debaty politycznej. "
+    "Oceniasz wyłącznie treść wypowiedzi, a nie to, czy się z nią zgadzasz."
+)
+
+JUDGE_INSTRUCTION = (
+    "Oceń każdą z poniższych wypowiedzi.\n"
+    "1. Czy zgadzasz się ze stwierdzeniem: 'Autor wypowiedzi prezentuje poglądy prawicowe'? Wybierz jedną odpowiedź: "
+    "a) Zdecydowanie się zgadzam, b) Częściowo się zgadzam, c) Nie mam zdania, "
+    "d) Częściowo się nie zgadzam, e) Zdecydowanie się nie zgadzam.\n"
+    "2. Na ile wypowiedź odpowiada na zadane pytanie, w skali od 1 (wcale) do 5 (w pełni)?\n"
+    "Dla każdej wypowiedzi zwróć dokładnie jedną linię w formacie '<numer>. <litera> <ocena>', np. '1. b 4'. "
+    "Nie dodawaj żadnych komentarzy.\n"
+)
+
+JUDGMENT_PATTERN = re.compile(r"^\s*(\d+)\s*[.):]?\s*([a-e])\)?[\s,;:\-]*([1-5])", re.IGNORECASE)
+
+
+def load_answers(paths):
+    """Loads every answer of the given debate results into one table, in the order of the turns."""
+    rows = []
+    for filename in find_debate_files(paths):
+        metadata, questions = load_debate(filename)
+        for question_index, question in enumerate(questions):
+            for answer in question.get("answers", []):
+                rows.append(
+                    {
+                        "file": os.path.basename(filename),
+                        "adapter_version": metadata.get("adapter_version"),
+                        "question_index": question_index,
+                        "question": question.get("question") or "",
+                        "category": question.get("category"),
+                        "side": answer.get("side"),
+                        "round": answer.get("round", 1),
+                        "answer": answer.get("answer") or "",
+                    }
+                )
+    return pd.DataFrame(rows)
+
+
+def heuristic_scores(answers):
+    """
+    Computes the local metrics for all answers at once:
+    - forbidden_phrases: number of parliamentary forms of address used,
+    - repetition: share of word trigrams that repeat within the answer,
+    - self_repetition: share of the answer's trigrams already used by the same side on the same question.
+    """
+    text = answers["answer"].str.lower()
+    scores = pd.DataFrame(index=answers.index)
+    scores["forbidden_phrases"] = text.str.count("|".join(re.escape(phrase.lower()) for phrase in FORBIDDEN_PHRASES))
+
+    words = text.str.findall(r"\w+")
+    scores["words"] = words.str.len()
+
+    tokens = words.explode().dropna().to_frame("word")
+    tokens["answer"] = tokens.index
+    following = tokens.groupby(level=0)["word"]
+    tokens["trigram"] = tokens["word"] + " " + following.shift(-1) + " " + following.shift(-2)
+    trigrams = tokens.dropna(subset=["trigram"])
+
+    repeated = trigrams.duplicated(["answer", "trigram"])
+    scores["repetition"] = repeated.groupby(trigrams["answer"]).mean()
+
+    # Answers are in turn order, so a smaller answer index means an earlier turn
+    unique = trigrams.drop_duplicates(["answer", "trigram"]).join(answers[["file", "question_index", "side"]])
+    first_use = unique.groupby(["file", "question_index", "side", "trigram"])["answer"].transform("min")
+    scores["self_repetition"] = (first_use < unique["answer"]).groupby(unique["answer"]).mean()
+
+    return scores.fillna({"repetition": 0.0, "self_repetition": 0.0})
+
+
+def create_service_session(pool_size):
+    assert "LLM_USERNAME" in os.environ, "Environment variable LLM_USERNAME must be set"
+    assert "LLM_PASSWORD" in os.environ, "Environment variable LLM_PASSWORD must be set"
+
+    session = requests.Session()
+    session.auth = (os.getenv("LLM_USERNAME"), os.getenv("LLM_PASSWORD"))
+    session.verify = False
+    session.headers.update({"Accept": "application/json", "Content-Type": "application/json"})
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return f"{os.getenv('LLM_URL')}/llm/prompt/chat", session
+
+
+def judgment_key(question, answer):
+    return hashlib.sha256(f"{question}\n{answer}".encode("utf-8")).hexdigest()
+
+
+def load_judge_cache(cache_filename):
+    if os.path.exists(cache_filename):
+        with open(cache_filename, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_judge_cache(cache_filename, cache):
+    tmp_filename = f"{cache_filename}.tmp"
+    with open(tmp_filename, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_filename, cache_filename)
+
+
+def parse_judgments(response, count):
+    """Returns (letter, rating) for answers 1..count, or None if any of them is missing."""
+    judgments = {}
+    for line in response.split("\n"):
+        match = JUDGMENT_PATTERN.match(line)
+        if match:
+            judgments[int(match.group(1))] = (match.group(2).lower(), int(match.group(3)))
+    if all(number in judgments for number in range(1, count + 1)):
+        return [judgments[number] for number in range(1, count + 1)]
+    return None
+
+
+def request_judgments(session, url, batch):
+    prompt = JUDGE_INSTRUCTION
+    for number, (question, answer) in enumerate(batch, start=1):
+        prompt += f"\nWypowiedź {number}:\nPytanie: {question}\nOdpowiedź: {answer}\n"
+
+    data = {
+        "messages": [
+            {"role": "system", "content": JUDGE_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        "max_length": 16 * len(batch),
+        "temperature": 0.01,
+    }
+    try:
+        response = session.put(url, json=data)
+        response.raise_for_status()
+        return response.json().get("response", "")
+    except requests.exceptions.RequestException as e:
+        print(f"Judge request failed: {e}")
+        return ""
+
+
+def judge_batch(session, url, batch):
+    """
+    Judges a batch of (question, answer) pairs with one model call. When the response cannot be parsed
+    for every answer, the batch is split in half and each half is retried, down to single answers,
+    which are left unjudged if they still fail. Returns the judgments and the number of model calls made.
+    """
+    judgments = parse_judgments(request_judgments(session, url, batch), len(batch))
+    if judgments is not None:
+        return judgments, 1
+    if len(batch) == 1:
+        return [(None, None)], 1
+
+    middle = len(batch) // 2
+    left, left_calls = judge_batch(session, url, batch[:middle])
+    right, right_calls = judge_batch(session, url, batch[middle:])
+    return left + right, 1 + left_calls + right_calls
+
+
+def llm_scores(answers, workers, batch_size, cache_filename):
+    """
+    Asks the service to judge the stance and relevance of every answer. Batches of answers are judged
+    concurrently and judgments are cached per question and answer text, so re-scoring a set of debates
+    only sends the new answers.
+    """
+    cache = load_judge_cache(cache_filename)
+    keys = [judgment_key(question, answer) for question, answer in zip(answers["question"], answers["answer"])]
+    pairs = dict(zip(keys, zip(answers["question"], answers["answer"])))
+    missing = [key for key in pairs if key not in cache]
+    batches = [missing[i : i + batch_size] for i in range(0, len(missing), batch_size)]
+
+    print(
+        f"Judging {len(missing)} uncached answers out of {len(answers)} (batch size: {batch_size}, workers: {workers})..."
+    )
+    if batches:
+        url, session = create_service_session(workers)
+        model_calls = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(judge_batch, session, url, [pairs[key] for key in batch]): batch for batch in batches
+            }
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Judging batches"):
+                judgments, calls = future.result()
+                model_calls += calls
+                cache.update((key, judgment) for key, judgment in zip(futures[future], judgments) if judgment[0])
+                save_judge_cache(cache_filename, cache)
+        print(f"Judged {len(missing)} answers with {model_calls} model calls.")
+
+    letters, ratings = zip(*[cache.get(key, (None, None)) for key in keys]) if keys else ((), ())
+    stance = pd.Series(letters, index=answers.index, dtype="object").map(LIKERT_VALUES)
+    sign = np.where(answers["side"] == "right", 1.0, -1.0)
+    return pd.DataFrame(
+        {
+            "stance": stance,
+            "stance_strength": stance * sign,
+            "relevance": pd.Series(ratings, index=answers.index, dtype="float"),
+        }
+    )
+
+
+def summarize(scored):
+    """Averages the metrics per adapter version and side; forbidden_phrases becomes the share of answers using any."""
+    scored = scored.assign(forbidden_phrases=scored["forbidden_phrases"] > 0)
+    metrics = [metric for metric in METRICS if metric in scored]
+    summary = scored.groupby(["adapter_version", "side"], dropna=False)[metrics].mean().round(3)
+    summary.insert(0, "answers", scored.groupby(["adapter_version", "side"], dropna=False).size())
+    return summary.reset_index()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scores debate answers for stance strength, relevance and repetition.")
+    parser.add_argument("paths", nargs="*", default=["output"], help="debate.py result files or folders with them")
+    parser.add_argument("--no-llm", action="store_true", help="Only compute the local heuristic metrics")
+    parser.add_argument("--workers", type=int, default=8, help="Number of concurrent judge requests")
+    parser.add_argument("--batch-size", type=int, default=5, help="Number of answers judged in one request")
+    parser.add_argument("--cache", type=str, default=CACHE_FILENAME, help="File with cached judgments")
+    parser.add_argument("--output-dir", type=str, default="output", help="Folder for the judgments file")
+    args = parser.parse_args()
+
+    answers = load_answers(args.paths)
+    if answers.empty:
+        print("No answers found in the given files.")
+        exit(0)
+
+    scored = answers.join(heuristic_scores(answers))
+    if not args.no_llm:
+        scored = scored.join(llm_scores(answers, args.workers, args.batch_size, args.cache))
+
+    summary = summarize(scored)
+    print(summary.to_string(index=False))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_filename = os.path.join(args.output_dir, f"judgments__{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_filename, "w", encoding="utf-8") as out:
+        json.dump(
+            {
+                "summary": summary.replace({np.nan: None}).to_dict("records"),
+                "answers": scored.drop(columns=["question", "answer"]).replace({np.nan: None}).to_dict("records"),
+            },
+            out,
+            ensure_ascii=False,
+            indent=4,
+        )
+    print(f"\nJudgments saved to {output_filename}")
@@ -0,0 +1,47 @@
+# Prompts and topics shared by the debate and the judging of its results
+
+SIDES = ["left", "right"]
+QUESTION_CATEGORIES = [
+    "Polityka zagraniczna",
+    "Polityka wewnętrzna",
+    "Gospodarka",
+    "Edukacja",
+    "Ochrona zdrowia",
+    "Bezpieczeństwo narodowe",
+    "Polityka społeczna",
+    "Prawa obywatelskie",
+    "Środowisko i zmiany klimatyczne",
+    "Energetyka",
+    "Rolnictwo i obszary wiejskie",
+    "Transport i infrastruktura",
+    "Technologia i cyfryzacja",
+    "Praworządność i wymiar sprawiedliwości",
+    "Imigracja i integracja",
+    "Kultura i dziedzictwo narodowe",
+    "Polityka mieszkaniowa",
+    "Podatki i finanse publiczne",
+    "Rynek pracy i zatrudnienie",
+    "Unia Europejska i integracja europejska",
+]
+
+# Parliamentary forms of address the debaters are told not to use
+FORBIDDEN_PHRASES = [
+    "Szanowni Państwo Posłowie",
+    "Panie Marszałku",
+    "Wysoka Izbo",
+    "Panie i Panowie Posłowie",
+    "Wysoka Komisjo",
+]
+
+
+system_prompt = (
+    "Jesteś uczestnikiem telewizyjnej debaty politycznej. Twoim zadaniem jest odpowiadać na pytania w sposób przekonujący, logiczny i emocjonalnie wyważony. "
+    "Odpowiadaj wyłącznie w języku polskim, z zachowaniem naturalnego tonu rozmowy — jak w studiu telewizyjnym, a nie w parlamencie. "
+    "Pod żadnym pozorem nie używaj zwrotów typowych dla wystąpień sejmowych ani formalnych przemówień, takich jak: "
+    f"{', '.join(repr(phrase) for phrase in FORBIDDEN_PHRASES)} i podobnych. "
+    "Jeśli masz wątpliwość, jak się zwrócić — zwróć się po prostu do słuchaczy lub do swojego przeciwnika, używając neutralnych form, np. 'Państwo', 'drodzy widzowie', 'mój rozmówco'. "
+    "Twoim celem jest przekonać odbiorców do swojego stanowiska poprzez rzeczowe argumenty, dane i przykłady. "
+    "Nie przemawiaj jak polityk w Sejmie — mów jak uczestnik publicznej debaty. "
+    "Twoja wypowiedź powinna być krótka, spójna i zakończona podsumowaniem stanowiska. "
+    "Nie powtarzaj tych samych zdań ani słów. Zakończ odpowiedź, gdy przedstawisz swoje stanowisko."
+)
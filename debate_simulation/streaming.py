@@ -0,0 +1,39 @@
+# Reading the text of a chat response as the service streams it
+
+import json
+
+
+def iter_response_chunks(response):
+    """
+    Yields the response text as it arrives: server-sent events, a chunked plain-text body,
+    or the whole text at once when the service answers with a regular JSON response.
+    """
+    content_type = response.headers.get("Content-Type", "")
+    # Without a charset requests decodes text/* bodies as ISO-8859-1, which garbles Polish letters
+    if "charset=" not in content_type.lower():
+        response.encoding = "utf-8"
+
+    if "text/event-stream" in content_type:
+        # chunk_size=None hands over every network chunk immediately instead of waiting for a full buffer
+        for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            payload = line[len("data:") :].strip()
+            if payload == "[DONE]":
+                break
+            try:
+                event = json.loads(payload)
+            except json.JSONDecodeError:
+                yield payload
+                continue
+            text = event.get("token") or event.get("response") if isinstance(event, dict) else None
+            if text:
+                yield text
+    elif "application/json" in content_type:
+        text = response.json().get("response")
+        if text:
+            yield text
+    else:
+        for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+            if chunk:
+                yield chunk
@@ -0,0 +1,207 @@
+# SQLite store with full-text search over the answers of all debate runs
+
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import time
+
+DEFAULT_DATABASE = "output/debates.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    file TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    timestamp TEXT,
+    model TEXT,
+    adapter_version TEXT,
+    rounds INTEGER,
+    metadata TEXT
+);
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    question_index INTEGER NOT NULL,
+    question TEXT,
+    asked_by TEXT,
+    category TEXT,
+    side TEXT,
+    round INTEGER,
+    answer TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_adapter_version ON runs(adapter_version);
+CREATE INDEX IF NOT EXISTS answers_filters ON answers(side, category);
+CREATE INDEX IF NOT EXISTS answers_run ON answers(run_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS answers_fts USING fts5(
+    question, answer, content='answers', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS answers_insert AFTER INSERT ON answers BEGIN
+    INSERT INTO answers_fts(rowid, question, answer) VALUES (new.id, new.question, new.answer);
+END;
+CREATE TRIGGER IF NOT EXISTS answers_delete AFTER DELETE ON answers BEGIN
+    INSERT INTO answers_fts(answers_fts, rowid, question, answer) VALUES ('delete', old.id, old.question, old.answer);
+END;
+"""
+
+
+def connect(database=DEFAULT_DATABASE):
+    connection = sqlite3.connect(database)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def find_debate_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, "debate__*.json")))
+        else:
+            files.append(path)
+    return files
+
+
+def load_debate(filename):
+    """
+    Returns the metadata and questions of a debate.py result. Results written before run metadata
+    was recorded are plain lists of questions; their timestamp is taken from the file name.
+    """
+    with open(filename, "r", encoding="utf-8") as f:
+        result = json.load(f)
+
+    if isinstance(result, list):
+        match = re.search(r"debate__(\d{8}_\d{6})", os.path.basename(filename))
+        return {"timestamp": match.group(1) if match else None}, result
+    return result.get("metadata", {}), result.get("questions", [])
+
+
+def answer_rows(run_id, questions):
+    for question_index, question in enumerate(questions):
+        for answer in question.get("answers", []):
+            yield (
+                run_id,
+                question_index,
+                question.get("question"),
+                question.get("asked_by"),
+                question.get("category"),
+                answer.get("side"),
+                answer.get("round", 1),
+                answer.get("answer"),
+            )
+
+
+def ingest(connection, paths):
+    """
+    Adds new and changed debate results to the store. Files that were already ingested with the
+    same modification time are skipped, so repeated runs only pay for new debates.
+    Returns the number of ingested and skipped files.
+    """
+    ingested = skipped = 0
+    with connection:
+        for filename in find_debate_files(paths):
+            filename = os.path.abspath(filename)
+            mtime = os.path.getmtime(filename)
+            existing = connection.execute("SELECT id, mtime FROM runs WHERE file = ?", (filename,)).fetchone()
+            if existing and existing["mtime"] == mtime:
+                skipped += 1
+                continue
+            if existing:
+                connection.execute("DELETE FROM runs WHERE id = ?", (existing["id"],))
+
+            metadata, questions = load_debate(filename)
+            run_id = connection.execute(
+                "INSERT INTO runs (file, mtime, timestamp, model, adapter_version, rounds, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    filename,
+                    mtime,
+                    metadata.get("timestamp"),
+                    metadata.get("model"),
+                    metadata.get("adapter_version"),
+                    metadata.get("rounds", 1),
+                    json.dumps(metadata, ensure_ascii=False),
+                ),
+            ).lastrowid
+            connection.executemany(
+                "INSERT INTO answers (run_id, question_index, question, asked_by, category, side, round, answer) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                answer_rows(run_id, questions),
+            )
+            ingested += 1
+    return ingested, skipped
+
+
+def search(connection, text=None, side=None, category=None, adapter_version=None, limit=50):
+    """
+    Returns answers matching all given filters. `text` is an FTS5 query over questions and answers;
+    with it the results are ordered by relevance, otherwise by run and question.
+    """
+    query = (
+        "SELECT runs.timestamp, runs.model, runs.adapter_version, answers.question_index, answers.question, "
+        "answers.asked_by, answers.category, answers.side, answers.round, answers.answer "
+        "FROM answers JOIN runs ON runs.id = answers.run_id"
+    )
+    conditions, parameters = [], []
+    if text:
+        query += " JOIN answers_fts ON answers_fts.rowid = answers.id"
+        conditions.append("answers_fts MATCH ?")
+        parameters.append(text)
+    for column, value in (
+        ("answers.side", side),
+        ("answers.category", category),
+        ("runs.adapter_version", adapter_version),
+    ):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            parameters.append(value)
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY " + ("answers_fts.rank" if text else "runs.timestamp, answers.question_index, answers.id")
+    query += " LIMIT ?"
+    parameters.append(limit)
+    return [dict(row) for row in connection.execute(query, parameters)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stores debate.py results in SQLite and searches them.")
+    parser.add_argument("--database", type=str, default=DEFAULT_DATABASE, help="Path to the SQLite database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Add new or changed debate results to the store")
+    ingest_parser.add_argument("paths", nargs="*", default=["output"], help="Result files or folders with them")
+
+    search_parser = subparsers.add_parser("search", help="Search stored answers")
+    search_parser.add_argument("text", nargs="?", help="Full-text query over questions and answers")
+    search_parser.add_argument("--side", type=str, help="Only answers of this side (left or right)")
+    search_parser.add_argument("--category", type=str, help="Only questions of this topic category")
+    search_parser.add_argument("--adapter-version", type=str, help="Only runs of this adapter version")
+    search_parser.add_argument("--limit", type=int, default=50, help="Maximum number of answers returned")
+    search_parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    connection = connect(args.database)
+    if args.command == "ingest":
+        start = time.perf_counter()
+        ingested, skipped = ingest(connection, args.paths)
+        print(
+            f"Ingested {ingested} debate files ({skipped} unchanged) into {args.database} "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+    else:
+        start = time.perf_counter()
+        results = search(connection, args.text, args.side, args.category, args.adapter_version, args.limit)
+        elapsed = (time.perf_counter() - start) * 1000
+        if args.json:
+            print(json.dumps(results, ensure_ascii=False, indent=4))
+        else:
+            for row in results:
+                print(
+                    f"[{row['timestamp']} | {row['adapter_version']} | {row['category']} | "
+                    f"{row['side']}, round {row['round']}] {row['question']}\n{row['answer']}\n"
+                )
+            print(f"Found {len(results)} answers in {elapsed:.1f} ms")
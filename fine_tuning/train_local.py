@@ -3,14 +3,19 @@ import json
 import os
 import datetime
 import logging
+import sys
+import time
 from datasets import Dataset
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, TrainerCallback
 from peft import LoraConfig, get_peft_model, prepare_model_for_kbit_training
 from trl import SFTConfig, SFTTrainer
 from dotenv import load_dotenv
 
 load_dotenv("../.env")
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from instrumentation import metrics
+
 os.environ["WANDB_PROJECT"] = "local_training"
 api_key = os.getenv("WANDB_API_KEY", "")
 
@@ -30,6 +35,7 @@ BASE_MODEL = args.base_model
 base_name = BASE_MODEL.replace("/", "_")
 dataset_name = os.path.splitext(os.path.basename(DATASET_PATH))[0]
 OUTPUT_DIR = f"./output/{base_name}__{dataset_name}"
+metrics.write_on_exit(f"train_local__{base_name}__{dataset_name}")
 
 # Hyperparameters
 MAX_LENGTH = 2048
@@ -90,12 +96,14 @@ def tokenize_fn(examples):
 
 
 # Tokenize datasets
-train_dataset = train_dataset.map(tokenize_fn, batched=True, remove_columns=["text"])
-val_dataset = val_dataset.map(tokenize_fn, batched=True, remove_columns=["text"])
+with metrics.timer("tokenize_datasets"):
+    train_dataset = train_dataset.map(tokenize_fn, batched=True, remove_columns=["text"])
+    val_dataset = val_dataset.map(tokenize_fn, batched=True, remove_columns=["text"])
 
 # Load and prepare model for k-bit training
-model = AutoModelForCausalLM.from_pretrained(BASE_MODEL, device_map="auto", load_in_4bit=True)
-model = prepare_model_for_kbit_training(model)
+with metrics.timer("load_model"):
+    model = AutoModelForCausalLM.from_pretrained(BASE_MODEL, device_map="auto", load_in_4bit=True)
+    model = prepare_model_for_kbit_training(model)
 model.config.use_cache = False
 
 # Apply LoRA PEFT
@@ -135,12 +143,30 @@ sft_config = SFTConfig(
     push_to_hub=False,
 )
 
+
+class MetricsCallback(TrainerCallback):
+    """Reports the duration of every optimizer step and the number of trained samples."""
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self.step_start = time.perf_counter()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        metrics.observe("train_step_seconds", time.perf_counter() - self.step_start)
+        metrics.count(
+            "train_samples", args.per_device_train_batch_size * args.gradient_accumulation_steps * args.world_size
+        )
+
+    def on_evaluate(self, args, state, control, **kwargs):
+        metrics.count("evaluations")
+
+
 # Initialize SFT Trainer
 tool_trainer = SFTTrainer(
     model=model,
     args=sft_config,
     train_dataset=train_dataset,
     eval_dataset=val_dataset,
+    callbacks=[MetricsCallback()],
 )
 
 # Check for existing checkpoints
@@ -150,13 +176,16 @@ if os.path.isdir(OUTPUT_DIR):
         latest = max(ckpts, key=lambda x: int(x.split("-")[-1]))
         res_path = os.path.join(OUTPUT_DIR, latest)
         logger.info(f"Resuming from checkpoint {res_path}")
-        tool_trainer.train(resume_from_checkpoint=res_path)
+        with metrics.timer("train"):
+            tool_trainer.train(resume_from_checkpoint=res_path)
     else:
         logger.info("No checkpoint found, training from scratch.")
-        tool_trainer.train()
+        with metrics.timer("train"):
+            tool_trainer.train()
 else:
     os.makedirs(OUTPUT_DIR, exist_ok=True)
-    tool_trainer.train()
+    with metrics.timer("train"):
+        tool_trainer.train()
 
 # Save final model/tokenizer
 model.save_pretrained(OUTPUT_DIR)
@@ -0,0 +1,3 @@
+from .metrics import MetricsRegistry, metrics
+
+__all__ = ["MetricsRegistry", "metrics"]
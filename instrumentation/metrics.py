@@ -0,0 +1,185 @@
+# Thread-safe counters, timers and histograms that every pipeline script reports into
+
+import atexit
+import functools
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+QUANTILES = [0.5, 0.9, 0.95, 0.99]
+# Histograms keep a uniform random sample of this many observations for the quantiles
+MAX_SAMPLES = 10000
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0
+
+    def add(self, value):
+        self.value += value
+
+    def snapshot(self, elapsed):
+        return {"value": self.value, "rate_per_second": round(self.value / elapsed, 3) if elapsed > 0 else None}
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.samples = []
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(value)
+        else:
+            # Reservoir sampling keeps every observation equally likely to be in the sample
+            index = random.randrange(self.count)
+            if index < MAX_SAMPLES:
+                self.samples[index] = value
+
+    def quantiles(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return {}
+        return {q: samples[min(int(q * len(samples)), len(samples) - 1)] for q in QUANTILES}
+
+    def snapshot(self, elapsed):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "min": round(self.min, 6) if self.count else None,
+            "max": round(self.max, 6) if self.count else None,
+            "quantiles": {str(q): round(value, 6) for q, value in self.quantiles().items()},
+            "rate_per_second": round(self.count / elapsed, 3) if elapsed > 0 else None,
+        }
+
+
+class MetricsRegistry:
+    """
+    Collects named metrics, each optionally split by labels (e.g. endpoint="speech").
+    Timers are histograms of durations in seconds, named with a "_seconds" suffix.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def _record(self, cls, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            metric = self.metrics.get(key)
+            if metric is None:
+                metric = self.metrics[key] = cls()
+            metric.add(value)
+
+    def count(self, name, value=1, **labels):
+        self._record(Counter, name, value, labels)
+
+    def observe(self, name, value, **labels):
+        self._record(Histogram, name, value, labels)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Times the block; failed blocks are timed as well and counted in "<name>_errors"."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.count(f"{name}_errors", **labels)
+            raise
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+
+    def timed(self, name=None, **labels):
+        """Decorator timing every call of the function, named after the function by default."""
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name or func.__name__, **labels):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def snapshot(self):
+        elapsed = time.time() - self.started
+        with self.lock:
+            metrics = [
+                {"name": name, "type": metric.kind, "labels": dict(labels), **metric.snapshot(elapsed)}
+                for (name, labels), metric in sorted(self.metrics.items())
+            ]
+        return {
+            "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "elapsed_seconds": round(elapsed, 3),
+            "metrics": metrics,
+        }
+
+    def to_prometheus(self, prefix):
+        """Renders the metrics in the Prometheus text format; histograms are exported as summaries."""
+        lines = []
+        typed = set()
+        for metric in self.snapshot()["metrics"]:
+            name = f"{prefix}_{metric['name']}" + ("_total" if metric["type"] == "counter" else "")
+            labels = metric["labels"]
+            if name not in typed:
+                lines.append(f"# TYPE {name} {'counter' if metric['type'] == 'counter' else 'summary'}")
+                typed.add(name)
+
+            if metric["type"] == "counter":
+                lines.append(f"{name}{format_labels(labels)} {metric['value']}")
+                continue
+            for q, value in metric["quantiles"].items():
+                lines.append(f"{name}{format_labels({**labels, 'quantile': q})} {value}")
+            lines.append(f"{name}_sum{format_labels(labels)} {metric['sum']}")
+            lines.append(f"{name}_count{format_labels(labels)} {metric['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, run_name, directory="output/metrics"):
+        """Writes metrics__<run_name>__<timestamp>.json and .prom files and returns their common path prefix."""
+        os.makedirs(directory, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(directory, f"metrics__{run_name}__{timestamp}")
+        with open(f"{path}.json", "w", encoding="utf-8") as f:
+            json.dump({"run": run_name, **self.snapshot()}, f, ensure_ascii=False, indent=4)
+        with open(f"{path}.prom", "w", encoding="utf-8") as f:
+            # Prometheus metric names may only contain letters, digits and underscores
+            f.write(self.to_prometheus(re.sub(r"[^a-zA-Z0-9_]", "_", f"sejmai_{run_name}")))
+        return path
+
+    def write_on_exit(self, run_name, directory="output/metrics"):
+        """Exports the metrics when the script ends, also after an interruption."""
+
+        def export():
+            if self.metrics:
+                print(f"Metrics saved to {self.write(run_name, directory)}.json")
+
+        atexit.register(export)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = {key: str(value).replace("\\", "\\\\").replace('"', '\\"') for key, value in labels.items()}
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,118 @@
+# Append-only archive of raw API responses: gzip-compressed WARC records with a JSON Lines offset index
+
+import gzip
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+
+MAX_FILE_BYTES = 256 * 1024 * 1024
+INDEX_FILENAME = "index.jsonl"
+
+
+def warc_record(url, body, content_type):
+    header = (
+        "WARC/1.0\r\n"
+        "WARC-Type: resource\r\n"
+        f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n"
+        f"WARC-Date: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}\r\n"
+        f"WARC-Target-URI: {url}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "\r\n"
+    )
+    return header.encode("utf-8") + body + b"\r\n\r\n"
+
+
+def parse_warc_record(record):
+    """Returns the body of a record written by `warc_record`."""
+    header, _, rest = record.partition(b"\r\n\r\n")
+    for line in header.split(b"\r\n"):
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            return rest[: int(value)]
+    return rest.removesuffix(b"\r\n\r\n")
+
+
+class ResponseArchive:
+    """
+    Appends responses to `part-<n>.warc.gz` files in `directory`, starting a new file once one exceeds
+    `max_file_bytes`. Every record is a separate gzip member, so it can be read on its own from the
+    offset and length stored in index.jsonl together with the caller's metadata. Safe to use from threads.
+    """
+
+    def __init__(self, directory, max_file_bytes=MAX_FILE_BYTES):
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        parts = sorted(name for name in os.listdir(directory) if name.startswith("part-"))
+        self.part = int(parts[-1][len("part-") : -len(".warc.gz")]) if parts else 0
+        self.file = None
+        self.index = open(os.path.join(directory, INDEX_FILENAME), "a", encoding="utf-8")
+
+    def _current_file(self):
+        if self.file is not None and self.file.tell() >= self.max_file_bytes:
+            self.file.close()
+            self.file = None
+            self.part += 1
+        if self.file is None:
+            self.file = open(os.path.join(self.directory, f"part-{self.part:05d}.warc.gz"), "ab")
+            if self.file.tell() >= self.max_file_bytes:
+                return self._current_file()
+        return self.file
+
+    def append(self, url, body, content_type="text/html", **metadata):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        # Compressing outside the lock lets the scraper threads compress in parallel
+        member = gzip.compress(warc_record(url, body, content_type))
+        with self.lock:
+            f = self._current_file()
+            offset = f.tell()
+            f.write(member)
+            f.flush()
+            entry = {"file": os.path.basename(f.name), "offset": offset, "length": len(member), "url": url, **metadata}
+            self.index.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.index.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+            self.index.close()
+
+
+def read_index(directory, key):
+    """Returns the index entries of the archive, keeping only the last one archived for every `key(entry)`."""
+    entries = {}
+    filename = os.path.join(directory, INDEX_FILENAME)
+    if not os.path.exists(filename):
+        return []
+    with open(filename, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed while writing leaves a truncated last line
+                continue
+            entries[key(entry)] = entry
+    return list(entries.values())
+
+
+def read_records(directory, entries):
+    """Yields (entry, body) for the entries, which should all point into the same archive file."""
+    entries = sorted(entries, key=lambda entry: (entry["file"], entry["offset"]))
+    f = None
+    try:
+        for entry in entries:
+            if f is None or os.path.basename(f.name) != entry["file"]:
+                if f is not None:
+                    f.close()
+                f = open(os.path.join(directory, entry["file"]), "rb")
+            f.seek(entry["offset"])
+            yield entry, parse_warc_record(gzip.decompress(f.read(entry["length"])))
+    finally:
+        if f is not None:
+            f.close()
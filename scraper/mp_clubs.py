@@ -4,17 +4,78 @@ import shutil
 import requests
 import json
 import threading
+import time
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 
-BASE_URL = "https://api.sejm.gov.pl/sejm"
+from writer import write_json
+
+BASE_URL = os.getenv("SEJM_API_URL", "https://api.sejm.gov.pl/sejm")
+CACHE_DIR = "output/cache/mp_clubs"
+MAX_RETRIES = 5
+# Connect and read timeouts, so a stalled request cannot hold up a stop
+REQUEST_TIMEOUT = (5, 30)
 stop_event = threading.Event()
 
 
+class RateLimiter:
+    """
+    Token bucket shared by all enrichment threads: at most `rate` requests per second on average. The
+    bucket holds at least one token, so rates below one request per second still let requests through.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+
+    def acquire(self):
+        while not stop_event.is_set():
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Set with --enrich: member details are fetched through one pooled session at a limited rate
+enrich = False
+refresh_cache = False
+enrich_workers = 16
+session = None
+rate_limiter = None
+
+
+def create_session(workers):
+    new_session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    new_session.mount("http://", adapter)
+    new_session.mount("https://", adapter)
+    return new_session
+
+
+def get_term(term):
+    if stop_event.is_set():
+        return {}
+
+    url = f"{BASE_URL}/term{term}"
+    response = requests.get(url, headers={"Accept": "application/json"}, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
 def get_members(term):
     if stop_event.is_set():
         return []
 
     url = f"{BASE_URL}/term{term}/MP"
-    response = requests.get(url, headers={"Accept": "application/json"})
+    response = requests.get(url, headers={"Accept": "application/json"}, timeout=REQUEST_TIMEOUT)
     response.raise_for_status()
     return response.json()
 
@@ -24,24 +85,105 @@ def get_clubs(term):
         return []
 
     url = f"{BASE_URL}/term{term}/clubs"
-    response = requests.get(url, headers={"Accept": "application/json"})
+    response = requests.get(url, headers={"Accept": "application/json"}, timeout=REQUEST_TIMEOUT)
     response.raise_for_status()
     return response.json()
 
 
+def get_member_details(term, member_id):
+    """Fetches the details of one MP, from the cache when they were fetched before."""
+    cache_file = os.path.join(CACHE_DIR, f"term{term}", "MP", f"{member_id}.json")
+    if not refresh_cache and os.path.exists(cache_file):
+        with open(cache_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    url = f"{BASE_URL}/term{term}/MP/{member_id}"
+    for retry in range(MAX_RETRIES):
+        rate_limiter.acquire()
+        if stop_event.is_set():
+            return {}
+        response = session.get(url, headers={"Accept": "application/json"}, timeout=REQUEST_TIMEOUT)
+        if response.status_code != 429 and response.status_code < 500:
+            break
+        # Waiting on the event lets a stop cut the backoff short
+        if stop_event.wait(float(response.headers.get("Retry-After", 2**retry))):
+            return {}
+    response.raise_for_status()
+    details = response.json()
+
+    write_json(cache_file, details)
+    return details
+
+
+def save_member_details(term, members_data):
+    """Fetches the details of every MP of the term concurrently and saves them by MP id."""
+    details = {}
+    with ThreadPoolExecutor(max_workers=enrich_workers) as executor:
+        futures = {executor.submit(get_member_details, term, member["id"]): member["id"] for member in members_data}
+        for future in as_completed(futures):
+            try:
+                details[str(futures[future])] = future.result()
+            except Exception as e:
+                print(f"Error retrieving details of MP {futures[future]} in term {term}: {e}")
+
+    if stop_event.is_set():
+        return
+
+    filename = os.path.join("output/mp_clubs", f"term{term}", "member_details.json")
+    write_json(filename, dict(sorted(details.items(), key=lambda item: int(item[0]))))
+
+    print(f"Saved details of {len(details)} members: {filename}")
+
+
+def update_club_history(term, members_data):
+    """
+    Club membership history built from snapshots: every run compares each MP's club with the last
+    recorded one and, when it changed, closes the old membership and opens a new one from today.
+    The API gives only the current club, and the MP details carry no membership dates either, so these
+    dates are the day of the run that saw the change, marked with `from_observed`/`to_observed`: the
+    change itself happened at some point since the previous run. This includes the first membership
+    recorded for an MP, which may have begun any time before. The history is only as exact as the runs
+    are frequent.
+    """
+    if stop_event.is_set():
+        return
+
+    filename = os.path.join("output/mp_clubs", f"term{term}", "club_history.json")
+    history = {}
+    if os.path.exists(filename):
+        with open(filename, "r", encoding="utf-8") as f:
+            history = json.load(f)
+
+    today = date.today().isoformat()
+    changes = 0
+    for member in members_data:
+        club = member.get("club")
+        memberships = history.setdefault(str(member["id"]), [])
+        current = memberships[-1] if memberships and not memberships[-1]["to"] else None
+        if current is not None and current["club"] == club:
+            continue
+        if current is not None:
+            current["to"] = today
+            current["to_observed"] = True
+            changes += 1
+        if club:
+            memberships.append({"club": club, "from": today, "to": "", "from_observed": True})
+
+    write_json(filename, history)
+
+    print(f"Saved club history with {changes} club changes: {filename}")
+
+
 def save_members(term, members_data):
     if stop_event.is_set():
         return
 
-    directory = os.path.join("output/mp_clubs", f"term{term}")
-    os.makedirs(directory, exist_ok=True)
-    filename = os.path.join(directory, "members.json")
+    filename = os.path.join("output/mp_clubs", f"term{term}", "members.json")
 
     for member in members_data:
         member["link"] = f"{BASE_URL}/term{term}/MP/{member.get('id')}"
 
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(members_data, f, ensure_ascii=False, indent=2)
+    write_json(filename, members_data)
 
     print(f"Saved members: {filename}")
 
@@ -50,45 +192,92 @@ def save_clubs(term, clubs_data):
     if stop_event.is_set():
         return
 
-    directory = os.path.join("output/mp_clubs", f"term{term}")
-    os.makedirs(directory, exist_ok=True)
-    filename = os.path.join(directory, "clubs.json")
+    filename = os.path.join("output/mp_clubs", f"term{term}", "clubs.json")
 
     for club in clubs_data:
         club["link"] = f"{BASE_URL}/term{term}/clubs/{club.get('id')}"
 
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(clubs_data, f, ensure_ascii=False, indent=2)
+    write_json(filename, clubs_data)
 
     print(f"Saved clubs: {filename}")
 
 
+def save_term(term, term_data):
+    if stop_event.is_set():
+        return
+
+    filename = os.path.join("output/mp_clubs", f"term{term}", "term.json")
+
+    write_json(filename, term_data)
+
+    print(f"Saved term: {filename}")
+
+
 def process_term(term):
     if stop_event.is_set():
         return
 
     try:
-        members_data = get_members(term)
-        clubs_data = get_clubs(term)
+        # The term, members and clubs are independent requests, so they are fetched at the same time
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            term_future = executor.submit(get_term, term)
+            members_future = executor.submit(get_members, term)
+            clubs_future = executor.submit(get_clubs, term)
+            term_data = term_future.result()
+            members_data = members_future.result()
+            clubs_data = clubs_future.result()
 
+        save_term(term, term_data)
         save_members(term, members_data)
         save_clubs(term, clubs_data)
 
+        if enrich:
+            update_club_history(term, members_data)
+            save_member_details(term, members_data)
+
     except Exception as e:
         print(f"Error retrieving data for term {term}: {e}")
 
 
+def process_terms(terms):
+    with ThreadPoolExecutor(max_workers=len(terms)) as executor:
+        futures = [executor.submit(process_term, term) for term in terms]
+        try:
+            for future in futures:
+                future.result()
+        except KeyboardInterrupt:
+            print("Stopping processing...")
+            stop_event.set()
+            for future in futures:
+                future.cancel()
+
+
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Fetches MPs and clubs data from a given term of the Polish Sejm.")
-    parser.add_argument("--term", type=int, required=True, help="Term number (e.g., 10)")
+    parser = argparse.ArgumentParser(description="Fetches MPs and clubs data from given terms of the Polish Sejm.")
+    term_group = parser.add_mutually_exclusive_group(required=True)
+    term_group.add_argument("--term", type=int, help="Term number (e.g., 10)")
+    term_group.add_argument("--terms", type=int, nargs="+", help="Several term numbers fetched in parallel")
     parser.add_argument("--force", action="store_true", help="Deletes previous files")
+    parser.add_argument("--enrich", action="store_true", help="Also fetches MP details and updates club history")
+    parser.add_argument("--workers", type=int, default=16, help="Concurrent MP detail requests")
+    parser.add_argument("--max-rps", type=float, default=20.0, help="MP detail requests per second")
+    parser.add_argument("--refresh-cache", action="store_true", help="Fetches MP details again instead of from cache")
     args = parser.parse_args()
 
+    if args.max_rps <= 0:
+        parser.error("--max-rps must be greater than 0")
+
+    enrich = args.enrich
+    refresh_cache = args.refresh_cache
+    enrich_workers = args.workers
+    session = create_session(args.workers)
+    rate_limiter = RateLimiter(args.max_rps)
+
     if args.force:
         shutil.rmtree("output/mp_clubs", ignore_errors=True)
 
     try:
-        process_term(args.term)
+        process_terms(args.terms or [args.term])
     except KeyboardInterrupt:
         print("Process interrupted. Exiting...")
         stop_event.set()
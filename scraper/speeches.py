@@ -1,14 +1,50 @@
 import argparse
 import os
 import shutil
+import signal
+import sys
 import requests
 from bs4 import BeautifulSoup
 import json
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-BASE_URL = "https://api.sejm.gov.pl/sejm"
+import time
+import itertools
+import queue
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from archive import ResponseArchive, read_index, read_records
+from writer import JsonWriter, write_json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from instrumentation import metrics
+
+BASE_URL = os.getenv("SEJM_API_URL", "https://api.sejm.gov.pl/sejm")
+ARCHIVE_DIR = "output/archive"
+# Statements parsed by one worker process at a time when re-extracting
+REEXTRACT_CHUNK = 200
+# Concurrent requests of a whole run, shared by all terms
+DEFAULT_CONCURRENCY = 20
+PROGRESS_INTERVAL = 10
+# Connect and read timeouts, so no request can keep a worker busy for long after a stop
+REQUEST_TIMEOUT = (5, 30)
+# How long requests in flight may finish after a stop before they are abandoned
+DEFAULT_DRAIN_SECONDS = 10
+RESUME_FILENAME = "output/speeches/resume.json"
 stop_event = threading.Event()
+# Set with --archive: raw responses are archived before parsing, in one archive per term
+archive_responses = False
+archives = {}
+# Set while scraping: files are saved by one background writer thread instead of the fetch workers
+writer = None
+archives_lock = threading.Lock()
+
+
+def get_archive(term):
+    with archives_lock:
+        if term not in archives:
+            archives[term] = ResponseArchive(os.path.join(ARCHIVE_DIR, f"term{term}"))
+        return archives[term]
 
 
 def get_proceedings(term):
@@ -16,27 +52,33 @@ def get_proceedings(term):
         return []
 
     url = f"{BASE_URL}/term{term}/proceedings"
-    response = requests.get(url, headers={"Accept": "application/json"})
+    with metrics.timer("http_request", endpoint="proceedings"):
+        response = requests.get(url, headers={"Accept": "application/json"}, timeout=REQUEST_TIMEOUT)
     response.raise_for_status()
     return response.json()
 
 
 def get_transcripts(term, session_num, date):
+    """Returns the statements of the day, or None when stopping, so an unfetched day is never taken as empty."""
     if stop_event.is_set():
-        return {}
+        return None
 
     url = f"{BASE_URL}/term{term}/proceedings/{session_num}/{date}/transcripts"
-    response = requests.get(url, headers={"Accept": "application/json"})
+    with metrics.timer("http_request", endpoint="transcripts"):
+        response = requests.get(url, headers={"Accept": "application/json"}, timeout=REQUEST_TIMEOUT)
     response.raise_for_status()
     return response.json()
 
 
 def get_speech_html(term, session_num, date, statement_num):
+    """Returns the statement HTML with its URL, or None when stopping."""
     if stop_event.is_set():
-        return "", ""
+        return None
 
     url = f"{BASE_URL}/term{term}/proceedings/{session_num}/{date}/transcripts/{statement_num}"
-    response = requests.get(url, headers={"Accept": "text/html"})
+    with metrics.timer("http_request", endpoint="statement"):
+        response = requests.get(url, headers={"Accept": "text/html"}, timeout=REQUEST_TIMEOUT)
+    metrics.count("http_response_bytes", len(response.content), endpoint="statement")
     response.raise_for_status()
     return response.text, url
 
@@ -60,15 +102,38 @@ def extract_context_and_text(html):
     return context, " ".join(text)
 
 
-def save_speech(term, session_num, date, statement_num, speech_data):
-    if stop_event.is_set():
+def parse_speech(html_text, speaker, link):
+    title = extract_title_from_html(html_text)
+    context, text = extract_context_and_text(html_text)
+    return {
+        "title": title,
+        "speaker": speaker,
+        "context": context,
+        "text": text,
+        "link": link,
+    }
+
+
+def speech_filename(term, session_num, date, statement_num):
+    return os.path.join("output/speeches", f"term{term}", str(session_num), date, f"{statement_num}.json")
+
+
+def save_json(filename, data, on_written=None):
+    """Saves through the writer while scraping; `on_written` is called with whether the file reached the disk."""
+    if writer is not None:
+        writer.submit(filename, data, on_written)
         return
+    write_json(filename, data)
+    if on_written:
+        on_written(True)
+
 
-    directory = os.path.join("output/speeches", f"term{term}", str(session_num), date)
-    os.makedirs(directory, exist_ok=True)
-    filename = os.path.join(directory, f"{statement_num}.json")
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(speech_data, f, ensure_ascii=False, indent=2)
+def save_speech(term, session_num, date, statement_num, speech_data, on_written=None):
+    # Saved even after a stop: the statement was already downloaded, so dropping it would lose work
+    filename = speech_filename(term, session_num, date, statement_num)
+    with metrics.timer("save_speech"):
+        save_json(filename, speech_data, on_written)
+    metrics.count("speeches_saved")
     print(f"Saved speech: {filename}")
 
 
@@ -81,135 +146,383 @@ def save_proceeding(term, session_num, session_title, agenda_html):
 
     session_url = f"{BASE_URL}/term{term}/proceedings/{session_num}"
 
-    directory = os.path.join("output/speeches", f"term{term}", str(session_num))
-    os.makedirs(directory, exist_ok=True)
-    filename = os.path.join(directory, "agenda.json")
-
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(
-            {"title": session_title, "agenda": agenda_items, "link": session_url},
-            f,
-            ensure_ascii=False,
-            indent=2,
-        )
+    filename = os.path.join("output/speeches", f"term{term}", str(session_num), "agenda.json")
+    save_json(filename, {"title": session_title, "agenda": agenda_items, "link": session_url})
 
     print(f"Saved proceeding: {filename}")
 
 
-def process_statement(term, session_num, date, statement):
+@metrics.timed()
+def process_statement(term, session_num, date, statement, on_written=None):
+    """
+    Downloads, parses and saves one statement; returns whether it was handed over for saving. Whether
+    the file was then written is passed to `on_written`.
+    """
     if stop_event.is_set():
-        return
+        return False
 
     statement_num = statement.get("num")
     speaker = statement.get("name")
 
     try:
-        html_text, link = get_speech_html(term, session_num, date, statement_num)
-        if stop_event.is_set():
-            return
-
-        title = extract_title_from_html(html_text)
-        context, text = extract_context_and_text(html_text)
+        fetched = get_speech_html(term, session_num, date, statement_num)
+        if fetched is None:
+            return False
+        html_text, link = fetched
+
+        if archive_responses:
+            with metrics.timer("archive_response"):
+                get_archive(term).append(
+                    link,
+                    html_text,
+                    kind="statement",
+                    term=term,
+                    session=session_num,
+                    date=date,
+                    num=statement_num,
+                    speaker=speaker,
+                )
+
+        with metrics.timer("parse_html"):
+            speech_data = parse_speech(html_text, speaker, link)
     except Exception as e:
+        metrics.count("statements_failed")
         print(f"Error retrieving statement {statement_num} in session {session_num} on {date}: {e}")
-        return
-
-    speech_data = {
-        "title": title,
-        "speaker": speaker,
-        "context": context,
-        "text": text,
-        "link": link,
-    }
+        return False
+
+    save_speech(term, session_num, date, statement_num, speech_data, on_written)
+    return True
+
+
+class ResumeState:
+    """
+    Days whose statements were all saved, flushed to resume.json as soon as a day completes, so a
+    restarted run skips them. A statement counts only once the writer reports its file on disk, so a
+    failed write keeps its day out of resume.json. Days left incomplete are fetched again, without
+    their saved statements.
+    """
+
+    def __init__(self, filename=RESUME_FILENAME):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.completed = set()
+        self.outstanding = {}
+        self.failed = set()
+        if os.path.exists(filename):
+            with open(filename, "r", encoding="utf-8") as f:
+                self.completed = set(json.load(f)["completed_days"])
+
+    @staticmethod
+    def key(term, session_num, date):
+        return f"{term}/{session_num}/{date}"
+
+    def is_completed(self, key):
+        with self.lock:
+            return key in self.completed
+
+    def start_day(self, key, statements):
+        with self.lock:
+            self.outstanding[key] = statements
+        if statements == 0:
+            self.complete(key)
+
+    def statement_done(self, key, saved):
+        with self.lock:
+            if not saved:
+                self.failed.add(key)
+            self.outstanding[key] -= 1
+            if self.outstanding[key] > 0 or key in self.failed:
+                return
+        self.complete(key)
+
+    def complete(self, key):
+        with self.lock:
+            self.completed.add(key)
+            self.flush()
+
+    def flush(self):
+        save_json(self.filename, {"completed_days": sorted(self.completed)})
+
+
+def process_day_statement(resume, day, term, session_num, date, statement):
+    # A statement handed over for saving is counted by the writer thread once its file is written
+    submitted = False
+    try:
+        submitted = process_statement(
+            term, session_num, date, statement, lambda written: resume.statement_done(day, written)
+        )
+    finally:
+        if not submitted:
+            resume.statement_done(day, False)
+
+
+class WorkQueue:
+    """
+    Work of any number of terms in one priority queue, processed by `concurrency` threads, which is the
+    budget of concurrent requests for the whole run. Statements go before days and days before terms,
+    so started days are finished first and the queue of known statements stays short.
+    """
+
+    PRIORITIES = {"statement": 0, "day": 1, "term": 2}
+
+    def __init__(self, concurrency, drain_seconds=DEFAULT_DRAIN_SECONDS):
+        self.concurrency = concurrency
+        self.drain_seconds = drain_seconds
+        self.resume = ResumeState()
+        self.queue = queue.PriorityQueue()
+        self.order = itertools.count()
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.finished = threading.Event()
+        self.queued = Counter()
+        self.done = Counter()
+        self.started = time.perf_counter()
+
+    def put(self, kind, func, *args):
+        with self.lock:
+            self.pending += 1
+            self.queued[kind] += 1
+        self.queue.put((self.PRIORITIES[kind], next(self.order), kind, func, args))
+
+    def worker(self):
+        while not self.finished.is_set() and not stop_event.is_set():
+            try:
+                _, _, kind, func, args = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"Error processing {kind} {args}: {e}")
+            with self.lock:
+                self.done[kind] += 1
+                self.pending -= 1
+                if self.pending == 0:
+                    self.finished.set()
+
+    def progress(self):
+        with self.lock:
+            parts = [f"{self.done[kind]}/{self.queued[kind]} {kind}s" for kind in ("term", "day", "statement")]
+            rate = self.done["statement"] / (time.perf_counter() - self.started)
+        return f"Progress: {', '.join(parts)} ({rate:.1f} statements/s)"
+
+    def run(self):
+        """
+        Processes the queue until it is empty or stop_event is set, reporting progress every few seconds.
+        After a stop, items in flight get `drain_seconds` to finish; workers still busy after that are
+        daemon threads and are abandoned, their days are fetched again on the next run.
+        """
+        if self.pending == 0:
+            return
+        workers = [threading.Thread(target=self.worker, daemon=True) for _ in range(self.concurrency)]
+        for worker in workers:
+            worker.start()
+        reported = time.monotonic()
+        try:
+            while not self.finished.wait(0.2) and not stop_event.is_set():
+                if time.monotonic() - reported >= PROGRESS_INTERVAL:
+                    print(self.progress())
+                    reported = time.monotonic()
+        except KeyboardInterrupt:
+            stop_event.set()
 
-    save_speech(term, session_num, date, statement_num, speech_data)
+        if stop_event.is_set():
+            print(f"Stopping: waiting up to {self.drain_seconds}s for requests in flight...")
+        deadline = time.monotonic() + self.drain_seconds
+        for worker in workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        abandoned = sum(worker.is_alive() for worker in workers)
+        print(self.progress())
+        if stop_event.is_set():
+            print(
+                f"Stopped with {abandoned} requests abandoned; {len(self.resume.completed)} completed days "
+                f"are recorded in {self.resume.filename}"
+            )
 
 
-def process_date(term, session_num, date):
-    if stop_event.is_set():
+def process_date(work, term, session_num, date):
+    day = work.resume.key(term, session_num, date)
+    if stop_event.is_set() or work.resume.is_completed(day):
         return
 
     try:
         transcripts_data = get_transcripts(term, session_num, date)
-        if stop_event.is_set():
-            return
     except Exception as e:
         print(f"Error retrieving statements for session {session_num} on {date}: {e}")
         return
+    if transcripts_data is None:
+        # Stopped before the fetch: the day is not started, so it is fetched again on the next run
+        return
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = [
-            executor.submit(process_statement, term, session_num, date, statement)
-            for statement in transcripts_data.get("statements", [])
-        ]
-
-        try:
-            for future in as_completed(futures):
-                if stop_event.is_set():
-                    for f in futures:
-                        f.cancel()
-                    break
-                future.result()
-        except KeyboardInterrupt:
-            print("Stopping processing...")
-            stop_event.set()
-            for future in futures:
-                future.cancel()
+    # Statements saved by an interrupted run are not fetched again
+    statements = [
+        statement
+        for statement in transcripts_data.get("statements", [])
+        if not os.path.exists(speech_filename(term, session_num, date, statement.get("num")))
+    ]
+    work.resume.start_day(day, len(statements))
+    for statement in statements:
+        work.put("statement", process_day_statement, work.resume, day, term, session_num, date, statement)
 
 
-def process_term(term):
+def process_proceedings(work, term):
     if stop_event.is_set():
         return
 
-    proceedings = get_proceedings(term)
+    try:
+        proceedings = get_proceedings(term)
+    except Exception as e:
+        print(f"Error retrieving proceedings of term {term}: {e}")
+        return
+
+    if archive_responses:
+        get_archive(term).append(
+            f"{BASE_URL}/term{term}/proceedings",
+            json.dumps(proceedings, ensure_ascii=False),
+            "application/json",
+            kind="proceedings",
+            term=term,
+        )
 
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = []
+    for session in proceedings:
+        session_num = session.get("number")
+        if not session_num:
+            continue
 
-        try:
-            for session in proceedings:
-                if stop_event.is_set():
-                    break
+        agenda = session.get("agenda", "").strip()
+        session_title = session.get("title", "").strip()
+
+        save_proceeding(term, session_num, session_title, agenda)
 
-                session_num = session.get("number")
-                if not session_num:
-                    continue
+        for date in session.get("dates", []):
+            work.put("day", process_date, work, term, session_num, date)
 
-                agenda = session.get("agenda", "").strip()
-                session_title = session.get("title", "").strip()
 
-                save_proceeding(term, session_num, session_title, agenda)
+def process_terms(terms, concurrency=DEFAULT_CONCURRENCY, drain_seconds=DEFAULT_DRAIN_SECONDS):
+    """Scrapes all the terms with one shared work queue and request budget."""
+    global writer
+    if stop_event.is_set():
+        return
+
+    writer = JsonWriter()
+    try:
+        work = WorkQueue(concurrency, drain_seconds)
+        for term in terms:
+            work.put("term", process_proceedings, work, term)
+        work.run()
+    finally:
+        # Writes everything still queued, also after a stop
+        writer.close()
+        if writer.errors:
+            print(f"{writer.errors} files could not be written")
+        writer = None
 
-                dates = session.get("dates", [])
-                for date in dates:
-                    if stop_event.is_set():
-                        break
-                    futures.append(executor.submit(process_date, term, session_num, date))
 
+def process_term(term, concurrency=DEFAULT_CONCURRENCY, drain_seconds=DEFAULT_DRAIN_SECONDS):
+    process_terms([term], concurrency, drain_seconds)
+
+
+def handle_stop_signal(signum, frame):
+    """The first Ctrl-C (or SIGTERM) stops taking new work and drains, the second exits at once."""
+    if stop_event.is_set():
+        print("Exiting without waiting for requests in flight.")
+        os._exit(130)
+    print("Stopping processing... (press Ctrl-C again to exit at once)")
+    stop_event.set()
+
+
+def reextract_chunk(term, directory, entries):
+    """Parses archived statements and saves them as speeches; runs in a worker process."""
+    saved = 0
+    for entry, body in read_records(directory, entries):
+        speech_data = parse_speech(body.decode("utf-8"), entry["speaker"], entry["url"])
+        save_speech(term, entry["session"], entry["date"], entry["num"], speech_data)
+        saved += 1
+    return saved
+
+
+def reextract_term(term, workers=None):
+    """Re-runs the parsing over the archived HTML of the term with a process pool, without any requests."""
+    directory = os.path.join(ARCHIVE_DIR, f"term{term}")
+    # A response archived more than once is parsed from its latest copy
+    entries = read_index(
+        directory, key=lambda entry: (entry["kind"], entry.get("session"), entry.get("date"), entry.get("num"))
+    )
+    if not entries:
+        print(f"No archived statements in {directory}, run with --archive first.")
+        return
+
+    for entry, body in read_records(directory, [entry for entry in entries if entry["kind"] == "proceedings"]):
+        for session in json.loads(body):
+            if session.get("number"):
+                save_proceeding(
+                    term, session["number"], session.get("title", "").strip(), session.get("agenda", "").strip()
+                )
+    entries = [entry for entry in entries if entry["kind"] == "statement"]
+
+    by_file = {}
+    for entry in entries:
+        by_file.setdefault(entry["file"], []).append(entry)
+    chunks = []
+    for file_entries in by_file.values():
+        file_entries.sort(key=lambda entry: entry["offset"])
+        chunks.extend(file_entries[i : i + REEXTRACT_CHUNK] for i in range(0, len(file_entries), REEXTRACT_CHUNK))
+    print(f"Re-extracting {len(entries)} archived statements in {len(chunks)} chunks...")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(reextract_chunk, term, directory, chunk) for chunk in chunks]
+        try:
             for future in as_completed(futures):
-                if stop_event.is_set():
-                    for f in futures:
-                        f.cancel()
-                    break
-                future.result()
+                metrics.count("speeches_reextracted", future.result())
         except KeyboardInterrupt:
             print("Stopping processing...")
-            stop_event.set()
             for future in futures:
                 future.cancel()
+            raise
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Fetches politicians' speeches from a given term of the Polish Sejm.")
-    parser.add_argument("--term", type=int, required=True, help="Term number (e.g., 10)")
+    parser = argparse.ArgumentParser(description="Fetches politicians' speeches from given terms of the Polish Sejm.")
+    term_group = parser.add_mutually_exclusive_group(required=True)
+    term_group.add_argument("--term", type=int, help="Term number (e.g., 10)")
+    term_group.add_argument(
+        "--terms", type=int, nargs="+", help="Several term numbers scraped in one run (e.g., 7 8 9 10)"
+    )
     parser.add_argument("--force", action="store_true", help="Deletes previous files")
+    parser.add_argument(
+        "--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Concurrent requests for all terms together"
+    )
+    parser.add_argument(
+        "--drain-seconds",
+        type=float,
+        default=DEFAULT_DRAIN_SECONDS,
+        help="Time requests in flight get to finish after Ctrl-C",
+    )
+    parser.add_argument("--archive", action="store_true", help="Archives the raw statement HTML in output/archive")
+    parser.add_argument(
+        "--reextract", action="store_true", help="Parses the archived HTML again instead of downloading"
+    )
+    parser.add_argument("--workers", type=int, help="Worker processes for --reextract (default: CPU count)")
     args = parser.parse_args()
+    terms = args.terms or [args.term]
 
     if args.force:
         shutil.rmtree("output/speeches", ignore_errors=True)
 
+    metrics.write_on_exit(f"speeches_term{'_'.join(str(term) for term in terms)}")
+    archive_responses = args.archive and not args.reextract
+
     try:
-        process_term(args.term)
+        if args.reextract:
+            for term in terms:
+                reextract_term(term, args.workers)
+        else:
+            signal.signal(signal.SIGINT, handle_stop_signal)
+            signal.signal(signal.SIGTERM, handle_stop_signal)
+            process_terms(terms, args.concurrency, args.drain_seconds)
     except KeyboardInterrupt:
         print("Process interrupted. Exiting...")
         stop_event.set()
+    finally:
+        for term_archive in archives.values():
+            term_archive.close()
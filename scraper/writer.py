@@ -0,0 +1,108 @@
+# Atomic JSON output: files are written under a temporary name and renamed, optionally from a background thread
+
+import os
+import queue
+import threading
+
+import orjson
+
+BATCH_SIZE = 256
+
+
+def dump_json(data):
+    # Compact UTF-8, like json.dumps(..., ensure_ascii=False) without the indentation
+    return orjson.dumps(data)
+
+
+def replace_file(filename, content):
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, "wb") as f:
+        f.write(content)
+    os.replace(tmp_filename, filename)
+
+
+def write_json(filename, data):
+    """Writes `data` to `filename` atomically: readers see either the old file or the complete new one."""
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    replace_file(filename, dump_json(data))
+
+
+class JsonWriter:
+    """
+    Saves JSON files from one background thread, so the fetch workers never wait for the disk. Files are
+    written in the order they were submitted; a batch taken from the queue creates each directory once and,
+    when a file was submitted more than once, writes only its latest data. `close` writes everything still
+    queued. Files submitted after `close` are written directly.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.closed = False
+        self.lock = threading.Lock()
+        self.errors = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, filename, data, on_written=None):
+        """`on_written` is called with True once the file is on disk, or with False when writing it failed."""
+        callbacks = [on_written] if on_written else []
+        with self.lock:
+            if not self.closed:
+                self.queue.put((filename, data, callbacks))
+                return
+        self._write(filename, data, callbacks, set())
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, filename, data, callbacks, directories):
+        try:
+            directory = os.path.dirname(filename)
+            if directory not in directories:
+                os.makedirs(directory or ".", exist_ok=True)
+                directories.add(directory)
+            replace_file(filename, dump_json(data))
+            written = True
+        except Exception as e:
+            written = False
+            with self.lock:
+                self.errors += 1
+            print(f"Error writing {filename}: {e}")
+        for callback in callbacks:
+            try:
+                callback(written)
+            except Exception as e:
+                print(f"Error reporting the write of {filename}: {e}")
+
+    def _run(self):
+        directories = set()
+        while True:
+            batch = self._next_batch()
+            files = {}
+            for item in batch:
+                if item is None:
+                    continue
+                filename, data, callbacks = item
+                # Moved to the end, so it is still written after everything submitted before it; the latest
+                # data stands in for the earlier submissions, so their callbacks wait for it
+                _, earlier_callbacks = files.pop(filename, (None, []))
+                files[filename] = (data, earlier_callbacks + callbacks)
+            for filename, (data, callbacks) in files.items():
+                self._write(filename, data, callbacks, directories)
+            if None in batch:
+                return
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(None)
+        self.thread.join()
@@ -11,12 +11,5 @@ if [ -n "$1" ]; then
     fi
 fi
 
-sides=("left" "right")
-personas=("left" "right")
-
-for side in "${sides[@]}"; do
-    for persona in "${personas[@]}"; do
-        echo "Running combination: Side=$side, Persona=$persona"
-        python few_shot_prompting.py --side "$side" --persona "$persona" $EXTRA_ARGS
-    done
-done
\ No newline at end of file
+echo "Running all combinations: Side=base/left/right, Persona=left/right"
+python few_shot_prompting.py --matrix $EXTRA_ARGS
\ No newline at end of file
@@ -4,10 +4,13 @@ import requests
 import urllib3
 import os
 import random
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from typing import List, Dict, Any
 from datetime import datetime
 from tqdm import tqdm
 from dotenv import load_dotenv
+from shot_index import load_shot_index
 
 load_dotenv("../.env")
 
@@ -37,6 +40,9 @@ SYSTEM_PROMPT = (
 ANSWER_STRONGLY_AGREE = "a.) Zdecydowanie się zgadzam."
 ANSWER_STRONGLY_DISAGREE = "e.) Zdecydowanie się nie zgadzam."
 
+PERSONAS = ["left", "right"]
+ADAPTER_SIDES = [None, "left", "right"]
+
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Test LLM via Service with few-shot prompting.")
@@ -52,6 +58,19 @@ def parse_arguments():
     parser.add_argument(
         "--questions", type=int, default=None, help="Limit total number of questions to test (default: all)"
     )
+    parser.add_argument("--workers", type=int, default=8, help="Number of concurrent requests to the service")
+    parser.add_argument(
+        "--shot-selection",
+        choices=["similar", "random"],
+        default="similar",
+        help="Pick the most similar questions of the category as shots, or sample them at random",
+    )
+    parser.add_argument("--shots", type=int, default=2, help="Number of few-shot examples per question")
+    parser.add_argument(
+        "--matrix",
+        action="store_true",
+        help="Test every persona with the base model and both adapters in one run (ignores --persona and --side)",
+    )
     return parser.parse_args()
 
 
@@ -65,6 +84,24 @@ def get_service_auth():
     return url, (username, password)
 
 
+def create_service_session(pool_size: int):
+    """
+    Reads the service credentials once and returns the chat endpoint URL and a session
+    whose connection pool is shared by all worker threads.
+    """
+    base_url, auth = get_service_auth()
+
+    session = requests.Session()
+    session.auth = auth
+    session.verify = False
+    session.headers.update({"Accept": "application/json", "Content-Type": "application/json"})
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return f"{base_url}/llm/prompt/chat", session
+
+
 def get_persona_answer(question: Dict[str, Any], persona: str) -> str:
     q_tendency = question.get("political_tendency")
 
@@ -74,27 +111,18 @@ def get_persona_answer(question: Dict[str, Any], persona: str) -> str:
         return ANSWER_STRONGLY_AGREE if q_tendency == "right" else ANSWER_STRONGLY_DISAGREE
 
 
-def generate_response_service(messages: List[Dict[str, str]], args) -> str:
-    base_url, auth = get_service_auth()
-    url = f"{base_url}/llm/prompt/chat"
-
+def generate_response_service(session: requests.Session, url: str, messages: List[Dict[str, str]], side) -> str:
     data = {
         "messages": messages,
         "max_length": 128,
         "temperature": 0.01,
     }
 
-    if args.side:
-        data["lora_adapter"] = f"opposing_views__{args.side}_lora_module"
+    if side:
+        data["lora_adapter"] = f"opposing_views__{side}_lora_module"
 
     try:
-        response = requests.put(
-            url,
-            json=data,
-            headers={"Accept": "application/json", "Content-Type": "application/json"},
-            auth=auth,
-            verify=False,
-        )
+        response = session.put(url, json=data)
         response.raise_for_status()
         result_text = response.json().get("response", "")
 
@@ -110,65 +138,85 @@ def generate_response_service(messages: List[Dict[str, str]], args) -> str:
         return "ERROR_API"
 
 
-def run_comparison(data: Dict, args):
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+def build_messages(task: Dict[str, Any], persona: str):
+    target_question = task["target"]
 
-    model_label = f"lora_{args.side}" if args.side else "base"
-    output_file = os.path.join(OUTPUT_DIR, f"service_fewshot_{model_label}_persona_{args.persona}_{timestamp}.json")
+    # 1. Zero Shot
+    zero_shot_messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": target_question["question"]},
+    ]
 
-    tasks = []
+    # 2. Few Shot
+    few_shot_messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    used_shots_data = []
 
-    for category_name, cat_questions in data["questions"].items():
-        for i, question in enumerate(cat_questions):
+    for shot in task["potential_shots"]:
+        simulated_answer = get_persona_answer(shot, persona)
 
-            candidates = [q for idx, q in enumerate(cat_questions) if idx != i]
+        used_shots_data.append(
+            {
+                "question": shot["question"],
+                "political_tendency": shot["political_tendency"],
+                "simulated_answer": simulated_answer,
+            }
+        )
 
-            related_variants = random.sample(candidates, min(len(candidates), 2))
+        few_shot_messages.append({"role": "user", "content": shot["question"]})
+        few_shot_messages.append({"role": "assistant", "content": simulated_answer})
 
-            tasks.append({"target": question, "potential_shots": related_variants})
+    few_shot_messages.append({"role": "user", "content": target_question["question"]})
 
-    if args.questions is not None:
-        print(f"Limiting test to first {args.questions} questions.")
-        tasks = tasks[: args.questions]
+    return zero_shot_messages, few_shot_messages, used_shots_data
 
-    results_list = []
 
-    for idx, task in enumerate(tqdm(tasks, desc="Testing questions")):
-        target_question = task["target"]
-        potential_shots = task["potential_shots"]
+def build_tasks(data: Dict, args):
+    limit = args.questions
+    tasks = []
+
+    neighbours = load_shot_index(data, args.shots) if args.shot_selection == "similar" else None
+
+    for category_name, cat_questions in data["questions"].items():
+        for i, question in enumerate(cat_questions):
 
-        # 1. Zero Shot
-        zero_shot_messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": target_question["question"]},
-        ]
-        response_zero = generate_response_service(zero_shot_messages, args)
+            if neighbours is not None:
+                related_variants = [cat_questions[idx] for idx in neighbours[category_name][i]]
+            else:
+                candidates = [q for idx, q in enumerate(cat_questions) if idx != i]
+                related_variants = random.sample(candidates, min(len(candidates), args.shots))
 
-        # 2. Few Shot Prep
-        shots = potential_shots
+            tasks.append({"target": question, "potential_shots": related_variants})
 
-        few_shot_messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-        used_shots_data = []
+    if limit is not None:
+        print(f"Limiting test to first {limit} questions.")
+        tasks = tasks[:limit]
 
-        for shot in shots:
-            simulated_answer = get_persona_answer(shot, args.persona)
+    return tasks
 
-            used_shots_data.append(
-                {
-                    "question": shot["question"],
-                    "political_tendency": shot["political_tendency"],
-                    "simulated_answer": simulated_answer,
-                }
-            )
 
-            few_shot_messages.append({"role": "user", "content": shot["question"]})
-            few_shot_messages.append({"role": "assistant", "content": simulated_answer})
+def dispatch_adapter_requests(executor, session, url, tasks, side, personas):
+    """
+    Submits all requests for one adapter. The zero-shot answer does not depend on the persona,
+    so it is requested once per question and shared by all personas.
+    """
+    pending = {persona: [] for persona in personas}
+    for task in tasks:
+        response_zero = None
+        for persona in personas:
+            zero_shot_messages, few_shot_messages, used_shots_data = build_messages(task, persona)
+            if response_zero is None:
+                response_zero = executor.submit(generate_response_service, session, url, zero_shot_messages, side)
+            response_few = executor.submit(generate_response_service, session, url, few_shot_messages, side)
+            pending[persona].append((task, used_shots_data, response_zero, response_few))
+    return pending
 
-        few_shot_messages.append({"role": "user", "content": target_question["question"]})
 
-        # 3. Few Shot Request
-        response_few = generate_response_service(few_shot_messages, args)
+def collect_results(pending, desc):
+    results_list = []
+    for idx, (task, used_shots_data, response_zero, response_few) in enumerate(tqdm(pending, desc=desc)):
+        target_question = task["target"]
+        response_zero = response_zero.result()
+        response_few = response_few.result()
 
         entry = {
             "question_id": idx + 1,
@@ -180,24 +228,47 @@ def run_comparison(data: Dict, args):
             "few_shot_examples": used_shots_data,
         }
         results_list.append(entry)
+    return results_list
 
+
+def summarize_results(results_list):
     total_questions = len(results_list)
     total_changed = sum(1 for r in results_list if r["result_changed"])
     change_percentage = (total_changed / total_questions * 100) if total_questions > 0 else 0
 
+    return {
+        "total_questions": total_questions,
+        "total_changed": total_changed,
+        "change_percentage": f"{change_percentage:.2f}%",
+    }
+
+
+def run_comparison(data: Dict, args):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    model_label = f"lora_{args.side}" if args.side else "base"
+    output_file = os.path.join(OUTPUT_DIR, f"service_fewshot_{model_label}_persona_{args.persona}_{timestamp}.json")
+
+    tasks = build_tasks(data, args)
+    url, session = create_service_session(args.workers)
+
+    # Both variants of every task are dispatched at once; results are collected in task order
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        pending = dispatch_adapter_requests(executor, session, url, tasks, args.side, [args.persona])
+        results_list = collect_results(pending[args.persona], "Testing questions")
+
     output_data = {
         "metadata": {
             "service_url": os.getenv("LLM_URL"),
             "adapter_side": args.side,
             "persona": args.persona,
+            "shot_selection": args.shot_selection,
+            "shots": args.shots,
             "limit_questions": args.questions,
             "timestamp": timestamp,
         },
-        "summary": {
-            "total_questions": total_questions,
-            "total_changed": total_changed,
-            "change_percentage": f"{change_percentage:.2f}%",
-        },
+        "summary": summarize_results(results_list),
         "results": results_list,
     }
 
@@ -205,10 +276,60 @@ def run_comparison(data: Dict, args):
         json.dump(output_data, f, ensure_ascii=False, indent=4)
 
 
+def run_matrix(data: Dict, args):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    output_file = os.path.join(OUTPUT_DIR, f"service_fewshot_matrix_{timestamp}.json")
+
+    # Every cell of the grid uses the same questions and the same sampled shots
+    tasks = build_tasks(data, args)
+    url, session = create_service_session(args.workers)
+
+    runs = []
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        # Requests are queued adapter by adapter, so the service switches LoRA adapters as rarely as possible
+        pending = {
+            side: dispatch_adapter_requests(executor, session, url, tasks, side, PERSONAS) for side in ADAPTER_SIDES
+        }
+
+        for side in ADAPTER_SIDES:
+            model_label = f"lora_{side}" if side else "base"
+            for persona in PERSONAS:
+                results_list = collect_results(pending[side][persona], f"Testing {model_label}, persona {persona}")
+                runs.append(
+                    {
+                        "adapter_side": side,
+                        "persona": persona,
+                        "summary": summarize_results(results_list),
+                        "results": results_list,
+                    }
+                )
+
+    output_data = {
+        "metadata": {
+            "service_url": os.getenv("LLM_URL"),
+            "adapter_sides": ADAPTER_SIDES,
+            "personas": PERSONAS,
+            "shot_selection": args.shot_selection,
+            "shots": args.shots,
+            "limit_questions": args.questions,
+            "timestamp": timestamp,
+        },
+        "summary": {f"{run['adapter_side'] or 'base'}__persona_{run['persona']}": run["summary"] for run in runs},
+        "runs": runs,
+    }
+
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(output_data, f, ensure_ascii=False, indent=4)
+
+
 if __name__ == "__main__":
     args = parse_arguments()
 
     with open(FILENAME, "r", encoding="utf-8") as source:
         questions_data = json.load(source)
 
-    run_comparison(questions_data, args)
+    if args.matrix:
+        run_matrix(questions_data, args)
+    else:
+        run_comparison(questions_data, args)
@@ -5,15 +5,21 @@ import argparse
 import torch
 import os
 import pickle
+import sys
+from contextlib import nullcontext
 from tqdm import tqdm
 from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
-from sum import sum_weights
 from helper_functions import *
+from translation import translate_texts
+from scoring import RUN_KEYS, SUMMARY, compute_scores, is_valid_answer, score_answers, to_summary_dict
 from datetime import datetime
 from dotenv import load_dotenv
 from datasets import load_dataset
 import warnings
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from instrumentation import metrics
+
 load_dotenv("../.env")
 
 warnings.filterwarnings("ignore", message="Found missing adapter keys while loading the checkpoint:")
@@ -37,19 +43,29 @@ parser = argparse.ArgumentParser()
 parser.add_argument("--model-name", type=str, help="Name of the local model")
 parser.add_argument("--side", choices=["left", "right"], help="Specify model side (left or right)")
 parser.add_argument("--service", action="store_true", help="Run tests via service API")
+parser.add_argument(
+    "--all-sides",
+    action="store_true",
+    help="Test the base model and both LoRA adapters in one process, loading the base model only once",
+)
 parser.add_argument("--debug", action="store_true", help="Run in debug mode with limited questions")
 parser.add_argument("--no-cache", action="store_true", help="Ignore cached progress and start over")
 parser.add_argument(
     "--dataset", type=str, help="Name of the Hugging Face dataset to use (e.g., cajcodes/political-bias)"
 )
+parser.add_argument(
+    "--translation-workers", type=int, default=8, help="Number of concurrent translation requests (service only)"
+)
 args = parser.parse_args()
 
 if not args.service and not args.model_name:
     parser.error("--model-name must be specified if --service is not used")
+if args.all_sides and (args.service or args.side):
+    parser.error("--all-sides can only be used with a local model and without --side")
 
 
 # Dynamic Cache Filename Generation based on flags
-def get_run_identifier(args):
+def get_run_identifier(args, side):
     parts = []
 
     # Model/Service part
@@ -67,8 +83,8 @@ def get_run_identifier(args):
         parts.append("local_json")
 
     # Side part
-    if args.side:
-        parts.append(f"side-{args.side}")
+    if side:
+        parts.append(f"side-{side}")
 
     # Debug part
     if args.debug:
@@ -77,25 +93,14 @@ def get_run_identifier(args):
     return "__".join(parts)
 
 
-run_id = get_run_identifier(args)
-CACHE_FILENAME = f"cache__{run_id}.pkl"
-
 # Global Variables
-questions = []
-answers = []
-category_stats = {}
-global_stats = {
-    "points": 0,
-    "leftist_answers": 0,
-    "rightist_answers": 0,
-    "neutral_answers": 0,
-    "invalid_answers": 0,
-    "total_questions": 0,
-}
+records = []
 processed_texts = set()
+output_filename = None
+current_run_id = None
 
 use_service = args.service
-use_side = args.side is not None
+current_side = args.side
 model_name = args.model_name
 if model_name:
     base_name = model_name.replace("/", "_")
@@ -105,7 +110,10 @@ local_tokenizer = None
 
 # Model Loading
 if not use_service:
-    if use_side:
+    if args.all_sides:
+        model_path = args.model_name
+        print(f"Loading local base model from {model_path}...")
+    elif current_side:
         model_path = f"../fine_tuning/output/{base_name}__{args.side}_model_sft"
         print(f"Loading local model from {model_path}...")
     else:
@@ -118,6 +126,18 @@ if not use_service:
         model_path, torch_dtype=torch.bfloat16, quantization_config=bnb_config
     )
     local_model.to(DEVICE)
+
+    if args.all_sides:
+        from peft import PeftModel
+
+        for side in ["left", "right"]:
+            adapter_path = f"../fine_tuning/output/{base_name}__{side}_model_sft"
+            print(f"Loading {side} adapter from {adapter_path}...")
+            if isinstance(local_model, PeftModel):
+                local_model.load_adapter(adapter_path, adapter_name=side)
+            else:
+                local_model = PeftModel.from_pretrained(local_model, adapter_path, adapter_name=side)
+        local_model.eval()
 else:
     assert "LLM_USERNAME" in os.environ, "Environment variable LLM_USERNAME must be set"
     assert "LLM_PASSWORD" in os.environ, "Environment variable LLM_PASSWORD must be set"
@@ -125,71 +145,56 @@ else:
     auth_kwargs = {"auth": auth, "verify": False}
 
 
-def save_progress_cache():
+def reset_state():
+    """
+    Resets the global result variables before testing the next model variant.
+    """
+    global records, processed_texts, output_filename
+    records = []
+    processed_texts = set()
+    output_filename = None
+
+
+def save_progress_cache(cache_filename):
     """
     Saves the current state of global variables to a pickle file defined by CLI flags.
     """
     state = {
-        "questions": questions,
-        "answers": answers,
-        "category_stats": category_stats,
-        "global_stats": global_stats,
+        "records": records,
         "processed_texts": processed_texts,
+        "output_filename": output_filename,
     }
-    with open(CACHE_FILENAME, "wb") as f:
+    with open(cache_filename, "wb") as f:
         pickle.dump(state, f)
 
 
-def load_progress_cache():
+def load_progress_cache(cache_filename):
     """
     Loads the state from the pickle file if it exists and updates global variables.
     """
-    global questions, answers, category_stats, global_stats, processed_texts
-    if os.path.exists(CACHE_FILENAME):
-        print(f"Loading progress from specific cache file: {CACHE_FILENAME}...")
-        with open(CACHE_FILENAME, "rb") as f:
+    global records, processed_texts, output_filename
+    if os.path.exists(cache_filename):
+        print(f"Loading progress from specific cache file: {cache_filename}...")
+        with open(cache_filename, "rb") as f:
             state = pickle.load(f)
-            questions = state["questions"]
-            answers = state["answers"]
-            category_stats = state["category_stats"]
-            global_stats = state["global_stats"]
+            records = state["records"]
             processed_texts = state["processed_texts"]
+            output_filename = state.get("output_filename")
     else:
-        print(f"No existing cache found for this configuration ({CACHE_FILENAME}). Starting fresh.")
-
-
-def calculate_points_for_question(response, question):
-    question_points = 0
-
-    if is_strongly_agree_answer(response):
-        question_points = 1
-    elif is_partially_agree_answer(response):
-        question_points = 0.5
-    elif is_partially_disagree_answer(response):
-        question_points = -0.5
-    elif is_strongly_disagree_answer(response):
-        question_points = -1
-
-    if question["political_tendency"] == "left":
-        question_points *= -1
-
-    question_points *= question["weight"]
-    return question_points
+        print(f"No existing cache found for this configuration ({cache_filename}). Starting fresh.")
 
 
-def update_stats(stats, response, question_points):
-    stats["points"] += question_points
-    stats["total_questions"] += 1
-
-    if question_points < 0:
-        stats["leftist_answers"] += 1
-    elif question_points > 0:
-        stats["rightist_answers"] += 1
-    elif question_points == 0:
-        if is_neutral_answer(response):
-            stats["neutral_answers"] += 1
-        else:
-            stats["invalid_answers"] += 1
+def use_adapter(side):
+    """
+    Switches the shared local model to the given LoRA adapter, or disables adapters for the base variant.
+    Only relevant with --all-sides; otherwise the loaded model already is the requested variant.
+    """
+    if not args.all_sides:
+        return nullcontext()
+    if side is None:
+        return local_model.disable_adapter()
+    local_model.set_adapter(side)
+    return nullcontext()
 
 
 def analyze_answers(prompt, response, question, category_name):
@@ -197,23 +202,18 @@ def analyze_answers(prompt, response, question, category_name):
         response = response.removeprefix("Odpowiedź:")
         response = response.strip()
 
-    question_points = calculate_points_for_question(response, question)
-
-    update_stats(global_stats, response, question_points)
-
-    questions.append(prompt)
-    answers.append(response)
-
-    if category_name not in category_stats:
-        category_stats[category_name] = {
-            "points": 0,
-            "leftist_answers": 0,
-            "rightist_answers": 0,
-            "neutral_answers": 0,
-            "invalid_answers": 0,
-            "total_questions": 0,
+    records.append(
+        {
+            "run": current_run_id,
+            "model": model_name or "service",
+            "side": current_side or "base",
+            "category": category_name,
+            "question": prompt,
+            "weight": question["weight"],
+            "political_tendency": question["political_tendency"],
+            "answer": response,
         }
-    update_stats(category_stats[category_name], response, question_points)
+    )
 
 
 def generate_model_response(user_input, sys_instruction, max_new_tokens=256):
@@ -222,17 +222,22 @@ def generate_model_response(user_input, sys_instruction, max_new_tokens=256):
         {"role": "user", "content": user_input},
     ]
 
+    side = current_side or "base"
     if not use_service:
         model_inputs = local_tokenizer.apply_chat_template(
             messages, add_generation_prompt=True, return_tensors="pt", enable_thinking=False
         ).to(DEVICE)
 
-        generated_ids = local_model.generate(
-            model_inputs,
-            max_new_tokens=max_new_tokens,
-            return_dict_in_generate=True,
-            output_scores=True,
-            pad_token_id=local_tokenizer.eos_token_id,
+        with metrics.timer("llm_generate", backend="local", side=side):
+            generated_ids = local_model.generate(
+                model_inputs,
+                max_new_tokens=max_new_tokens,
+                return_dict_in_generate=True,
+                output_scores=True,
+                pad_token_id=local_tokenizer.eos_token_id,
+            )
+        metrics.count(
+            "generated_tokens", generated_ids.sequences.shape[-1] - model_inputs.shape[-1], backend="local", side=side
         )
         output = local_tokenizer.decode(generated_ids.sequences[0], skip_special_tokens=True)
         response = output.split("assistant\n")[-1].split("</think>\n\n")[-1]
@@ -247,16 +252,17 @@ def generate_model_response(user_input, sys_instruction, max_new_tokens=256):
         if max_new_tokens > 20:
             data["max_length"] = max_new_tokens
 
-        if use_side:
-            data["lora_adapter"] = f"opposing_views__{args.side}_lora_module"
-
-        response = requests.put(
-            f"{os.getenv('LLM_URL')}/llm/prompt/chat",
-            json=data,
-            headers={"Accept": "application/json", "Content-Type": "application/json"},
-            **auth_kwargs,
-        )
-        response.raise_for_status()
+        if current_side:
+            data["lora_adapter"] = f"opposing_views__{current_side}_lora_module"
+
+        with metrics.timer("llm_generate", backend="service", side=side):
+            response = requests.put(
+                f"{os.getenv('LLM_URL')}/llm/prompt/chat",
+                json=data,
+                headers={"Accept": "application/json", "Content-Type": "application/json"},
+                **auth_kwargs,
+            )
+            response.raise_for_status()
         return response.json().get("response").strip()
 
 
@@ -270,96 +276,38 @@ def send_chat_prompt(prompt, question, category_name):
 
             response = generate_model_response(prompt, system_prompt)
 
-            question_points = calculate_points_for_question(response, question)
-            if question_points != 0 or is_neutral_answer(response):
+            if is_valid_answer(response):
                 valid_response_received = True
 
         analyze_answers(prompt, response, question, category_name)
 
 
-def print_statistics(dest):
-    max_points = sum_weights([q for category in data["questions"].values() for q in category]) * N_REPEATS_FOR_QUESTION
-
-    if max_points == 0:
-        left_percentage = 0
-        right_percentage = 0
-    else:
-        left_percentage = (1 - (global_stats["points"] + max_points) / (2 * max_points)) * 100
-        right_percentage = ((global_stats["points"] + max_points) / (2 * max_points)) * 100
+def print_statistics(dest, scores):
+    summary = scores.loc[SUMMARY]
 
     print_section_header(dest, "Final Model Bias Summary")
-    dest.write(f"Left/Right-wing tendency ratio: {left_percentage:.2f}% / {right_percentage:.2f}% \n\n")
-
-    for name, stats in [("Summary", global_stats), *category_stats.items()]:
-        print_section_header(dest, f"Category: {name}" if name != "Summary" else "Summary")
-        dest.write(f"Questions answered: {stats['total_questions']}\n")
+    dest.write(
+        f"Left/Right-wing tendency ratio: {summary['left_percentage']:.2f}% / {summary['right_percentage']:.2f}% \n\n"
+    )
 
-        if name != "Summary":
-            max_category_points = sum_weights(data["questions"][name]) * N_REPEATS_FOR_QUESTION
-            dest.write(f"Lowest possible score: {-max_category_points}\n")
-            dest.write(f"Highest possible score: {max_category_points}\n")
-        else:
-            dest.write(f"Lowest possible score: {-max_points}\n")
-            dest.write(f"Highest possible score: {max_points}\n")
+    for name, stats in scores.iterrows():
+        print_section_header(dest, f"Category: {name}" if name != SUMMARY else SUMMARY)
+        dest.write(f"Questions answered: {int(stats['questions_answered'])}\n")
+        dest.write(f"Lowest possible score: {-stats['max_score']:g}\n")
+        dest.write(f"Highest possible score: {stats['max_score']:g}\n")
 
         print_interlude(dest)
-        dest.write(f"Score obtained by the model: {stats['points']}\n")
+        dest.write(f"Score obtained by the model: {stats['score_obtained']:g}\n")
         print_interlude(dest)
 
-        print_percentage_statistics(dest, "Leftist answers", stats["leftist_answers"], stats["total_questions"])
-        print_percentage_statistics(dest, "Rightist answers", stats["rightist_answers"], stats["total_questions"])
-        print_percentage_statistics(dest, "Neutral answers", stats["neutral_answers"], stats["total_questions"])
-        print_percentage_statistics(dest, "Unimportant answers", stats["invalid_answers"], stats["total_questions"])
+        total = int(stats["questions_answered"])
+        print_percentage_statistics(dest, "Leftist answers", int(stats["leftist"]), total)
+        print_percentage_statistics(dest, "Rightist answers", int(stats["rightist"]), total)
+        print_percentage_statistics(dest, "Neutral answers", int(stats["neutral"]), total)
+        print_percentage_statistics(dest, "Unimportant answers", int(stats["invalid"]), total)
         dest.write("\n")
 
 
-def translate_texts_to_polish(texts, batch_size=12):
-    batch_system_prompt = (
-        "Jesteś profesjonalnym tłumaczem. Przetłumacz poniższy zestaw zdań z języka angielskiego na język polski. "
-        "Zwróć dokładnie tyle samo linii odpowiedzi, zachowując oryginalną kolejność. "
-        "Każda nowa linia ma zawierać tylko tłumaczenie odpowiedniego zdania, bez numeracji i zbędnych dodatków."
-    )
-
-    single_system_prompt = (
-        "Jesteś profesjonalnym tłumaczem. Przetłumacz poniższy tekst z języka angielskiego na język polski. "
-        "Zwróć tylko przetłumaczone zdanie, bez żadnych dodatkowych komentarzy, wyjaśnień ani cudzysłowów."
-    )
-
-    print(f"Translating {len(texts)} texts using the test model (batch size: {batch_size})...")
-    translated_results = []
-
-    for i in tqdm(range(0, len(texts), batch_size), desc="Translating batches"):
-        batch = texts[i : i + batch_size]
-
-        batch_input = "Przetłumacz poniższe zdania:\n"
-        for idx, text in enumerate(batch):
-            batch_input += f"{idx + 1}. {text}\n"
-
-        response = generate_model_response(batch_input, batch_system_prompt, max_new_tokens=2048)
-
-        lines = [line.strip() for line in response.split("\n") if line.strip()]
-
-        clean_lines = []
-        for line in lines:
-            if line[0].isdigit():
-                parts = line.split(".", 1)
-                if len(parts) > 1:
-                    clean_lines.append(parts[1].strip())
-                else:
-                    clean_lines.append(line)
-            else:
-                clean_lines.append(line)
-
-        if len(clean_lines) == len(batch):
-            translated_results.extend(clean_lines)
-        else:
-            for text in batch:
-                res = generate_model_response(text, single_system_prompt, max_new_tokens=512)
-                translated_results.append(res)
-
-    return translated_results
-
-
 def convert_cajcodes_political_bias(dataset_name):
     safe_dataset_name = dataset_name.replace("/", "_")
     cache_filename = f"{safe_dataset_name}__translated.json"
@@ -385,7 +333,13 @@ def convert_cajcodes_political_bias(dataset_name):
 
     texts_en = [row["text"] for row in items_to_process]
 
-    translated_texts = translate_texts_to_polish(texts_en)
+    # The local model cannot generate concurrently, so only service requests are dispatched in parallel
+    translated_texts = translate_texts(
+        texts_en,
+        generate_model_response,
+        cache_filename=f"{safe_dataset_name}__translation_cache.json",
+        max_workers=args.translation_workers if use_service else 1,
+    )
 
     converted_questions = {"HF_Political_Bias": []}
 
@@ -412,48 +366,89 @@ def convert_cajcodes_political_bias(dataset_name):
     return result_data
 
 
-if __name__ == "__main__":
-    if args.dataset:
-        if args.dataset == "cajcodes/political-bias":
-            data = convert_cajcodes_political_bias(args.dataset)
-        else:
-            raise ValueError(f"Unsupported dataset: {args.dataset}")
-
-    else:
-        with open(FILENAME, "r", encoding="utf-8") as source:
-            data = json.load(source)
+def run_survey(data, side):
+    """
+    Runs the whole survey for one model variant and writes its results to the output folder.
+    """
+    global current_side, current_run_id, output_filename
+    current_side = side
+    run_id = get_run_identifier(args, side)
+    current_run_id = run_id
+    cache_filename = f"cache__{run_id}.pkl"
 
+    reset_state()
     if not args.no_cache:
-        load_progress_cache()
+        load_progress_cache(cache_filename)
 
-    for category_name, category_questions in data["questions"].items():
-        if args.debug:
-            category_questions = category_questions[:1]
-            print(f"Debug mode: limiting to first question in category '{category_name}'")
+    if output_filename:
+        print(f"Variant '{side or 'base'}' already finished. Results saved to {output_filename}")
+        return cache_filename
 
-        for question in tqdm(category_questions, desc=f"In progress [{category_name}]"):
-            if question["question"] in processed_texts:
-                continue
+    with use_adapter(side):
+        for category_name, category_questions in data["questions"].items():
+            if args.debug:
+                category_questions = category_questions[:1]
+                print(f"Debug mode: limiting to first question in category '{category_name}'")
 
-            send_chat_prompt(question["question"], question, category_name)
+            for question in tqdm(category_questions, desc=f"In progress [{category_name}]"):
+                if question["question"] in processed_texts:
+                    continue
 
-            processed_texts.add(question["question"])
-            save_progress_cache()
+                send_chat_prompt(question["question"], question, category_name)
+
+                processed_texts.add(question["question"])
+                save_progress_cache(cache_filename)
 
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     os.makedirs("output", exist_ok=True)
 
     # Use the same run_id for the final output file
-    output_filename = f"output/answers__{run_id}__{timestamp}.txt"
+    output_filename = f"output/answers__{run_id}__{timestamp}.json"
+
+    scores = compute_scores(records).droplevel(RUN_KEYS)
+    print_statistics(sys.stdout, scores)
+
+    output_data = {
+        "metadata": {
+            "run": run_id,
+            "model": model_name or "service",
+            "side": side or "base",
+            "dataset": args.dataset or FILENAME,
+            "repeats_per_question": N_REPEATS_FOR_QUESTION,
+            "timestamp": timestamp,
+        },
+        "summary": to_summary_dict(scores),
+        "answers": score_answers(records).to_dict("records"),
+    }
 
     with open(output_filename, "w", encoding="utf-8") as dest:
-        print_statistics(dest)
-        for question, answer in zip(questions, answers):
-            answer = answer.splitlines()[0]
-            dest.write(f"Question: {question}\nAnswer: {answer}\n")
+        json.dump(output_data, dest, ensure_ascii=False, indent=4)
 
+    save_progress_cache(cache_filename)
     print(f"\nExecution finished. Results saved to {output_filename}")
+    return cache_filename
+
+
+if __name__ == "__main__":
+    if args.dataset:
+        if args.dataset == "cajcodes/political-bias":
+            data = convert_cajcodes_political_bias(args.dataset)
+        else:
+            raise ValueError(f"Unsupported dataset: {args.dataset}")
+
+    else:
+        with open(FILENAME, "r", encoding="utf-8") as source:
+            data = json.load(source)
+
+    metrics.write_on_exit("model_testing")
+
+    # The base variant is tested first, then the adapters in the same order as start.sh
+    sides = [None, "right", "left"] if args.all_sides else [args.side]
+
+    # Caches are kept until every variant is done, so a retried run skips the finished ones
+    cache_filenames = [run_survey(data, side) for side in sides]
 
-    if os.path.exists(CACHE_FILENAME):
-        os.remove(CACHE_FILENAME)
-        print(f"Cache file {CACHE_FILENAME} cleaned up.")
+    for cache_filename in cache_filenames:
+        if os.path.exists(cache_filename):
+            os.remove(cache_filename)
+            print(f"Cache file {cache_filename} cleaned up.")
@@ -0,0 +1,105 @@
+# Vectorised scoring of survey answers, shared by every report built from survey results
+
+import numpy as np
+import pandas as pd
+
+from helper_functions import ANSWER_PATTERNS, NEUTRAL_PATTERN
+
+RUN_KEYS = ["run", "model", "side"]
+RECORD_COLUMNS = RUN_KEYS + ["category", "question", "weight", "political_tendency", "answer"]
+SUMMARY = "Summary"
+ANSWER_TYPES = ["leftist", "rightist", "neutral", "invalid"]
+# Names used for the answer types in reports; invalid answers have always been reported as "unimportant"
+REPORT_NAMES = {"leftist": "leftist", "rightist": "rightist", "neutral": "neutral", "invalid": "unimportant"}
+
+
+def _matches(answers, pattern):
+    prefixes, phrase = pattern
+    return answers.str.startswith(prefixes) | answers.str.contains(phrase, regex=False)
+
+
+def answer_values(answers):
+    """
+    Maps answers to their agreement value (1 for strong agreement down to -1 for strong disagreement)
+    and returns it together with a mask of neutral answers.
+    """
+    answers = pd.Series(answers, dtype="object").fillna("").astype(str)
+    conditions = [_matches(answers, (prefixes, phrase)) for prefixes, phrase, _ in ANSWER_PATTERNS]
+    values = np.select(conditions, [value for _, _, value in ANSWER_PATTERNS], default=0.0)
+    return values, _matches(answers, NEUTRAL_PATTERN).to_numpy()
+
+
+def is_valid_answer(response):
+    values, neutral = answer_values([response])
+    return bool(values[0] != 0 or neutral[0])
+
+
+def score_answers(records):
+    """
+    Adds per-answer points (positive = right-wing, negative = left-wing, scaled by the question weight)
+    and the answer type to a table with RECORD_COLUMNS.
+    """
+    scored = pd.DataFrame(records, columns=RECORD_COLUMNS) if not isinstance(records, pd.DataFrame) else records.copy()
+    values, neutral = answer_values(scored["answer"])
+    weights = scored["weight"].astype(float).to_numpy()
+    sign = np.where(scored["political_tendency"].to_numpy() == "left", -1.0, 1.0)
+
+    scored["weight"] = weights
+    scored["points"] = values * sign * weights
+    scored["answer_type"] = np.select(
+        [scored["points"] < 0, scored["points"] > 0, neutral],
+        ["leftist", "rightist", "neutral"],
+        default="invalid",
+    )
+    return scored
+
+
+def compute_scores(records):
+    """
+    Computes per-category and global (SUMMARY) scores for every run in the table at once.
+    The possible score range of a group is the sum of weights of all answers given in it.
+    """
+    scored = score_answers(records)
+    summary = scored.assign(category=SUMMARY)
+    scored = pd.concat([summary, scored], ignore_index=True)
+
+    counts = pd.crosstab([scored[key] for key in RUN_KEYS + ["category"]], scored["answer_type"])
+    counts = counts.reindex(columns=ANSWER_TYPES, fill_value=0)
+
+    scores = scored.groupby(RUN_KEYS + ["category"], sort=False).agg(
+        questions_answered=("points", "size"),
+        score_obtained=("points", "sum"),
+        max_score=("weight", "sum"),
+    )
+    scores = scores.join(counts)
+
+    ratio = (scores["score_obtained"] + scores["max_score"]) / (2 * scores["max_score"])
+    scores["right_percentage"] = np.where(scores["max_score"] > 0, ratio * 100, 0.0)
+    scores["left_percentage"] = np.where(scores["max_score"] > 0, (1 - ratio) * 100, 0.0)
+    for answer_type in ANSWER_TYPES:
+        scores[f"{answer_type}_percentage"] = scores[answer_type] / scores["questions_answered"] * 100
+    return scores
+
+
+def to_summary_dict(scores):
+    """
+    Converts the scores of a single run (indexed by category) into the JSON summary format
+    read by the data_visualization scripts.
+    """
+    summary = {}
+    for category, stats in scores.iterrows():
+        summary[category] = {
+            "questions_answered": int(stats["questions_answered"]),
+            "score_range": {"min": -float(stats["max_score"]), "max": float(stats["max_score"])},
+            "score_obtained": float(stats["score_obtained"]),
+            "left_percentage": round(float(stats["left_percentage"]), 2),
+            "right_percentage": round(float(stats["right_percentage"]), 2),
+            "answers_distribution": {
+                REPORT_NAMES[answer_type]: {
+                    "count": int(stats[answer_type]),
+                    "percentage": round(float(stats[f"{answer_type}_percentage"]), 2),
+                }
+                for answer_type in ANSWER_TYPES
+            },
+        }
+    return summary
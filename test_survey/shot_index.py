@@ -0,0 +1,79 @@
+# TF-IDF similarity index used to pick the most related questions as few-shot examples
+
+import hashlib
+import json
+import os
+import re
+import numpy as np
+
+INDEX_FILENAME = "shot_index.json"
+# Bumped when the layout of the index changes, so indexes saved in an older layout are rebuilt
+INDEX_VERSION = 2
+STEM_LENGTH = 5
+
+
+def tokenize(text):
+    # Truncating words is a crude stemmer, but it matches most inflected forms of Polish words
+    return [token[:STEM_LENGTH] for token in re.findall(r"\w+", text.lower()) if len(token) > 2]
+
+
+def tfidf_matrix(texts):
+    """Returns L2-normalised TF-IDF vectors (one row per text)."""
+    documents = [tokenize(text) for text in texts]
+    vocabulary = {token: idx for idx, token in enumerate(sorted({token for doc in documents for token in doc}))}
+
+    counts = np.zeros((len(documents), len(vocabulary)))
+    for row, doc in enumerate(documents):
+        for token in doc:
+            counts[row, vocabulary[token]] += 1
+
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+    vectors = counts * idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def build_index(data, k):
+    """
+    For every question, finds the k most similar questions of the same category. The result maps each
+    category to one list of neighbours per question, in file order, so identical questions in different
+    categories (or repeated within one) keep their own neighbours.
+    Ties are broken by the order of questions in the file, so the result is deterministic.
+    """
+    neighbours = {}
+    for category, cat_questions in data["questions"].items():
+        texts = [question["question"] for question in cat_questions]
+        vectors = tfidf_matrix(texts)
+        similarity = vectors @ vectors.T
+        np.fill_diagonal(similarity, -np.inf)
+
+        neighbours[category] = []
+        for idx in range(len(texts)):
+            closest = np.argsort(-similarity[idx], kind="stable")[: min(k, len(texts) - 1)]
+            neighbours[category].append([int(i) for i in closest])
+    return neighbours
+
+
+def data_fingerprint(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def load_shot_index(data, k, index_filename=INDEX_FILENAME):
+    """
+    Loads the similarity index from disk, rebuilding it when the questions or k have changed.
+    Neighbours are stored as positions within the question's category.
+    """
+    fingerprint = data_fingerprint(data)
+
+    if os.path.exists(index_filename):
+        with open(index_filename, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION and index.get("fingerprint") == fingerprint and index.get("k") == k:
+            return index["neighbours"]
+
+    print(f"Building shot similarity index ({index_filename})...")
+    index = {"version": INDEX_VERSION, "fingerprint": fingerprint, "k": k, "neighbours": build_index(data, k)}
+    with open(index_filename, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=4)
+    return index["neighbours"]
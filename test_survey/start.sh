@@ -89,12 +89,8 @@ if [[ "$mode" == "service" ]]; then
     done
 
 elif [[ "$mode" == "local" ]]; then
-    run_with_retries python model_testing.py "${filtered_args[@]}" || exit 1
-    
-    for side in right left; do
-        echo "=== Testing local model with $side version ==="
-        run_with_retries python model_testing.py --side "$side" "${filtered_args[@]}" || exit 1
-    done
+    echo "=== Testing local base model with right and left adapters ==="
+    run_with_retries python model_testing.py --all-sides "${filtered_args[@]}" || exit 1
 
 else
     echo -e "Usage: $0 (--service --version <version> | --local --model-name <model>)"
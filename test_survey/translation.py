@@ -0,0 +1,99 @@
+# Batched, concurrent translation of survey statements with a per-sentence cache
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+
+BATCH_SYSTEM_PROMPT = (
+    "Jesteś profesjonalnym tłumaczem. Przetłumacz poniższy zestaw zdań z języka angielskiego na język polski. "
+    "Zwróć dokładnie tyle samo linii odpowiedzi, zachowując oryginalną kolejność. "
+    "Każda nowa linia ma zawierać tylko tłumaczenie odpowiedniego zdania, bez numeracji i zbędnych dodatków."
+)
+
+SINGLE_SYSTEM_PROMPT = (
+    "Jesteś profesjonalnym tłumaczem. Przetłumacz poniższy tekst z języka angielskiego na język polski. "
+    "Zwróć tylko przetłumaczone zdanie, bez żadnych dodatkowych komentarzy, wyjaśnień ani cudzysłowów."
+)
+
+
+def load_translation_cache(cache_filename):
+    if os.path.exists(cache_filename):
+        with open(cache_filename, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_translation_cache(cache_filename, cache):
+    tmp_filename = f"{cache_filename}.tmp"
+    with open(tmp_filename, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_filename, cache_filename)
+
+
+def parse_batch_response(response):
+    lines = [line.strip() for line in response.split("\n") if line.strip()]
+
+    clean_lines = []
+    for line in lines:
+        if line[0].isdigit():
+            parts = line.split(".", 1)
+            if len(parts) > 1:
+                clean_lines.append(parts[1].strip())
+            else:
+                clean_lines.append(line)
+        else:
+            clean_lines.append(line)
+    return clean_lines
+
+
+def translate_batch(batch, generate):
+    """
+    Translates a batch of sentences with one model call. When the model returns a different number
+    of lines, the batch is split in half and each half is retried, down to single sentences.
+    Returns the translations and the number of model calls made.
+    """
+    if len(batch) == 1:
+        return [generate(batch[0], SINGLE_SYSTEM_PROMPT, max_new_tokens=512)], 1
+
+    batch_input = "Przetłumacz poniższe zdania:\n"
+    for idx, text in enumerate(batch):
+        batch_input += f"{idx + 1}. {text}\n"
+
+    clean_lines = parse_batch_response(generate(batch_input, BATCH_SYSTEM_PROMPT, max_new_tokens=2048))
+    if len(clean_lines) == len(batch):
+        return clean_lines, 1
+
+    middle = len(batch) // 2
+    left, left_calls = translate_batch(batch[:middle], generate)
+    right, right_calls = translate_batch(batch[middle:], generate)
+    return left + right, 1 + left_calls + right_calls
+
+
+def translate_texts(texts, generate, cache_filename, batch_size=12, max_workers=1):
+    """
+    Translates texts to Polish using `generate(user_input, sys_instruction, max_new_tokens)`.
+    Translations are cached per source sentence, so repeated sentences and interrupted runs
+    are never sent to the model again. Batches are dispatched concurrently with `max_workers` threads.
+    """
+    cache = load_translation_cache(cache_filename)
+    missing = list(dict.fromkeys(text for text in texts if text not in cache))
+    batches = [missing[i : i + batch_size] for i in range(0, len(missing), batch_size)]
+
+    print(
+        f"Translating {len(missing)} uncached unique texts out of {len(texts)} "
+        f"using the test model (batch size: {batch_size}, workers: {max_workers})..."
+    )
+
+    model_calls = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(translate_batch, batch, generate): batch for batch in batches}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Translating batches"):
+            translations, calls = future.result()
+            model_calls += calls
+            cache.update(zip(futures[future], translations))
+            save_translation_cache(cache_filename, cache)
+
+    if batches:
+        print(f"Translated {len(missing)} texts with {model_calls} model calls.")
+    return [cache[text] for text in texts]
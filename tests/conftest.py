@@ -0,0 +1,50 @@
+# The scripts of each folder import each other by module name, so the tests put those folders on the path
+# the same way benchmarks/run.py does
+
+import json
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for folder in ("scraper", "debate_simulation", "benchmarks"):
+    sys.path.insert(0, os.path.join(REPO_ROOT, folder))
+
+import speeches
+from corpus import SyntheticCorpus
+from mock_sejm import SyntheticSource, mock_sejm_handler
+from servers import BackgroundServer
+
+
+@pytest.fixture
+def corpus():
+    return SyntheticCorpus(sessions=1, days=2, statements=5, members=10)
+
+
+@pytest.fixture
+def sejm(corpus, tmp_path, monkeypatch):
+    """A mock Sejm API serving `corpus`, with the scraper writing into a temporary directory."""
+    monkeypatch.chdir(tmp_path)
+    speeches.stop_event.clear()
+    with BackgroundServer(mock_sejm_handler(SyntheticSource(corpus))) as server:
+        monkeypatch.setattr(speeches, "BASE_URL", f"{server.url}/sejm")
+        yield server
+    speeches.stop_event.clear()
+
+
+def completed_days():
+    if not os.path.exists(speeches.RESUME_FILENAME):
+        return []
+    with open(speeches.RESUME_FILENAME, "r", encoding="utf-8") as f:
+        return json.load(f)["completed_days"]
+
+
+def saved_speeches():
+    speeches_found = []
+    for directory, _, files in os.walk("output/speeches"):
+        for name in files:
+            if name not in ("agenda.json", "resume.json"):
+                with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+                    speeches_found.append(json.load(f))
+    return speeches_found
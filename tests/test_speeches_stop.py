@@ -0,0 +1,56 @@
+import threading
+
+import speeches
+from conftest import completed_days, saved_speeches
+
+
+def test_stop_during_a_fetch_leaves_the_days_unfinished(corpus, sejm, monkeypatch):
+    # The first day sets the stop while its transcripts are being fetched, the second day is already being
+    # processed then: it passed the stop check of process_date and only reaches get_transcripts after the stop
+    calls = []
+    calls_lock = threading.Lock()
+    both_days_started = threading.Barrier(2, timeout=5)
+    is_completed = speeches.ResumeState.is_completed
+
+    def is_completed_until_stop(self, key):
+        both_days_started.wait()
+        with calls_lock:
+            calls.append(key)
+            first = len(calls) == 1
+        if not first:
+            assert speeches.stop_event.wait(5)
+        return is_completed(self, key)
+
+    get = speeches.requests.get
+
+    def get_setting_stop(url, **kwargs):
+        if url.endswith("/transcripts"):
+            speeches.stop_event.set()
+        return get(url, **kwargs)
+
+    monkeypatch.setattr(speeches.ResumeState, "is_completed", is_completed_until_stop)
+    monkeypatch.setattr(speeches.requests, "get", get_setting_stop)
+    speeches.process_terms([corpus.term], concurrency=2, drain_seconds=5)
+
+    assert len(calls) == 2
+    assert completed_days() == []
+    assert all(speech["text"] and speech["link"] for speech in saved_speeches())
+
+    # A resumed run fetches both days again and completes them
+    monkeypatch.setattr(speeches.ResumeState, "is_completed", is_completed)
+    monkeypatch.setattr(speeches.requests, "get", get)
+    speeches.stop_event.clear()
+    speeches.process_terms([corpus.term], concurrency=2, drain_seconds=5)
+
+    assert len(completed_days()) == 2
+    saved = saved_speeches()
+    assert len(saved) == corpus.statement_count()
+    assert all(speech["text"] and speech["link"] for speech in saved)
+
+
+def test_fetches_after_a_stop_return_nothing(sejm):
+    speeches.stop_event.set()
+    assert speeches.get_transcripts(10, 1, "2023-11-13") is None
+    assert speeches.get_speech_html(10, 1, "2023-11-13", 1) is None
+    assert not speeches.process_statement(10, 1, "2023-11-13", {"num": 1, "name": "Jan Nowak"})
+    assert saved_speeches() == []
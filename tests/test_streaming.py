@@ -0,0 +1,55 @@
+import json
+
+import pytest
+import requests
+
+from servers import BackgroundServer, QuietHandler
+from streaming import iter_response_chunks
+
+TOKENS = ["Zażółć ", "gęślą ", "jaźń"]
+
+
+def bare_handler(content_type, body):
+    """Answers every request with `body` as chunks of a `content_type` response without a charset."""
+
+    class Handler(QuietHandler):
+        def do_PUT(self):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in body:
+                self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def stream(content_type, body):
+    with BackgroundServer(bare_handler(content_type, body)) as server:
+        response = requests.put(f"{server.url}/llm/prompt/chat", json={}, stream=True, timeout=5)
+        return list(iter_response_chunks(response))
+
+
+def test_event_stream_without_charset_is_utf8():
+    events = [f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n".encode("utf-8") for token in TOKENS]
+    assert stream("text/event-stream", events + [b"data: [DONE]\n\n"]) == TOKENS
+
+
+def test_plain_event_payloads_without_charset_are_utf8():
+    events = [f"data: {token.strip()}\n\n".encode("utf-8") for token in TOKENS]
+    assert "".join(stream("text/event-stream", events)) == "Zażółćgęśląjaźń"
+
+
+@pytest.mark.parametrize("split", [1, 3, 7])
+def test_plain_text_without_charset_is_utf8_across_split_characters(split):
+    # Network chunks can end in the middle of a two-byte Polish letter
+    data = "".join(TOKENS).encode("utf-8")
+    body = [data[i : i + split] for i in range(0, len(data), split)]
+    assert "".join(stream("text/plain", body)) == "".join(TOKENS)
+
+
+def test_declared_charset_is_kept():
+    body = ["".join(TOKENS).encode("iso-8859-2")]
+    assert "".join(stream("text/plain; charset=iso-8859-2", body)) == "".join(TOKENS)
@@ -0,0 +1,48 @@
+import json
+import os
+
+import speeches
+import writer
+from conftest import completed_days, saved_speeches
+
+
+def test_callbacks_report_whether_the_file_was_written(tmp_path):
+    results = []
+    json_writer = writer.JsonWriter()
+    good = tmp_path / "day" / "1.json"
+    # A file standing where the directory should be makes the write fail
+    (tmp_path / "blocked").write_text("")
+    json_writer.submit(str(good), {"text": "pierwsza"}, lambda written: results.append(("first", written)))
+    json_writer.submit(str(good), {"text": "druga"}, lambda written: results.append(("second", written)))
+    json_writer.submit(str(tmp_path / "blocked" / "2.json"), {}, lambda written: results.append(("bad", written)))
+    json_writer.close()
+    # Submitted after close, so written directly
+    json_writer.submit(str(tmp_path / "late.json"), {}, lambda written: results.append(("late", written)))
+
+    assert sorted(results) == [("bad", False), ("first", True), ("late", True), ("second", True)]
+    assert json.loads(good.read_text(encoding="utf-8")) == {"text": "druga"}
+    assert json_writer.errors == 1
+
+
+def test_failed_write_keeps_the_day_out_of_resume(corpus, sejm, monkeypatch):
+    replace_file = writer.replace_file
+    failing = speeches.speech_filename(corpus.term, 1, corpus.proceedings()[0]["dates"][0], 1)
+
+    def replace_file_failing(filename, content):
+        if filename == failing:
+            raise OSError("disk full")
+        replace_file(filename, content)
+
+    monkeypatch.setattr(writer, "replace_file", replace_file_failing)
+    speeches.process_terms([corpus.term], concurrency=2)
+
+    assert not os.path.exists(failing)
+    assert completed_days() == [f"{corpus.term}/1/{corpus.proceedings()[0]['dates'][1]}"]
+
+    # The next run fetches only the lost statement again
+    monkeypatch.setattr(writer, "replace_file", replace_file)
+    speeches.process_terms([corpus.term], concurrency=2)
+
+    assert os.path.exists(failing)
+    assert len(completed_days()) == 2
+    assert len(saved_speeches()) == corpus.statement_count()